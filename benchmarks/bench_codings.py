@@ -0,0 +1,87 @@
+"""Memory per instance with shared (interned) codings against fresh ones.
+
+    python -m benchmarks.bench_codings --instances 20000
+"""
+import argparse
+import contextlib
+import gc
+import json
+import tracemalloc
+
+from dicom2fhir import dicom2fhir
+from dicom2fhir import dicom2fhirutils
+
+# the model backend's FrozenCodings; the dict backend builds new
+# fragments for every study
+SHARED = ("_shared_coding", "_shared_codeable_concept")
+
+
+@contextlib.contextmanager
+def unshared():
+    # bypasses the LRU caches, every call builds a new coding as before
+    saved = {name: getattr(dicom2fhirutils, name) for name in SHARED}
+    try:
+        for name, cache in saved.items():
+            setattr(dicom2fhirutils, name, cache.__wrapped__)
+        yield
+    finally:
+        for name, cache in saved.items():
+            setattr(dicom2fhirutils, name, cache)
+
+
+def headers(n, n_series):
+    for i in range(n):
+        series = i % n_series
+        yield {
+            "StudyInstanceUID": "1.2.3",
+            "AccessionNumber": "ACC0001",
+            "PatientID": "PAT000001",
+            "SeriesInstanceUID": "1.2.3.%d" % series,
+            "SeriesNumber": series + 1,
+            "Modality": "CT",
+            "BodyPartExamined": "CHEST",
+            "SOPInstanceUID": "1.2.3.%d.%d" % (series, i),
+            "SOPClassUID": "1.2.840.10008.5.1.4.1.1.2",
+            "InstanceNumber": i + 1,
+            "ImageType": ["ORIGINAL", "PRIMARY", "AXIAL"],
+        }
+
+
+def measure(backend, n, n_series):
+    create_study, add_series = dicom2fhir._get_backend(backend)
+    records = list(headers(n, n_series))
+    dicom2fhirutils.clear_coding_cache()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        study, index = create_study(records[0], None, None)
+        for ds in records[1:]:
+            add_series(study, ds, None, index)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"bytes_per_instance": current / n, "peak_bytes_per_instance": peak / n}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--instances", type=int, default=20000)
+    parser.add_argument("--series", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    result = {}
+    for backend in ("model",):
+        with unshared():
+            fresh = measure(backend, args.instances, args.series)
+        shared = measure(backend, args.instances, args.series)
+        result[backend] = {
+            "fresh": fresh,
+            "shared": shared,
+            "saved_bytes_per_instance":
+                fresh["bytes_per_instance"] - shared["bytes_per_instance"],
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compare the strptime based started-datetime conversion with datetimes.
+
+    python -m benchmarks.bench_datetimes --values 100000 --distinct 20
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from dicom2fhir import datetimes
+
+
+def legacy_started(dt, tm):
+    # gen_started_datetime before datetimes.py, two strptime calls and no
+    # fractional seconds; with a fixed zone, the original passed a string
+    dt_pattern = '%Y%m%d'
+    if tm is not None and len(tm) >= 6:
+        studytm = datetime.strptime(tm[0:6], '%H%M%S')
+        dt_string = dt + " " + str(studytm.hour) + ":" + \
+            str(studytm.minute) + ":" + str(studytm.second)
+        dt_pattern = dt_pattern + " %H:%M:%S"
+    else:
+        dt_string = dt
+    return datetime.strptime(dt_string, dt_pattern).replace(
+        tzinfo=datetimes.DEFAULT_TIMEZONE)
+
+
+def values(n, distinct):
+    pairs = [("202001%02d" % (i % 28 + 1), "10%02d%02d.%06d" % (i % 60, (i * 7) % 60, i))
+             for i in range(distinct)]
+    return [pairs[i % distinct] for i in range(n)]
+
+
+def run(pairs, convert):
+    start = time.perf_counter()
+    for dt, tm in pairs:
+        convert(dt, tm)
+    return len(pairs) / (time.perf_counter() - start)
+
+
+def uncached(dt, tm):
+    return datetime.combine(
+        datetimes.parse_da.__wrapped__(dt), datetimes.parse_tm.__wrapped__(tm),
+        datetimes.DEFAULT_TIMEZONE)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--values", type=int, default=100000)
+    parser.add_argument("--distinct", type=int, default=20,
+                        help="distinct date/time pairs, like the series of a study")
+    args = parser.parse_args(argv)
+
+    pairs = values(args.values, args.distinct)
+    datetimes.clear_cache()
+    result = {
+        "values": args.values,
+        "distinct": args.distinct,
+        "values_per_sec": {
+            "strptime": run(pairs, legacy_started),
+            "parser": run(pairs, uncached),
+            "memoized": run(pairs, datetimes.combine),
+        },
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare the legacy full-header read with the tag-selective read.
+
+    python -m benchmarks.bench_header_read --files 200 --private-kb 512
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from pydicom import dcmread
+
+from dicom2fhir import header
+from dicom2fhir.tests import synthetic
+
+
+class CountingFile:
+    # file wrapper counting the bytes pydicom actually reads
+
+    def __init__(self, path):
+        self._fh = open(path, "rb")
+        self.name = path
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self._fh.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        return self._fh.seek(offset, whence)
+
+    def tell(self):
+        return self._fh.tell()
+
+    def close(self):
+        self._fh.close()
+
+
+def legacy_read(fh):
+    # the call process_dicom_2_fhir used before tag-selective reads
+    with dcmread(fh, None, [0x7FE00010], force=True) as ds:
+        return header.extract_header(ds)
+
+
+def selective_read(fh):
+    with dcmread(fh, stop_before_pixels=True, force=True,
+                 specific_tags=header.HEADER_TAGS) as ds:
+        return header.extract_header(ds)
+
+
+def run(files, reader):
+    total = 0
+    start = time.perf_counter()
+    for fp in files:
+        fh = CountingFile(fp)
+        try:
+            reader(fh)
+        finally:
+            fh.close()
+        total += fh.bytes_read
+    elapsed = time.perf_counter() - start
+    return {
+        "files_per_sec": len(files) / elapsed,
+        "bytes_read_per_file": total / len(files),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--private-kb", type=int, default=512,
+                        help="private data per header")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = synthetic.write_study(
+            tmp, n_series=1, n_instances=args.files,
+            private_bytes=args.private_kb * 1024)
+        result = {
+            "files": args.files,
+            "file_size": os.path.getsize(files[0]),
+            "legacy": run(files, legacy_read),
+            "selective": run(files, selective_read),
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
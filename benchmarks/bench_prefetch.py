@@ -0,0 +1,63 @@
+"""Throughput of the prefetching read stage against simulated storage latency.
+
+Every open() of a file of the study sleeps for the given latency, like the
+round trip of an open and first read on an NFS or object-store mount.
+
+    python -m benchmarks.bench_prefetch --files 200 --latency-ms 0 2 10 --prefetch 0 4 16
+"""
+import argparse
+import builtins
+import contextlib
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+from dicom2fhir import dicom2fhir
+from dicom2fhir.tests import synthetic
+
+
+@contextlib.contextmanager
+def latency(root, seconds):
+    # open() of files below root blocks for seconds, nothing else changes
+    real_open = builtins.open
+
+    def slow_open(file, *args, **kwargs):
+        if seconds and isinstance(file, (str, os.PathLike)) and os.fspath(file).startswith(root):
+            time.sleep(seconds)
+        return real_open(file, *args, **kwargs)
+
+    with mock.patch.object(builtins, "open", slow_open):
+        yield
+
+
+def run(root, n_files, seconds, prefetch):
+    with latency(root, seconds):
+        start = time.perf_counter()
+        dicom2fhir.process_dicom_2_fhir(root, backend="dict", prefetch=prefetch)
+        elapsed = time.perf_counter() - start
+    return {"files_per_sec": n_files / elapsed, "seconds": elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, nargs="+", default=[0, 2, 10])
+    parser.add_argument("--prefetch", type=int, nargs="+", default=[0, 4, 16],
+                        help="prefetch threads, 0 reads each file in turn")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic.write_study(tmp, n_series=4, n_instances=args.files // 4)
+        n_files = args.files // 4 * 4
+        results = []
+        for ms in args.latency_ms:
+            for threads in args.prefetch:
+                result = run(tmp, n_files, ms / 1000, threads)
+                results.append({"latency_ms": ms, "prefetch": threads, **result})
+    print(json.dumps({"files": n_files, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compare two benchmarks.run result files.
+
+    python -m benchmarks.compare base.json new.json --threshold 10
+
+Exits with status 1 if throughput dropped, or peak RSS or import time
+grew, by more than threshold percent in any scenario.
+"""
+import argparse
+import json
+import sys
+
+
+def _change(base, new):
+    return (new - base) / base * 100 if base else 0.0
+
+
+def compare(base, new, threshold):
+    rows = []
+    for module, seconds in new["import_time"].items():
+        if module in base["import_time"]:
+            rows.append(("import " + module, "s", base["import_time"][module], seconds, False))
+    for name, result in new["scenarios"].items():
+        if name not in base["scenarios"]:
+            continue
+        old = base["scenarios"][name]
+        rows.append((name + " files/sec", "", old["files_per_sec"], result["files_per_sec"], True))
+        rows.append((name + " peak RSS", "MB", old["peak_rss_mb"], result["peak_rss_mb"], False))
+        for stage, seconds in result["stages"].items():
+            rows.append(("%s %s" % (name, stage), "s", old["stages"].get(stage, 0), seconds, None))
+
+    regressions = []
+    for label, unit, old, value, higher_is_better in rows:
+        change = _change(old, value)
+        flag = ""
+        if higher_is_better is not None:
+            worse = -change if higher_is_better else change
+            if worse > threshold:
+                flag = "  REGRESSION"
+                regressions.append(label)
+        print("%-40s %12.4f %12.4f %+8.1f%% %s%s" % (label, old, value, change, unit, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent")
+    args = parser.parse_args(argv)
+
+    with open(args.base) as fh:
+        base = json.load(fh)
+    with open(args.new) as fh:
+        new = json.load(fh)
+    if compare(base, new, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Throughput benchmark for dicom2fhir on synthetic studies.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --scenario ct --workers 4 --backend dict
+    python -m benchmarks.run --series 8 --instances 100 --modalities CT MR SR \\
+        --private-kb 64 --junk-fraction 0.1
+    python -m benchmarks.compare base.json results.json
+
+Every scenario is generated into a temporary directory and converted in a
+fresh interpreter, so peak RSS is per scenario. Results are JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = {
+    "small": {"series": 2, "instances": 50},
+    "ct": {"series": 4, "instances": 500, "modalities": ["CT"]},
+    "mixed": {"series": 8, "instances": 100, "modalities": ["CT", "MR", "SR", "US"],
+              "private_kb": 64, "junk_fraction": 0.1},
+}
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def import_time(module, repeat=3):
+    # best of repeat, each in a clean interpreter
+    times = []
+    for _ in range(repeat):
+        out = subprocess.check_output(
+            [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)])
+        times.append(float(out.decode().strip().splitlines()[-1]))
+    return min(times)
+
+
+def generate(root, params):
+    from dicom2fhir.tests import synthetic
+    return synthetic.write_study(
+        root, n_series=params["series"], n_instances=params["instances"],
+        modalities=params.get("modalities"),
+        private_bytes=params.get("private_kb", 0) * 1024,
+        junk_fraction=params.get("junk_fraction", 0.0), seed=0)
+
+
+def convert(dcmDir, backend="model", workers=1, executor="thread"):
+    # runs in the child interpreter, stages come from ConversionStats
+    from dicom2fhir import dicom2fhir, writers
+    from dicom2fhir.stats import ConversionStats
+
+    stats = ConversionStats()
+    study, _ = dicom2fhir.process_dicom_2_fhir(
+        dcmDir, workers=workers, executor=executor, backend=backend, stats=stats)
+
+    start = time.perf_counter()
+    writers.study_json(study)
+    serialize = time.perf_counter() - start
+
+    stages = {stage: stats.timings[stage] for stage in ("walk", "read", "assemble")}
+    stages["serialize"] = serialize
+    # nested inside assemble, reported but not added to the total
+    nested = {stage: stats.timings[stage] for stage in ("snomed", "datetime")}
+    total = sum(stages.values())
+    files = stats.counters["files"]
+    return {
+        "files": files,
+        "errors": stats.counters["non_dicom"] + stats.counters["errors"],
+        "seconds": total,
+        "files_per_sec": files / total,
+        "stages": stages,
+        "nested_stages": nested,
+        "counters": dict(stats.counters),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_scenario(params, backend, workers, executor):
+    with tempfile.TemporaryDirectory() as tmp:
+        generate(tmp, params)
+        child = json.dumps({"dcmDir": tmp, "backend": backend,
+                            "workers": workers, "executor": executor})
+        out = subprocess.check_output(
+            [sys.executable, "-m", "benchmarks.run", "--child", child])
+    result = json.loads(out.decode().strip().splitlines()[-1])
+    result["params"] = params
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="predefined scenario, repeatable (default: all)")
+    parser.add_argument("--series", type=int)
+    parser.add_argument("--instances", type=int, help="instances per series")
+    parser.add_argument("--modalities", nargs="+")
+    parser.add_argument("--private-kb", type=int, default=0)
+    parser.add_argument("--junk-fraction", type=float, default=0.0,
+                        help="fraction of non-DICOM files, below 1")
+    parser.add_argument("--backend", default="model", choices=["model", "dict", "compact"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--executor", default="thread", choices=["thread", "process"])
+    parser.add_argument("--output", help="write results to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(convert(**json.loads(args.child))))
+        return
+
+    if args.series or args.instances:
+        scenarios = {"custom": {
+            "series": args.series or 1, "instances": args.instances or 100,
+            "modalities": args.modalities, "private_kb": args.private_kb,
+            "junk_fraction": args.junk_fraction,
+        }}
+    else:
+        scenarios = {name: SCENARIOS[name] for name in (args.scenario or sorted(SCENARIOS))}
+
+    import pydicom
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "pydicom": pydicom.__version__,
+            "backend": args.backend,
+            "workers": args.workers,
+            "executor": args.executor,
+        },
+        "import_time": {
+            "dicom2fhir.dicom2fhirutils": import_time("dicom2fhir.dicom2fhirutils"),
+            "dicom2fhir.dicom2fhir": import_time("dicom2fhir.dicom2fhir"),
+        },
+        "scenarios": {},
+    }
+    for name, params in scenarios.items():
+        results["scenarios"][name] = run_scenario(
+            params, args.backend, args.workers, args.executor)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
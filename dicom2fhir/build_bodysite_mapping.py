@@ -0,0 +1,58 @@
+import argparse
+import csv
+import logging
+
+from dicom2fhir import dicom2fhirutils
+
+# required columns
+REQ_COLS = ["Body Part Examined", "Code Value", "Code Meaning"]
+
+
+def read_bodysite_mapping(html):
+    # html is a local copy of PS3.16 Annex L, pandas is only needed here
+    import pandas as pd
+
+    logging.info(f"Read BodySite-SNOMED mapping from {html}")
+    tables = pd.read_html(html, converters={
+        "Code Value": str
+    })
+    mapping = next(t for t in tables if all(c in t.columns for c in REQ_COLS))
+    mapping = mapping[REQ_COLS]
+
+    # remove empty values:
+    mapping = mapping[~mapping['Body Part Examined'].isnull()]
+    return mapping.fillna('')
+
+
+def write_bodysite_mapping(mapping, path, edition):
+    with open(path, 'w', newline='', encoding='utf-8') as fh:
+        fh.write("# DICOM PS3.16 Annex L, Correspondence of Anatomic Region Codes"
+                 " and Body Part Examined Defined Terms\n")
+        fh.write(f"# source: {dicom2fhirutils.BODYSITE_SNOMED_MAPPING_URL}\n")
+        fh.write(f"# edition: {edition}\n")
+        fh.write("# regenerate with: python -m dicom2fhir.build_bodysite_mapping"
+                 " <chapter_L.html> --edition <edition>\n")
+        writer = csv.writer(fh, lineterminator="\n")
+        writer.writerow(REQ_COLS)
+        for row in mapping.itertuples(index=False):
+            writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Regenerate the bundled BodyPartExamined to SNOMED table")
+    parser.add_argument("html", help="local copy of " +
+                        dicom2fhirutils.BODYSITE_SNOMED_MAPPING_URL)
+    parser.add_argument("--edition", required=True,
+                        help="DICOM edition of the html, e.g. 2025b")
+    parser.add_argument("--output",
+                        default=dicom2fhirutils.BODYSITE_SNOMED_MAPPING_FILE)
+    args = parser.parse_args(argv)
+
+    mapping = read_bodysite_mapping(args.html)
+    write_bodysite_mapping(mapping, args.output, args.edition)
+    print(f"Saved {len(mapping)} entries to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+
+from pydicom.errors import BytesLengthException, InvalidDicomError
+
+from dicom2fhir import header
+
+CACHE_FILE = "headers.sqlite"
+
+# the record format; records are also invalidated whenever the extracted
+# attributes change, see header.set_fields
+CACHE_VERSION = "2"
+
+
+def _version():
+    return CACHE_VERSION + "-" + hashlib.sha256(
+        "\n".join(header.HEADER_KEYWORDS).encode("utf-8")).hexdigest()[:16]
+
+# errors that reading the same bytes again raises again; anything else,
+# OSError above all, is not cached so the file is read again next time
+PARSE_ERRORS = (InvalidDicomError, BytesLengthException, EOFError, ValueError,
+                KeyError, struct.error)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS headers (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    header TEXT,
+    error TEXT,
+    last_used INTEGER
+);
+CREATE INDEX IF NOT EXISTS headers_last_used ON headers (last_used);
+"""
+
+
+class HeaderCache:
+    # On-disk cache of header records keyed by path, size, mtime and inode.
+    # Holds at most max_entries records, the least recently used are evicted.
+
+    def __init__(self, cache_dir: str, max_entries: int = 1000000):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILE)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._db = sqlite3.connect(self.path)
+        self._db.executescript(_SCHEMA)
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = 'version'").fetchone()
+        version = _version()
+        if row is None or row[0] != version:
+            self._db.execute("DELETE FROM headers")
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+        self._clock = self._db.execute(
+            "SELECT COALESCE(MAX(last_used), 0) FROM headers").fetchone()[0]
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM headers").fetchone()[0]
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    @staticmethod
+    def _key(fp):
+        st = os.stat(fp)
+        return st.st_size, st.st_mtime_ns, st.st_ino
+
+    def get(self, fp):
+        # returns the cached header record (or exception), None on a miss
+        try:
+            key = self._key(fp)
+        except (OSError, TypeError):
+            # gone, or not a path (archive members are not cached)
+            self.misses += 1
+            return None
+        fp = os.fspath(fp)
+        row = self._db.execute(
+            "SELECT size, mtime_ns, inode, header, error FROM headers WHERE path = ?",
+            (fp,)).fetchone()
+        if row is None or tuple(row[:3]) != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._db.execute(
+            "UPDATE headers SET last_used = ? WHERE path = ?", (self._tick(), fp))
+        if row[4] is not None:
+            return Exception(row[4])
+        return json.loads(row[3])
+
+    def put(self, fp, hdr):
+        # hdr is a header record or the exception raised while reading fp,
+        # so files that are not DICOM are not reopened either
+        if isinstance(hdr, Exception) and not isinstance(hdr, PARSE_ERRORS):
+            return
+        try:
+            size, mtime_ns, inode = self._key(fp)
+        except (OSError, TypeError):
+            return
+        fp = os.fspath(fp)
+        if isinstance(hdr, Exception):
+            values = (None, str(hdr))
+        else:
+            values = (json.dumps(hdr), None)
+        self._db.execute(
+            "INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (fp, size, mtime_ns, inode) + values + (self._tick(),))
+
+    def evict(self):
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM headers WHERE path IN "
+                "(SELECT path FROM headers ORDER BY last_used LIMIT ?)", (excess,))
+            self.evictions += excess
+
+    def flush(self):
+        self.evict()
+        self._db.commit()
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,237 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from dicom2fhir import dicom2fhir
+from dicom2fhir import dicom2fhirutils
+from dicom2fhir import writers
+from dicom2fhir.stats import ConversionStats
+
+# dicom2fhir ROOT|--manifest FILE (--output DIR | --ndjson FILE)
+#
+# Converts every study directory below ROOT (or listed in the manifest) in
+# a pool of worker processes. Each finished directory is appended to the
+# checkpoint file, so a rerun with the same checkpoint skips it.
+
+
+def _study_dirs(root):
+    # the subdirectories of root, or root itself when it has none
+    dirs = sorted(e.path for e in os.scandir(root) if e.is_dir())
+    return dirs or [root]
+
+
+def _read_dirs(manifest):
+    with open(manifest) as fh:
+        lines = [line.strip() for line in fh]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def convert_dir(studyDir, backend="dict", validate=False, id_strategy="uuid4"):
+    # runs in a worker process; returns plain values only
+    start = time.perf_counter()
+    stats = ConversionStats()
+    try:
+        studies = [(uid, writers.study_json(study)) for study, uid in dicom2fhir.iter_studies(
+            studyDir, backend=backend, validate=validate, stats=stats, id_strategy=id_strategy)]
+        error = None if studies else "No DICOM study found"
+    except Exception as e:
+        studies = []
+        error = "%s: %s" % (type(e).__name__, e)
+    return {
+        "dir": studyDir,
+        "studies": studies,
+        "files": stats.counters["files"],
+        # files that could not be read; their studies are written without them
+        "errors": stats.counters["errors"],
+        "error": error,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+class Checkpoint:
+    # JSON lines, one per finished directory: dir, status, the studies
+    # written and for NDJSON output the file size after writing them
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        valid = 0  # bytes up to the end of the last complete line
+        if os.path.exists(path):
+            with open(path, "rb") as fh:
+                for line in fh:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("no newline")
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn last line of an interrupted run
+                    self.done[entry["dir"]] = entry
+                    valid += len(line)
+        self._fh = open(path, "a")
+        # new records go after the last complete line, not the torn one
+        self._fh.truncate(valid)
+
+    def offset(self):
+        # NDJSON size after the last recorded directory
+        offsets = [e["offset"] for e in self.done.values() if e.get("offset") is not None]
+        return max(offsets) if offsets else 0
+
+    def record(self, entry):
+        self.done[entry["dir"]] = entry
+        self._fh.write(json.dumps(entry) + "\n")
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def close(self):
+        self._fh.close()
+
+
+class _DirectoryOutput:
+    def __init__(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+
+    def write(self, uid, text):
+        path = os.path.join(self.out_dir, uid + ".json")
+        with open(path + ".tmp", "w") as fh:
+            fh.write(text)
+        os.replace(path + ".tmp", path)
+
+    def offset(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class _NDJSONOutput:
+    # appends to path; studies written after the last checkpoint entry of
+    # an interrupted run are cut off first, so none is written twice
+    def __init__(self, path, offset):
+        mode = "r+b" if os.path.exists(path) else "wb"
+        self._fh = open(path, mode)
+        self._fh.truncate(offset)
+        self._fh.seek(offset)
+
+    def write(self, uid, text):
+        self._fh.write(text.encode("utf-8") + b"\n")
+
+    def offset(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        return self._fh.tell()
+
+    def close(self):
+        self._fh.close()
+
+
+def _results(dirs, workers, backend, validate, id_strategy="uuid4"):
+    # (unordered) results of convert_dir with at most 2 * workers pending
+    if workers <= 1:
+        for d in dirs:
+            yield convert_dir(d, backend, validate, id_strategy)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        try:
+            for d in dirs:
+                pending.add(pool.submit(convert_dir, d, backend, validate, id_strategy))
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def run(dirs, output, checkpoint, workers=1, backend="dict", validate=False,
+        retry_failed=False, id_strategy="uuid4"):
+    # returns the summary dict; output is _DirectoryOutput or _NDJSONOutput
+    todo = [d for d in dirs if d not in checkpoint.done
+            or (retry_failed and checkpoint.done[d]["status"] != "ok")]
+    summary = {"dirs": 0, "studies": 0, "files": 0, "failures": 0,
+               "skipped": len(dirs) - len(todo), "interrupted": False}
+    start = time.perf_counter()
+    try:
+        for result in _results(todo, workers, backend, validate, id_strategy):
+            for uid, text in result["studies"]:
+                output.write(uid, text)
+            status = "ok" if result["error"] is None else "failed"
+            if result["error"] is not None:
+                logging.error(f"{result['dir']}: {result['error']}")
+                summary["failures"] += 1
+            checkpoint.record({
+                "dir": result["dir"], "status": status,
+                "studies": [uid for uid, _ in result["studies"]],
+                "files": result["files"], "errors": result["errors"],
+                "error": result["error"],
+                "offset": output.offset(),
+            })
+            summary["dirs"] += 1
+            summary["studies"] += len(result["studies"])
+            summary["files"] += result["files"]
+    except KeyboardInterrupt:
+        summary["interrupted"] = True
+    elapsed = time.perf_counter() - start
+    summary["seconds"] = elapsed
+    summary["studies_per_sec"] = summary["studies"] / elapsed if elapsed else 0.0
+    summary["files_per_sec"] = summary["files"] / elapsed if elapsed else 0.0
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="dicom2fhir", description="Convert DICOM study directories to FHIR ImagingStudy resources.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("root", nargs="?", help="directory holding one directory per study")
+    source.add_argument("--manifest", help="file listing one study directory per line")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output", help="write one <StudyInstanceUID>.json per study to this directory")
+    target.add_argument("--ndjson", help="append all studies to this NDJSON file")
+    parser.add_argument("--checkpoint", help="default: <output>/.checkpoint or <ndjson>.checkpoint")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backend", default="dict", choices=sorted(dicom2fhir.BACKENDS))
+    parser.add_argument("--validate", action="store_true")
+    parser.add_argument("--id-strategy", default="uuid4", choices=dicom2fhirutils.ID_STRATEGIES,
+                        help="uuid5 or sha256 derive ImagingStudy.id from the StudyInstanceUID, "
+                             "so converting a study again gives the same id")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="convert directories that failed in an earlier run again")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s %(message)s")
+
+    dirs = _read_dirs(args.manifest) if args.manifest else _study_dirs(args.root)
+    if args.output:
+        output = _DirectoryOutput(args.output)
+        checkpoint = Checkpoint(args.checkpoint or os.path.join(args.output, ".checkpoint"))
+    else:
+        checkpoint = Checkpoint(args.checkpoint or args.ndjson + ".checkpoint")
+        output = _NDJSONOutput(args.ndjson, checkpoint.offset())
+    try:
+        summary = run(dirs, output, checkpoint, args.workers, args.backend,
+                      args.validate, args.retry_failed, args.id_strategy)
+    finally:
+        output.close()
+        checkpoint.close()
+
+    print("%(dirs)d directories, %(studies)d studies, %(files)d files, %(failures)d failures, "
+          "%(skipped)d skipped in %(seconds).1fs: %(studies_per_sec).2f studies/sec, "
+          "%(files_per_sec).1f files/sec" % summary, file=sys.stderr)
+    if summary["interrupted"]:
+        print("interrupted, run again with the same checkpoint to resume", file=sys.stderr)
+        return 130
+    return 1 if summary["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
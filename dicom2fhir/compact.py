@@ -0,0 +1,140 @@
+import json
+from array import array
+
+from dicom2fhir import dictbuilder
+from dicom2fhir.index import ImagingStudyIndex
+
+# Compact backend for very large studies: the study and its series are the
+# plain dicts of dictbuilder, but series["instance"] is an InstanceStore
+# that keeps the instances column-wise. Instance dicts are only built again
+# while the study is serialized, a batch at a time, by iter_json.
+
+NO_NUMBER = -(1 << 63)
+BATCH_SIZE = 512
+
+_dumps = json.JSONEncoder(separators=(",", ":")).encode
+
+
+class InstanceStore:
+    # columns of one series' instances: UIDs, indices into the distinct
+    # sopClass codings and titles of the series, and instance numbers
+
+    __slots__ = ("uids", "sopClasses", "numbers", "titles",
+                 "_codings", "_codingIndex", "_titles", "_titleIndex")
+
+    def __init__(self):
+        self.uids = []
+        self.sopClasses = array("I")
+        self.numbers = array("q")
+        self.titles = array("l")
+        self._codings = []
+        self._codingIndex = {}
+        self._titles = []
+        self._titleIndex = {}
+
+    def append(self, instance: dict):
+        unknown = set(instance) - {"uid", "sopClass", "number", "title"}
+        if unknown:
+            raise ValueError("InstanceStore cannot hold " + ", ".join(sorted(unknown)))
+        sopClass = instance["sopClass"]
+        key = (sopClass["system"], sopClass["code"])
+        pos = self._codingIndex.get(key)
+        if pos is None:
+            pos = self._codingIndex[key] = len(self._codings)
+            self._codings.append(sopClass)
+
+        title = instance.get("title")
+        tpos = -1
+        if title is not None:
+            tpos = self._titleIndex.get(title)
+            if tpos is None:
+                tpos = self._titleIndex[title] = len(self._titles)
+                self._titles.append(title)
+
+        number = instance.get("number")
+        self.uids.append(instance["uid"])
+        self.sopClasses.append(pos)
+        self.numbers.append(NO_NUMBER if number is None else number)
+        self.titles.append(tpos)
+
+    def __len__(self):
+        return len(self.uids)
+
+    def __getitem__(self, i) -> dict:
+        # the instance dict, keys in FHIR element order as in dictbuilder
+        # a copy of the coding, instances can be changed independently
+        instance = {"uid": self.uids[i], "sopClass": dict(self._codings[self.sopClasses[i]])}
+        if self.numbers[i] != NO_NUMBER:
+            instance["number"] = self.numbers[i]
+        if self.titles[i] >= 0:
+            instance["title"] = self._titles[self.titles[i]]
+        return instance
+
+    def __iter__(self):
+        for i in range(len(self.uids)):
+            yield self[i]
+
+
+def add_imaging_study_series(study: dict, ds: dict, fp, index: ImagingStudyIndex = None):
+    dictbuilder.add_imaging_study_series(study, ds, fp, index, store=InstanceStore)
+
+
+def create_imaging_study(ds: dict, fp, dcmDir, index: ImagingStudyIndex = None,
+                         id_strategy: str = "uuid4"):
+    return dictbuilder.create_imaging_study(ds, fp, dcmDir, index, store=InstanceStore,
+                                            id_strategy=id_strategy)
+
+
+def is_compact(study) -> bool:
+    if not isinstance(study, dict):
+        return False
+    return any(isinstance(s.get("instance"), InstanceStore) for s in study.get("series") or [])
+
+
+def to_dict(study: dict) -> dict:
+    # the study with every InstanceStore materialized, as built by dictbuilder
+    study = dict(study)
+    if "series" in study:
+        study["series"] = [
+            {k: list(v) if isinstance(v, InstanceStore) else v for k, v in s.items()}
+            for s in study["series"]
+        ]
+    return study
+
+
+def _iter_instances(store: InstanceStore):
+    yield "["
+    for start in range(0, len(store), BATCH_SIZE):
+        batch = ",".join(_dumps(store[i])
+                         for i in range(start, min(start + BATCH_SIZE, len(store))))
+        yield ("," if start else "") + batch
+    yield "]"
+
+
+def _iter_object(obj: dict, stream):
+    # obj as JSON; values under the keys in stream are written by stream[key]
+    sep = "{"
+    for key, value in obj.items():
+        if key in stream:
+            yield sep + _dumps(key) + ":"
+            yield from stream[key](value)
+        else:
+            yield sep + _dumps(key) + ":" + _dumps(value)
+        sep = ","
+    yield "}" if sep == "," else "{}"
+
+
+def _iter_series(series: list):
+    stream = {"instance": lambda v: _iter_instances(v) if isinstance(v, InstanceStore) else [_dumps(v)]}
+    yield "["
+    for n, s in enumerate(series):
+        if n:
+            yield ","
+        yield from _iter_object(s, stream)
+    yield "]"
+
+
+def iter_json(study: dict):
+    # yields the JSON of study in pieces, identical to json.dumps of
+    # to_dict(study) with compact separators
+    return _iter_object(study, {"series": _iter_series})
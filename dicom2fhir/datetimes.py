@@ -0,0 +1,115 @@
+from datetime import date, datetime, time, timedelta, timezone
+import functools
+
+# Parsers for the DICOM DA, TM and DT value representations (PS3.5 6.2).
+# Every parser is memoized on the raw string, the instances of a study
+# share only a handful of distinct values. Invalid values raise ValueError.
+
+CACHE_SIZE = 4096
+
+# FHIR requires a zone on dateTimes with a time; used when a header has
+# no (or an invalid) TimezoneOffsetFromUTC
+DEFAULT_TIMEZONE = timezone(timedelta(hours=1))
+
+
+def _int(value, start, end):
+    digits = value[start:end]
+    if len(digits) != end - start or not (digits.isascii() and digits.isdigit()):
+        raise ValueError(f"Invalid DICOM date/time '{value}'")
+    return int(digits)
+
+
+def _fraction(value, frac):
+    # up to six digits of fractional seconds, as microseconds
+    if not 0 < len(frac) <= 6 or not (frac.isascii() and frac.isdigit()):
+        raise ValueError(f"Invalid fractional seconds in '{value}'")
+    return int(frac.ljust(6, "0"))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_da(value: str) -> date:
+    # YYYYMMDD, or the ACR-NEMA YYYY.MM.DD
+    value = value.strip()
+    if len(value) == 10 and value[4] == "." and value[7] == ".":
+        value = value[0:4] + value[5:7] + value[8:10]
+    if len(value) != 8:
+        raise ValueError(f"Invalid DICOM date '{value}'")
+    return date(_int(value, 0, 4), _int(value, 4, 6), _int(value, 6, 8))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_tm(value: str) -> time:
+    # HH[MM[SS[.F{1,6}]]], or the ACR-NEMA HH:MM:SS.F
+    value = value.strip().replace(":", "")
+    main, _, frac = value.partition(".")
+    if len(main) not in (2, 4, 6) or (frac and len(main) != 6):
+        raise ValueError(f"Invalid DICOM time '{value}'")
+    hour = _int(main, 0, 2)
+    minute = _int(main, 2, 4) if len(main) >= 4 else 0
+    second = _int(main, 4, 6) if len(main) == 6 else 0
+    # 60 is allowed for leap seconds, python times stop at 59
+    second = min(second, 59)
+    return time(hour, minute, second, _fraction(value, frac) if frac else 0)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_tz(value: str) -> timezone:
+    # &ZZXX, as in TimezoneOffsetFromUTC and the suffix of DT values
+    value = value.strip()
+    if len(value) != 5 or value[0] not in "+-":
+        raise ValueError(f"Invalid DICOM UTC offset '{value}'")
+    offset = timedelta(hours=_int(value, 1, 3), minutes=_int(value, 3, 5))
+    return timezone(-offset if value[0] == "-" else offset)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_dt(value: str) -> datetime:
+    # YYYY[MM[DD[HH[MM[SS[.F{1,6}]]]]]][&ZZXX]; missing components are
+    # the lowest valid value, the result is naive without &ZZXX
+    value = value.strip()
+    tzinfo = None
+    sign = max(value.rfind("+"), value.rfind("-"))
+    if sign > 0:
+        tzinfo = parse_tz(value[sign:])
+        value = value[:sign]
+    main, _, frac = value.partition(".")
+    if len(main) not in (4, 6, 8, 10, 12, 14) or (frac and len(main) != 14):
+        raise ValueError(f"Invalid DICOM datetime '{value}'")
+    n = len(main)
+    return datetime(
+        _int(main, 0, 4),
+        _int(main, 4, 6) if n >= 6 else 1,
+        _int(main, 6, 8) if n >= 8 else 1,
+        _int(main, 8, 10) if n >= 10 else 0,
+        _int(main, 10, 12) if n >= 12 else 0,
+        min(_int(main, 12, 14), 59) if n == 14 else 0,
+        _fraction(value, frac) if frac else 0,
+        tzinfo)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def combine(da: str, tm: str = None, tz: str = None):
+    # a DA and an optional TM as a zoned datetime, or only the date when
+    # there is no time; tz is a TimezoneOffsetFromUTC value
+    day = parse_da(da)
+    if not tm:
+        return day
+    tzinfo = DEFAULT_TIMEZONE
+    if tz:
+        try:
+            tzinfo = parse_tz(tz)
+        except ValueError:
+            pass
+    return datetime.combine(day, parse_tm(tm), tzinfo)
+
+
+_CACHES = (parse_da, parse_tm, parse_tz, parse_dt, combine)
+
+
+def clear_cache():
+    for cache in _CACHES:
+        cache.cache_clear()
+
+
+def cache_info() -> dict:
+    return {cache.__name__: cache.cache_info() for cache in _CACHES}
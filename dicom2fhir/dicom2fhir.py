@@ -1,193 +1,175 @@
-import uuid
 import os
-from fhir.resources import R4B as fr
-from fhir.resources.R4B import reference
-from fhir.resources.R4B import imagingstudy
-from fhir.resources.R4B import identifier
-from pydicom import dcmread
-from pydicom import dataset
-from tqdm import tqdm
+import copy
 import logging
-import hashlib
+from time import perf_counter
+from typing import TYPE_CHECKING
 
+from dicom2fhir import compact
 from dicom2fhir import dicom2fhirutils
+from dicom2fhir import dicomdir
+from dicom2fhir import discovery as _discovery
+from dicom2fhir import dictbuilder
+from dicom2fhir import header
+from dicom2fhir import prefetch as _prefetch
+from dicom2fhir import sources
+from dicom2fhir.index import ImagingStudyIndex
+from dicom2fhir.stats import ConversionStats, TqdmProgress
+
+# fhir.resources is imported by the model backend on first use, see
+# dicom2fhirutils
+if TYPE_CHECKING:
+    from fhir.resources.R4B import imagingstudy
 
 def _add_imaging_study_instance(
-    study: imagingstudy.ImagingStudy,
-    series: imagingstudy.ImagingStudySeries,
-    ds: dataset.FileDataset
+    study: "imagingstudy.ImagingStudy",
+    series: "imagingstudy.ImagingStudySeries",
+    ds: dict,
+    index: ImagingStudyIndex = None
 ):
-    selectedInstance = None
-    instanceUID = ds.SOPInstanceUID
-    if series.instance is not None:
-        selectedInstance = next(
-            (i for i in series.instance if i.uid == instanceUID), None)
-    else:
+    from fhir.resources.R4B import imagingstudy
+    if index is None:
+        index = ImagingStudyIndex(study)
+    instanceUID = ds["SOPInstanceUID"]
+    if series.instance is None:
         series.instance = []
 
-    if selectedInstance is not None:
-        print("Error: SOP Instance UID is not unique")
-        print(selectedInstance.as_json())
+    if index.has_instance(series.uid, instanceUID):
+        logging.warning(f"SOP Instance UID {instanceUID} is not unique, skipping the instance")
+        index.stats.count("duplicate_instances")
         return
 
     instance_data = {}
 
     instance_data["uid"] = instanceUID
     instance_data["sopClass"] = dicom2fhirutils.gen_coding(
-        value="urn:oid:" + ds.SOPClassUID,
+        value="urn:oid:" + ds["SOPClassUID"],
         system=dicom2fhirutils.SOP_CLASS_SYS
     )
-    instance_data["number"] = ds.InstanceNumber
+    instance_data["number"] = ds["InstanceNumber"]
 
-    try:
-        if series.modality.code == "SR":
-            seq = ds.ConceptNameCodeSequence
-            instance_data["title"] = seq[0x0008, 0x0104]
-        else:
-            instance_data["title"] = '\\'.join(ds.ImageType)
-    except Exception:
-        pass  # print("Unable to set instance title")
+    if series.modality.code == "SR":
+        if ds.get("ConceptNameCodeSequence"):
+            instance_data["title"] = ds["ConceptNameCodeSequence"][0]["display"]
+    elif ds.get("ImageType") is not None:
+        instance_data["title"] = '\\'.join(ds["ImageType"])
 
     # instantiate selected instancee here
-    selectedInstance = fr.imagingstudy.ImagingStudySeriesInstance(
+    selectedInstance = imagingstudy.ImagingStudySeriesInstance(
         **instance_data)
 
     series.instance.append(selectedInstance)
+    index.add_instance(series.uid, instanceUID)
+    index.stats.count("instances")
     study.numberOfInstances = study.numberOfInstances + 1
     series.numberOfInstances = series.numberOfInstances + 1
     return
 
 
-def _add_imaging_study_series(study: imagingstudy.ImagingStudy, ds: dataset.FileDataset, fp, study_lists):
+def _add_imaging_study_series(study: "imagingstudy.ImagingStudy", ds: dict, fp, index: ImagingStudyIndex = None):
+    from fhir.resources.R4B import imagingstudy
 
     # inti data container
     series_data = {}
 
-    seriesInstanceUID = ds.SeriesInstanceUID
+    if index is None:
+        index = ImagingStudyIndex(study)
+
+    seriesInstanceUID = ds["SeriesInstanceUID"]
     # TODO: Add test for studyInstanceUID ... another check to make sure it matches
-    selectedSeries = None
-    if study.series is not None:
-        selectedSeries = next(
-            (s for s in study.series if s.uid == seriesInstanceUID), None)
-    else:
+    if study.series is None:
         study.series = []
 
+    selectedSeries = index.series.get(seriesInstanceUID)
     if selectedSeries is not None:
-        _add_imaging_study_instance(study, selectedSeries, ds)
+        _add_imaging_study_instance(study, selectedSeries, ds, index)
         return
 
+    # header records only hold the attributes present in the file, optional
+    # ones are looked up with ds.get. Extensions come from site specific
+    # fields such as header.MR_FIELDS
+    extensions = header.extensions(ds, "series")
+    if extensions:
+        series_data["extension"] = extensions
     series_data["uid"] = seriesInstanceUID
-    try:
-        if ds.SeriesDescription != '':
-            series_data["description"] = ds.SeriesDescription
-    except Exception:
-        pass
+    if ds.get("SeriesDescription", '') != '':
+        series_data["description"] = ds["SeriesDescription"]
 
-    series_data["number"] = ds.SeriesNumber
+    series_data["number"] = ds["SeriesNumber"]
     series_data["numberOfInstances"] = 0
 
     series_data["modality"] = dicom2fhirutils.gen_coding(
-        value=ds.Modality,
+        value=ds["Modality"],
         system=dicom2fhirutils.ACQUISITION_MODALITY_SYS
     )
     #dicom2fhirutils.update_study_modality_list(study_lists, ds.Modality)
 
-    stime = None
-    try:
-        stime = ds.SeriesTime
-    except Exception:
-        pass  # print("Series TimeDate is missing")
-
-    try:
-        sdate = ds.SeriesDate
-        series_data["started"] = dicom2fhirutils.gen_started_datetime(
-            sdate, stime)
-    except Exception:
-        pass  # print("Series Date is missing")
-
-    try:
+    start = perf_counter()
+    if "SeriesDate" in ds:
+        try:
+            series_data["started"] = dicom2fhirutils.gen_started_datetime(
+                ds["SeriesDate"], ds.get("SeriesTime"), ds.get("TimezoneOffsetFromUTC"))
+        except Exception:
+            pass  # malformed date or time
+    index.stats.add_time("datetime", perf_counter() - start)
+
+    start = perf_counter()
+    # unmapped body parts are left out
+    if ds.get("BodyPartExamined") in dicom2fhirutils.get_bodysite_mapping():
         series_data["bodySite"] = dicom2fhirutils.gen_bodysite_coding(
-            ds.BodyPartExamined)
+            ds["BodyPartExamined"])
         # dicom2fhirutils.update_study_bodysite_list(
         #     study, series_data["bodySite"])
-    except Exception:
-        pass  # print ("Body Part Examined missing")
+    index.stats.add_time("snomed", perf_counter() - start)
 
-    try:
+    if ds.get("Laterality"):
         series_data["laterality"] = dicom2fhirutils.gen_coding_text_only(
-            ds.Laterality)
+            ds["Laterality"])
         # dicom2fhirutils.update_study_laterality_list(
         #     study, series_data["laterality"])
-    except Exception:
-        pass  # print ("Laterality missing")
 
     # TODO: evaluate if we wonat to have inline "performer.actor" for the I am assuming "technician"
     # PerformingPhysicianName	0x81050
     # PerformingPhysicianIdentificationSequence	0x81052
 
-    # extension stuff here
-    # if series_data["modality"].code == "MR":
-    #     try:
-    #         series_data["scanningSequence"] = dicom2fhirutils.gen_extension(
-    #             url="test.url.de",
-    #             value=ds[0x0018, 0x0020].value,
-    #             system=dicom2fhirutils.SCANNING_SEQUENCE_SYS,
-    #             type="Coding"
-    #         )
-    #     except Exception:
-    #         pass
-        # try:
-        #     series_data["scanningVariant"] = dicom2fhirutils.gen_codeable_concept(
-        #         value_list=[ds[0x0018, 0x0021].value],
-        #         system=dicom2fhirutils.SCANNING_VARIANT_SYS
-        #     )
-        # except Exception:
-        #     pass
-        # try:
-        #     series_data["echoTime"] = ds[0x0018, 0x0081].value
-        # except Exception:
-        #     pass
-
     # Creating New Series
     series = imagingstudy.ImagingStudySeries(**series_data)
 
     study.series.append(series)
+    index.add_series(series.uid, series)
+    index.stats.count("series")
     study.numberOfSeries = study.numberOfSeries + 1
-    _add_imaging_study_instance(study, series, ds)
+    _add_imaging_study_instance(study, series, ds, index)
     return
 
 
-def _create_imaging_study(ds, fp, dcmDir) -> imagingstudy.ImagingStudy:
+def _create_imaging_study(ds, fp, dcmDir, index: ImagingStudyIndex = None,
+                          id_strategy: str = "uuid4") -> "imagingstudy.ImagingStudy":
+    from fhir.resources.R4B import identifier, imagingstudy, reference
+    if index is None:
+        index = ImagingStudyIndex()
     study_data = {}
-    study_data["id"] = str(uuid.uuid4())
+    study_data["id"] = dicom2fhirutils.gen_study_id(ds["StudyInstanceUID"], id_strategy)
+    extensions = header.extensions(ds, "study")
+    if extensions:
+        study_data["extension"] = extensions
     study_data["status"] = "available"
-    try:
-        if ds.StudyDescription != '':
-            study_data["description"] = ds.StudyDescription
-    except Exception:
-        pass  # missing study description
+    if ds.get("StudyDescription", '') != '':
+        study_data["description"] = ds["StudyDescription"]
 
     study_data["identifier"] = []
     study_data["identifier"].append(
-        dicom2fhirutils.gen_accession_identifier(ds.AccessionNumber))
+        dicom2fhirutils.gen_accession_identifier(ds["AccessionNumber"]))
     study_data["identifier"].append(
-        dicom2fhirutils.gen_studyinstanceuid_identifier(ds.StudyInstanceUID))
+        dicom2fhirutils.gen_studyinstanceuid_identifier(ds["StudyInstanceUID"]))
 
-    ipid = None
-    try:
-        ipid = ds.IssuerOfPatientID
-    except Exception:
-        pass  # print("Issuer of Patient ID is missing")
-    
-    patID9 = str(ds.PatientID)[:9]
-    patIdentifier = "https://fhir.diz.uk-erlangen.de/identifiers/patient-id|"+patID9
-    hashedIdentifier = hashlib.sha256(patIdentifier.encode('utf-8')).hexdigest()
-    patientReference = "Patient/"+hashedIdentifier
+    patID9 = str(ds["PatientID"])[:9]
+    patientReference = dicom2fhirutils.gen_patient_reference(patID9)
     patientRef = reference.Reference()
     patientRef.reference = patientReference
     patIdent = identifier.Identifier()
-    patIdent.system = "https://fhir.diz.uk-erlangen.de/identifiers/patient-id"
-    patIdent.type = dicom2fhirutils.gen_codeable_concept(["MR"],"http://terminology.hl7.org/CodeSystem/v2-0203")
+    patIdent.system = dicom2fhirutils.PATIENT_ID_SYS
+    patIdent.type = dicom2fhirutils.gen_codeable_concept(
+        [dicom2fhirutils.TERMINOLOGY_CODING_SYS_CODE_MRN], dicom2fhirutils.TERMINOLOGY_CODING_SYS)
     patIdent.value = patID9
     patientRef.identifier = patIdent
     study_data["subject"] = patientRef
@@ -197,79 +179,285 @@ def _create_imaging_study(ds, fp, dcmDir) -> imagingstudy.ImagingStudy:
 
     # study_data["endpoint"].append(endpoint)
 
-    procedures = []
-    try:
-        procedures = dicom2fhirutils.dcm_coded_concept(ds.ProcedureCodeSequence)
-    except Exception:
-        pass  # procedure code sequence not found
-
     study_data["procedureCode"] = dicom2fhirutils.gen_procedurecode_array(
-        procedures)
-
-    studyTime = None
-    try:
-        studyTime = ds.StudyTime
-    except Exception:
-        pass  # print("Study Date is missing")
+        ds.get("ProcedureCodeSequence", []))
 
-    try:
-        studyDate = ds.StudyDate
-        study_data["started"] = dicom2fhirutils.gen_started_datetime(
-            studyDate, studyTime)
-    except Exception:
-        pass  # print("Study Date is missing")
+    start = perf_counter()
+    if "StudyDate" in ds:
+        try:
+            study_data["started"] = dicom2fhirutils.gen_started_datetime(
+                ds["StudyDate"], ds.get("StudyTime"), ds.get("TimezoneOffsetFromUTC"))
+        except Exception:
+            pass  # malformed date or time
+    index.stats.add_time("datetime", perf_counter() - start)
 
     # TODO: we can add "inline" referrer
     # TODO: we can add "inline" reading radiologist.. (interpreter)
 
-    reason = None
-    reasonStr = None
-    try:
-        reason = dicom2fhirutils.dcm_coded_concept(
-            ds.ReasonForRequestedProcedureCodeSequence)
-    except Exception:
-        pass  # print("Reason for Request procedure Code Seq is not available")
-
-    try:
-        reasonStr = ds.ReasonForTheRequestedProcedure
-    except Exception:
-        pass  # print ("Reason for Requested procedures not found")
-
-    study_data["reasonCode"] = dicom2fhirutils.gen_reason(reason, reasonStr)
+    study_data["reasonCode"] = dicom2fhirutils.gen_reason(
+        ds.get("ReasonForRequestedProcedureCodeSequence"), ds.get("ReasonForTheRequestedProcedure"))
 
     study_data["numberOfSeries"] = 0
     study_data["numberOfInstances"] = 0
 
     # instantiate study here, when all required fields are available
     study = imagingstudy.ImagingStudy(**study_data)
-    study_lists = []
+    _add_imaging_study_series(study, ds, fp, index)
+    return study, index
+
+
+# output backends: pydantic models (default) or plain FHIR JSON dicts
+BACKENDS = {
+    "model": (_create_imaging_study, _add_imaging_study_series),
+    "dict": (dictbuilder.create_imaging_study, dictbuilder.add_imaging_study_series),
+    "compact": (compact.create_imaging_study, compact.add_imaging_study_series),
+}
+
+
+def _get_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(
+            "Unknown backend '%s', expected one of %s" % (backend, sorted(BACKENDS)))
+    return BACKENDS[backend]
 
-    _add_imaging_study_series(study, ds, fp, study_lists)
-    return study, study_lists
 
+def _finish(study, backend, validate):
+    if study is not None and backend == "dict" and validate:
+        dictbuilder.validate(study)
+    elif study is not None and backend == "compact" and validate:
+        dictbuilder.validate(compact.to_dict(study))
+    return study
 
-def process_dicom_2_fhir(dcmDir: str) -> imagingstudy.ImagingStudy:
-    files = []
-    # TODO: subdirectory must be traversed
+
+def _list_files(dcmDir):
     for r, d, f in os.walk(dcmDir):
         for file in f:
-            files.append(os.path.join(r, file))
+            yield os.path.join(r, file)
+
+
+def _input_files(dcmDir, listed=False, discovery=None, stats=None, prefetch=0):
+    # paths below a directory, or the sources.Member of a ZIP or tar file
+    # or of an iterable of members; listed=True lists a directory upfront.
+    # Directories are walked by discovery (discovery.DEFAULT if None),
+    # which counts the files it rejects in stats; with prefetch the magic
+    # bytes are checked by _prefetched instead
+    if not isinstance(dcmDir, (str, os.PathLike)):
+        return iter(dcmDir)
+    if sources.is_archive(dcmDir):
+        return sources.archive_members(dcmDir)
+    discovery = discovery or _discovery.DEFAULT
+    if prefetch and discovery.sniff:
+        discovery = copy.copy(discovery)
+        discovery.sniff = False
+    files = discovery.files(dcmDir, stats)
+    if listed:
+        return list(files)
+    # a streamed walk is consumed while headers are read, its time counts
+    # for walk and not for read
+    return files if stats is None else stats.timed(files, "walk")
+
+
+def _prefetched(files, prefetch, discovery, stats, sniff=True):
+    # files read ahead by prefetch threads, see prefetch.prefetch
+    if not prefetch:
+        return files
+    discovery = discovery or _discovery.DEFAULT
+    return _prefetch.prefetch(files, threads=prefetch, sniff=sniff and discovery.sniff,
+                              allow_no_preamble=discovery.allow_no_preamble, stats=stats)
+
+
+def _read_manifest(manifest, dcmDir=None):
+    # manifest is either a text file with one path per line or an iterable
+    # of paths; relative paths are resolved against dcmDir
+    if isinstance(manifest, (str, os.PathLike)):
+        with open(manifest) as fh:
+            lines = [line.strip() for line in fh]
+        manifest = [line for line in lines if line and not line.startswith("#")]
+    for fp in manifest:
+        if dcmDir is not None and not os.path.isabs(fp):
+            fp = os.path.join(dcmDir, fp)
+        yield fp
+
+
+def _read_headers(files, use_dicomdir, workers, executor, cache, stats):
+    if use_dicomdir:
+        return dicomdir.read_headers(files, cache=cache, stats=stats)
+    return header.read_headers(files, workers=workers, executor=executor, cache=cache)
+
+
+def _study_uid(fp, ds, stats):
+    # StudyInstanceUID of a header record, None for files that are not DICOM
+    try:
+        if isinstance(ds, Exception):
+            raise ds
+        return ds["StudyInstanceUID"]
+    except Exception as e:
+        logging.error(e)
+        stats.count("non_dicom")
+        stats.file_done(fp, False)
+        return None  # file is not a dicom file
+
+
+def _assemble(create_study, add_series, acc, ds, fp, dcmDir, stats, id_strategy="uuid4"):
+    # adds one header record to acc, the (study, index) pair of its study,
+    # and returns acc; starts a new study when acc is None
+    start = perf_counter()
+    ok = False
+    try:
+        if acc is None:
+            acc = create_study(ds, fp, dcmDir, ImagingStudyIndex(stats=stats),
+                               id_strategy=id_strategy)
+        else:
+            add_series(acc[0], ds, fp, acc[1])
+        ok = True
+    except Exception as e:
+        logging.error(e)
+        stats.count("errors")
+    stats.add_time("assemble", perf_counter() - start)
+    stats.file_done(fp, ok)
+    return acc
+
+
+def _start(stats, progress, total):
+    if stats is None:
+        stats = ConversionStats()
+    hook = None
+    if progress:
+        hook = TqdmProgress()
+        stats.hooks.append(hook)
+    stats.start(total)
+    return stats, hook
+
+
+def _stop(stats, hook):
+    stats.finish()
+    if hook is not None:
+        stats.hooks.remove(hook)
+
+
+def process_dicom_2_fhir(dcmDir: str, workers: int = 1, executor: str = "thread",
+                         backend: str = "model", validate: bool = False,
+                         cache=None, stats: ConversionStats = None,
+                         progress: bool = False, use_dicomdir: bool = False,
+                         discovery: _discovery.Discovery = None,
+                         prefetch: int = 0, id_strategy: str = "uuid4") -> "imagingstudy.ImagingStudy":
+    # backend="dict" returns FHIR JSON dicts, validated once at the end
+    # when validate=True; cache is an optional cache.HeaderCache; timings
+    # and counters are collected in stats, progress=True shows a tqdm bar.
+    # dcmDir may also be a ZIP or tar file, or an iterable of sources.Member.
+    # use_dicomdir=True builds the study from the DICOMDIR of dcmDir (the
+    # media root or the DICOMDIR itself), opening one file per series.
+    # discovery filters the files of a directory, see discovery.Discovery.
+    # prefetch > 0 reads headers ahead in that many threads, for storage
+    # with high latency such as NFS. id_strategy="uuid5" or "sha256"
+    # derives ImagingStudy.id from the StudyInstanceUID, see
+    # dicom2fhirutils.gen_study_id
+    create_study, add_series = _get_backend(backend)
+    if stats is None:
+        stats = ConversionStats()
+    start = perf_counter()
+    if use_dicomdir:
+        files = dicomdir.load(dcmDir)
+    else:
+        # only listed upfront when the progress bar needs a total
+        files = _input_files(dcmDir, listed=progress, discovery=discovery, stats=stats,
+                             prefetch=prefetch)
+    walked = perf_counter() - start
+    stats, hook = _start(stats, progress, len(files) if hasattr(files, "__len__") else None)
+    try:
+        stats.add_time("walk", walked)
+        if not use_dicomdir:
+            files = _prefetched(files, prefetch, discovery, stats)
+
+        # headers are parsed in parallel when workers > 1, the study itself is
+        # assembled here in file order so the output does not depend on workers
+        headers = _read_headers(files, use_dicomdir, workers, executor, cache, stats)
+
+        studyInstanceUID = None
+        acc = None
+        for fp, ds in stats.timed(headers, "read"):
+            uid = _study_uid(fp, ds, stats)
+            if uid is None:
+                continue
+
+            if studyInstanceUID is None:
+                studyInstanceUID = uid
+            if studyInstanceUID != uid:
+                raise Exception(
+                    "Incorrect DCM path, more than one study detected")
+            acc = _assemble(create_study, add_series, acc, ds, fp, dcmDir, stats, id_strategy)
+
+        imagingStudy = None
+        if acc is not None:
+            imagingStudy = _finish(acc[0], backend, validate)
+            stats.study_done(imagingStudy, studyInstanceUID)
+    finally:
+        _stop(stats, hook)
+    return imagingStudy, studyInstanceUID
+
+
+def iter_studies(dcmDir: str = None, manifest=None, workers: int = 1, executor: str = "thread",
+                 backend: str = "model", validate: bool = False, cache=None,
+                 stats: ConversionStats = None, progress: bool = False,
+                 use_dicomdir: bool = False, discovery: _discovery.Discovery = None,
+                 prefetch: int = 0, id_strategy: str = "uuid4"):
+    # yields (ImagingStudy, StudyInstanceUID) for every study below dcmDir.
+    # Without a manifest all studies are held until the walk is complete.
+    # With a manifest whose files are grouped by study, or a DICOMDIR,
+    # each study is yielded as soon as the next one starts, so only one is
+    # held in memory.
+    create_study, add_series = _get_backend(backend)
+    grouped = manifest is not None or use_dicomdir
+    if stats is None:
+        stats = ConversionStats()
+    if use_dicomdir:
+        files = dicomdir.load(dcmDir)
+    elif manifest is not None:
+        # manifests list DICOM files, they are not sniffed
+        files = _prefetched(_read_manifest(manifest, dcmDir), prefetch, discovery, stats,
+                            sniff=False)
+    elif dcmDir is not None:
+        files = _prefetched(_input_files(dcmDir, discovery=discovery, stats=stats,
+                                         prefetch=prefetch), prefetch, discovery, stats)
+    else:
+        raise Exception("Either a DCM path or a manifest is required")
+    stats, hook = _start(stats, progress, None)
 
-    studyInstanceUID = None
-    imagingStudy = None
-    for fp in tqdm(files):
-        try:
-            with dcmread(fp, None, [0x7FE00010], force=True) as ds:
-                if studyInstanceUID is None:
-                    studyInstanceUID = ds.StudyInstanceUID
-                if studyInstanceUID != ds.StudyInstanceUID:
-                    raise Exception(
-                        "Incorrect DCM path, more than one study detected")
-                if imagingStudy is None:
-                    imagingStudy, study_lists = _create_imaging_study(ds, fp, dcmDir)
-                else:
-                    _add_imaging_study_series(imagingStudy, ds, fp, study_lists)
-        except Exception as e:
-            logging.error(e)
-            pass  # file is not a dicom file
-    return imagingStudy, studyInstanceUID
\ No newline at end of file
+    def done(studyInstanceUID, acc):
+        study = _finish(acc[0], backend, validate)
+        stats.study_done(study, studyInstanceUID)
+        return study, studyInstanceUID
+
+    # the progress bar is closed and its hook removed however iteration
+    # ends, also when the caller stops early
+    try:
+        studies = {}
+        flushed = set()
+        current = None
+        headers = _read_headers(files, use_dicomdir, workers, executor, cache, stats)
+        for fp, ds in stats.timed(headers, "read"):
+            studyInstanceUID = _study_uid(fp, ds, stats)
+            if studyInstanceUID is None:
+                continue
+
+            if grouped and current is not None and studyInstanceUID != current:
+                flushed.add(current)
+                # a study none of whose files could be added has no accumulator
+                if current in studies:
+                    yield done(current, studies.pop(current))
+            if studyInstanceUID in flushed:
+                raise Exception(
+                    f"Input is not grouped by study, {studyInstanceUID} seen again in {fp}")
+            current = studyInstanceUID
+
+            acc = _assemble(create_study, add_series, studies.get(studyInstanceUID),
+                            ds, fp, dcmDir, stats, id_strategy)
+            # None if the study could not be created from this file, the
+            # next file of the study tries again
+            if acc is not None:
+                studies[studyInstanceUID] = acc
+
+        for studyInstanceUID in list(studies):
+            yield done(studyInstanceUID, studies.pop(studyInstanceUID))
+    finally:
+        _stop(stats, hook)
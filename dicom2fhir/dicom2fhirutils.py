@@ -1,17 +1,15 @@
-from datetime import datetime
-
-from fhir.resources.R4B import imagingstudy
-from fhir.resources.R4B import identifier
-from fhir.resources.R4B import codeableconcept
-from fhir.resources.R4B import coding
-from fhir.resources.R4B import patient
-from fhir.resources.R4B import humanname
-from fhir.resources.R4B import fhirtypes
-from fhir.resources.R4B import reference
-from fhir.resources.R4B import extension
-import pandas as pd
+import csv
+import functools
+import hashlib
 import os
 import logging
+import uuid
+
+from dicom2fhir import datetimes
+
+# fhir.resources takes longer to import than the rest of the package, it
+# is imported by the functions that build models, so the dict backend
+# never loads it
 
 TERMINOLOGY_CODING_SYS = "http://terminology.hl7.org/CodeSystem/v2-0203"
 TERMINOLOGY_CODING_SYS_CODE_ACCESSION = "ACSN"
@@ -22,80 +20,100 @@ SCANNING_SEQUENCE_SYS = "https://dicom.nema.org/medical/dicom/current/output/cht
 SCANNING_VARIANT_SYS = "https://dicom.nema.org/medical/dicom/current/output/chtml/part03/sect_C.8.3.html"
 
 SOP_CLASS_SYS = "urn:ietf:rfc:3986"
+SNOMED_SYS = "http://snomed.info/sct"
 
-BODYSITE_SNOMED_MAPPING_URL = "https://dicom.nema.org/medical/dicom/current/output/chtml/part16/chapter_L.html"
-
-
-def _get_snomed_bodysite_mapping(url, debug: bool = False):
-
-    logging.info(f"Get BodySite-SNOMED mapping from {url}")
-    df = pd.read_html(url, converters={
-        "Code Value": str
-    })
-
-    # required columns
-    req_cols = ["Code Value", "Code Meaning", "Body Part Examined"]
-
-    mapping = df[2][req_cols]
-
-    # remove empty values:
-    mapping = mapping[~mapping['Body Part Examined'].isnull()]
-
-    if debug:
-        fn_out = os.path.join(
-            os.curdir,
-            'mapping_dicom_snomed.csv'
-        )
-        mapping.to_csv(
-            path_or_buf=fn_out,
-            index=False
-        )
+PATIENT_ID_SYS = "https://fhir.diz.uk-erlangen.de/identifiers/patient-id"
 
+BODYSITE_SNOMED_MAPPING_URL = "https://dicom.nema.org/medical/dicom/current/output/chtml/part16/chapter_L.html"
+# version-pinned copy of the table above, see build_bodysite_mapping.py
+BODYSITE_SNOMED_MAPPING_FILE = os.path.join(
+    os.path.dirname(__file__), "resources", "bodysite_snomed.csv")
+
+# distinct (code, system) pairs kept by the shared coding cache
+CODING_CACHE_SIZE = 1024
+
+_bodysite_mapping = None
+
+
+def _load_snomed_bodysite_mapping(path):
+    logging.info(f"Load BodySite-SNOMED mapping from {path}")
+    mapping = {}
+    with open(path, newline='', encoding='utf-8') as fh:
+        rows = csv.reader(line for line in fh if not line.startswith('#'))
+        next(rows)  # column names
+        for bodypart, code, _meaning in rows:
+            # some body parts have no SNOMED code assigned
+            if code:
+                mapping[bodypart] = code
     return mapping
 
 
-# get mapping table
-mapping_table = _get_snomed_bodysite_mapping(url=BODYSITE_SNOMED_MAPPING_URL)
+def get_bodysite_mapping():
+    # loaded on first use, not at import time
+    global _bodysite_mapping
+    if _bodysite_mapping is None:
+        _bodysite_mapping = _load_snomed_bodysite_mapping(
+            BODYSITE_SNOMED_MAPPING_FILE)
+    return _bodysite_mapping
 
 
 def _get_snomed(dicom_bodypart, sctmapping):
     # codes are strings
-    return sctmapping.loc[sctmapping['Body Part Examined']
-                          == dicom_bodypart]["Code Value"].values[0]
+    return sctmapping[dicom_bodypart]
 
 
 def gen_accession_identifier(id):
+    from fhir.resources.R4B import identifier
     idf = identifier.Identifier()
     idf.use = "usual"
-    idf.type = codeableconcept.CodeableConcept()
-    idf.type.coding = []
-    acsn = coding.Coding()
-    acsn.system = TERMINOLOGY_CODING_SYS
-    acsn.code = TERMINOLOGY_CODING_SYS_CODE_ACCESSION
-
-    idf.type.coding.append(acsn)
+    idf.type = gen_codeable_concept(
+        [TERMINOLOGY_CODING_SYS_CODE_ACCESSION], TERMINOLOGY_CODING_SYS)
     idf.value = id
     return idf
 
 
 def gen_studyinstanceuid_identifier(id):
+    from fhir.resources.R4B import identifier
     idf = identifier.Identifier()
     idf.system = "urn:dicom:uid"
     idf.value = "urn:oid:" + id
     return idf
 
 
+def gen_patient_reference(patID):
+    # patients are referenced by the hash of their identifier
+    patIdentifier = PATIENT_ID_SYS + "|" + patID
+    hashedIdentifier = hashlib.sha256(patIdentifier.encode('utf-8')).hexdigest()
+    return "Patient/" + hashedIdentifier
+
+
+# ImagingStudy.id: random (uuid4), or derived from the StudyInstanceUID,
+# so converting a study again gives the same id: a name based UUID in the
+# OID namespace (uuid5), or the sha256 hash of its identifier like the
+# patient references
+ID_STRATEGIES = ("uuid4", "uuid5", "sha256")
+
+
+def gen_study_id(studyInstanceUID, strategy: str = "uuid4") -> str:
+    if strategy == "uuid4":
+        return str(uuid.uuid4())
+    if strategy == "uuid5":
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, studyInstanceUID))
+    if strategy == "sha256":
+        studyIdentifier = "urn:dicom:uid|urn:oid:" + studyInstanceUID
+        return hashlib.sha256(studyIdentifier.encode('utf-8')).hexdigest()
+    raise ValueError(
+        "Unknown id strategy '%s', expected one of %s" % (strategy, sorted(ID_STRATEGIES)))
+
+
 def get_patient_resource_ids(PatientID, IssuerOfPatientID):
+    from fhir.resources.R4B import identifier, reference
     idf = identifier.Identifier()
     idf.use = "usual"
     idf.value = PatientID
 
-    idf.type = codeableconcept.CodeableConcept()
-    idf.type.coding = []
-    id_coding = coding.Coding()
-    id_coding.system = TERMINOLOGY_CODING_SYS
-    id_coding.code = TERMINOLOGY_CODING_SYS_CODE_MRN
-    idf.type.coding.append(id_coding)
+    idf.type = gen_codeable_concept(
+        [TERMINOLOGY_CODING_SYS_CODE_MRN], TERMINOLOGY_CODING_SYS)
 
     if IssuerOfPatientID is not None:
         idf.assigner = reference.Reference()
@@ -123,8 +141,9 @@ def calc_dob(dicom_dob):
     if dicom_dob == '':
         return None
 
+    from fhir.resources.R4B import fhirtypes
     try:
-        dob = datetime.strptime(dicom_dob, '%Y%m%d')
+        dob = datetimes.parse_da(dicom_dob)
         fhir_dob = fhirtypes.Date(
             dob.year,
             dob.month,
@@ -136,6 +155,7 @@ def calc_dob(dicom_dob):
 
 
 def inline_patient_resource(referenceId, PatientID, IssuerOfPatientID, patientName, gender, dob):
+    from fhir.resources.R4B import humanname, patient
     p = patient.Patient()
     p.id = referenceId
     p.name = []
@@ -155,6 +175,7 @@ def inline_patient_resource(referenceId, PatientID, IssuerOfPatientID, patientNa
 def gen_procedurecode_array(procedures):
     if procedures is None:
         return None
+    from fhir.resources.R4B import codeableconcept, coding
     fhir_proc = []
     for p in procedures:
         concept = codeableconcept.CodeableConcept()
@@ -171,40 +192,17 @@ def gen_procedurecode_array(procedures):
     return None
 
 
-def gen_started_datetime(dt, tm):
+def gen_started_datetime(dt, tm, tz=None):
+    # DA, TM and TimezoneOffsetFromUTC values, see datetimes.combine
     if dt is None:
         return None
-
-    dt_pattern = '%Y%m%d'
-
-    if tm is not None and len(tm) >= 6:
-        studytm = datetime.strptime(tm[0:6], '%H%M%S')
-
-        dt_string = dt + " " + str(studytm.hour) + ":" + \
-            str(studytm.minute) + ":" + str(studytm.second)
-        dt_pattern = dt_pattern + " %H:%M:%S"
-    else:
-        dt_string = dt
-
-    dt_date = datetime.strptime(dt_string, dt_pattern)
-
-    # strangely, providing the datetime.date object does not work
-    fhirDtm = fhirtypes.DateTime(
-        dt_date.year,
-        dt_date.month,
-        dt_date.day,
-        dt_date.hour,
-        dt_date.minute,
-        dt_date.second,
-        tzinfo="+01:00"
-    )
-
-    return fhirDtm
+    return datetimes.combine(dt, tm or None, tz or None)
 
 
 def gen_reason(reason, reasonStr):
-    if reason is None and reasonStr is None:
+    if not reason and reasonStr is None:
         return None
+    from fhir.resources.R4B import codeableconcept, coding
     reasonList = []
     if reason is None or len(reason) <= 0:
         rc = codeableconcept.CodeableConcept()
@@ -224,31 +222,88 @@ def gen_reason(reason, reasonStr):
     return reasonList
 
 
+@functools.lru_cache(maxsize=None)
+def _frozen_types() -> dict:
+    # FrozenCoding and FrozenCodeableConcept, defined on first use
+    from fhir.resources.R4B import codeableconcept, coding
+
+    class FrozenCoding(coding.Coding):
+        # immutable Coding, shared by every resource that uses the same code
+        __qualname__ = "FrozenCoding"
+
+        class Config:
+            allow_mutation = False
+
+    class FrozenCodeableConcept(codeableconcept.CodeableConcept):
+        __qualname__ = "FrozenCodeableConcept"
+
+        class Config:
+            allow_mutation = False
+
+    return {"FrozenCoding": FrozenCoding, "FrozenCodeableConcept": FrozenCodeableConcept}
+
+
+def __getattr__(name):
+    # dicom2fhirutils.FrozenCoding and FrozenCodeableConcept (and pickle)
+    if name in ("FrozenCoding", "FrozenCodeableConcept"):
+        return _frozen_types()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@functools.lru_cache(maxsize=CODING_CACHE_SIZE)
+def _shared_coding(value, system):
+    return _frozen_types()["FrozenCoding"](system=system, code=value)
+
+
+@functools.lru_cache(maxsize=CODING_CACHE_SIZE)
+def _shared_codeable_concept(values: tuple, system):
+    return _frozen_types()["FrozenCodeableConcept"](
+        coding=[_shared_coding(v, system) for v in values])
+
+
+# the same for the dict backend as JSON fragments; plain dicts cannot be
+# frozen, so every call returns new ones and changing one study never
+# changes another
+def coding_fragment(value, system) -> dict:
+    return {"system": system, "code": value}
+
+
+def codeable_concept_fragment(values: tuple, system) -> dict:
+    return {"coding": [coding_fragment(v, system) for v in values]}
+
+
+_CODING_CACHES = (_shared_coding, _shared_codeable_concept)
+
+
+def clear_coding_cache():
+    for cache in _CODING_CACHES:
+        cache.cache_clear()
+
+
+def coding_cache_info() -> dict:
+    return {cache.__name__: cache.cache_info() for cache in _CODING_CACHES}
+
+
 def gen_coding(value, system):
+    # returns a shared FrozenCoding, the cache lives for the whole process
+    # so it is reused by every study of a batch
     if isinstance(value, list):
         raise Exception(
         "More than one code for type Coding detected")
-    c = coding.Coding()
-    c.system = system
-    c.code = value
-    return c
+    return _shared_coding(value, system)
 
 
 def gen_codeable_concept(value_list: list, system):
-    c = codeableconcept.CodeableConcept()
-    c.coding = []
-    for _l in value_list:
-        m = gen_coding(_l, system)
-        c.coding.append(m)
-    return c
+    # shared like gen_coding, copy the result before changing it
+    return _shared_codeable_concept(tuple(value_list), system)
 
 
 def gen_bodysite_coding(bd):
 
-    bd_snomed = _get_snomed(bd, sctmapping=mapping_table)
+    bd_snomed = _get_snomed(bd, sctmapping=get_bodysite_mapping())
     c = gen_coding(
         value=bd_snomed,
-        system="http://snomed.info/sct"
+        system=SNOMED_SYS
     )
     return c
 
@@ -301,6 +356,7 @@ def gen_bodysite_coding(bd):
 
 
 def gen_coding_text_only(text):
+    from fhir.resources.R4B import coding
     c = coding.Coding()
     c.code = text
     c.userSelected = True
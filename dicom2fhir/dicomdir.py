@@ -0,0 +1,65 @@
+import logging
+import os
+from itertools import groupby
+
+from pydicom import dcmread
+from pydicom.fileset import FileSet
+
+from dicom2fhir import header
+
+# Header records from the directory records of a DICOMDIR (PS3.3 F.5).
+# Study, series and instance UIDs, SOP classes, modality and numbers come
+# from the records; the attributes they lack (BodyPartExamined, series
+# description, procedure codes, ...) are read from one file per series.
+#
+# Instance attributes are taken from each instance's own record only,
+# never from the file read for its series, so all instances of a series
+# are built alike. Image records rarely carry ImageType, so their
+# instances usually have no title; reading every file for it would give
+# up what the DICOMDIR saves.
+
+
+def find_dicomdir(path) -> str:
+    # path is the DICOMDIR file or the root of the media
+    if os.path.isdir(path):
+        path = os.path.join(path, "DICOMDIR")
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No DICOMDIR at {path}")
+    return path
+
+
+def load(path) -> FileSet:
+    return FileSet(dcmread(find_dicomdir(path)))
+
+
+def _series_key(item):
+    hdr = item[1]
+    return hdr.get("StudyInstanceUID"), hdr.get("SeriesInstanceUID")
+
+
+def _read_series(fp, selective, cache):
+    if cache is not None:
+        return next(header.read_headers([fp], selective=selective, cache=cache))[1]
+    return header._read_header_or_error(fp, selective)
+
+
+def read_headers(fileset, selective: bool = True, cache=None, stats=None):
+    # yields (path, header record) for every instance of fileset (a FileSet
+    # or the path load takes), opening only the first file of each series
+    if not isinstance(fileset, FileSet):
+        fileset = load(fileset)
+    records = ((instance.path, header.extract_header(instance)) for instance in fileset)
+    instanceKeywords = set(header.INSTANCE_KEYWORDS)
+    for _, series in groupby(records, key=_series_key):
+        base = None
+        for fp, record in series:
+            if base is None:
+                hdr = _read_series(fp, selective, cache)
+                if stats is not None:
+                    stats.count("opened")
+                if isinstance(hdr, Exception):
+                    logging.error(f"{fp}: {hdr}, using the DICOMDIR records only")
+                    hdr = {}
+                base = {k: v for k, v in hdr.items() if k not in instanceKeywords}
+            # directory records only fill what the file lacks
+            yield fp, {**record, **base}
@@ -0,0 +1,186 @@
+import logging
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+from dicom2fhir import dicom2fhirutils
+from dicom2fhir import header
+from dicom2fhir.index import ImagingStudyIndex
+
+if TYPE_CHECKING:
+    from fhir.resources.R4B import imagingstudy
+
+# Builds the same ImagingStudy as dicom2fhir._create_imaging_study and
+# friends, but as plain FHIR JSON dicts without per-object validation.
+# Keys are inserted in FHIR element order, so json.dumps of the result
+# matches ImagingStudy.json().
+
+
+def _coding(value, system):
+    # see dicom2fhirutils.coding_fragment
+    if isinstance(value, list):
+        raise Exception(
+            "More than one code for type Coding detected")
+    return dicom2fhirutils.coding_fragment(value, system)
+
+
+def _coded_concepts(concepts):
+    return [
+        {"coding": [{"system": c["system"], "code": c["code"], "display": c["display"]}]}
+        for c in concepts
+    ]
+
+
+def _started(ds, dateKeyword, timeKeyword):
+    # None without a (valid) date
+    if ds.get(dateKeyword) is None:
+        return None
+    try:
+        return dicom2fhirutils.gen_started_datetime(
+            ds[dateKeyword], ds.get(timeKeyword), ds.get("TimezoneOffsetFromUTC")).isoformat()
+    except Exception:
+        return None  # malformed date or time
+
+
+def _add_imaging_study_instance(study: dict, series: dict, ds: dict, index: ImagingStudyIndex,
+                                store=list):
+    instanceUID = ds["SOPInstanceUID"]
+    if index.has_instance(series["uid"], instanceUID):
+        logging.warning(f"SOP Instance UID {instanceUID} is not unique, skipping the instance")
+        index.stats.count("duplicate_instances")
+        return
+
+    instance = {}
+    instance["uid"] = instanceUID
+    instance["sopClass"] = _coding(
+        "urn:oid:" + ds["SOPClassUID"], dicom2fhirutils.SOP_CLASS_SYS)
+    if ds["InstanceNumber"] is not None:
+        instance["number"] = ds["InstanceNumber"]
+
+    if series["modality"]["code"] == "SR":
+        if ds.get("ConceptNameCodeSequence"):
+            instance["title"] = ds["ConceptNameCodeSequence"][0]["display"]
+    elif ds.get("ImageType") is not None:
+        instance["title"] = '\\'.join(ds["ImageType"])
+
+    instances = series.get("instance")
+    if instances is None:
+        instances = series["instance"] = store()
+    instances.append(instance)
+    index.add_instance(series["uid"], instanceUID)
+    index.stats.count("instances")
+    study["numberOfInstances"] += 1
+    series["numberOfInstances"] += 1
+
+
+def add_imaging_study_series(study: dict, ds: dict, fp, index: ImagingStudyIndex = None,
+                             store=list):
+    # store is the container type of series["instance"], see compact.py
+    if index is None:
+        index = ImagingStudyIndex(study)
+
+    seriesInstanceUID = ds["SeriesInstanceUID"]
+    selectedSeries = index.series.get(seriesInstanceUID)
+    if selectedSeries is not None:
+        _add_imaging_study_instance(study, selectedSeries, ds, index, store)
+        return
+
+    series = {}
+    extensions = header.extensions(ds, "series")
+    if extensions:
+        series["extension"] = extensions
+    series["uid"] = seriesInstanceUID
+    if ds["SeriesNumber"] is not None:
+        series["number"] = ds["SeriesNumber"]
+    series["modality"] = _coding(
+        ds["Modality"], dicom2fhirutils.ACQUISITION_MODALITY_SYS)
+    if ds.get("SeriesDescription", '') != '':
+        series["description"] = ds["SeriesDescription"]
+    series["numberOfInstances"] = 0
+
+    start = perf_counter()
+    snomed = dicom2fhirutils.get_bodysite_mapping().get(ds.get("BodyPartExamined"))
+    if snomed is not None:
+        series["bodySite"] = _coding(snomed, dicom2fhirutils.SNOMED_SYS)
+    index.stats.add_time("snomed", perf_counter() - start)
+
+    if ds.get("Laterality"):
+        series["laterality"] = {"code": ds["Laterality"], "userSelected": True}
+
+    start = perf_counter()
+    started = _started(ds, "SeriesDate", "SeriesTime")
+    if started is not None:
+        series["started"] = started
+    index.stats.add_time("datetime", perf_counter() - start)
+
+    study.setdefault("series", []).append(series)
+    index.add_series(seriesInstanceUID, series)
+    index.stats.count("series")
+    study["numberOfSeries"] += 1
+    _add_imaging_study_instance(study, series, ds, index, store)
+
+
+def create_imaging_study(ds: dict, fp, dcmDir, index: ImagingStudyIndex = None, store=list,
+                         id_strategy: str = "uuid4"):
+    if index is None:
+        index = ImagingStudyIndex()
+    study = {"resourceType": "ImagingStudy"}
+    study["id"] = dicom2fhirutils.gen_study_id(ds["StudyInstanceUID"], id_strategy)
+    extensions = header.extensions(ds, "study")
+    if extensions:
+        study["extension"] = extensions
+    study["identifier"] = [
+        {
+            "use": "usual",
+            "type": dicom2fhirutils.codeable_concept_fragment(
+                (dicom2fhirutils.TERMINOLOGY_CODING_SYS_CODE_ACCESSION,),
+                dicom2fhirutils.TERMINOLOGY_CODING_SYS),
+            "value": ds["AccessionNumber"],
+        },
+        {"system": "urn:dicom:uid", "value": "urn:oid:" + ds["StudyInstanceUID"]},
+    ]
+    study["status"] = "available"
+
+    patID9 = str(ds["PatientID"])[:9]
+    study["subject"] = {
+        "reference": dicom2fhirutils.gen_patient_reference(patID9),
+        "identifier": {
+            "type": dicom2fhirutils.codeable_concept_fragment(
+                (dicom2fhirutils.TERMINOLOGY_CODING_SYS_CODE_MRN,),
+                dicom2fhirutils.TERMINOLOGY_CODING_SYS),
+            "system": dicom2fhirutils.PATIENT_ID_SYS,
+            "value": patID9,
+        },
+    }
+
+    start = perf_counter()
+    started = _started(ds, "StudyDate", "StudyTime")
+    if started is not None:
+        study["started"] = started
+    index.stats.add_time("datetime", perf_counter() - start)
+
+    study["numberOfSeries"] = 0
+    study["numberOfInstances"] = 0
+
+    procedures = _coded_concepts(ds.get("ProcedureCodeSequence", []))
+    for p in procedures:
+        p["text"] = p["coding"][0]["display"]
+    if procedures:
+        study["procedureCode"] = procedures
+
+    reason = ds.get("ReasonForRequestedProcedureCodeSequence")
+    if reason:
+        study["reasonCode"] = _coded_concepts(reason)
+    elif "ReasonForTheRequestedProcedure" in ds:
+        study["reasonCode"] = [{"text": ds["ReasonForTheRequestedProcedure"]}]
+
+    if ds.get("StudyDescription", '') != '':
+        study["description"] = ds["StudyDescription"]
+
+    add_imaging_study_series(study, ds, fp, index, store)
+    return study, index
+
+
+def validate(study: dict) -> "imagingstudy.ImagingStudy":
+    # single validation pass over the finished study
+    from fhir.resources.R4B import imagingstudy
+    return imagingstudy.ImagingStudy.parse_obj(study)
@@ -0,0 +1,120 @@
+import os
+
+# Candidate DICOM files below a directory. The tree is walked with
+# os.scandir and paths are yielded as they are found; every file is
+# checked against the extension and size filters (from the directory
+# entry, without opening it) and then sniffed for the 128 byte preamble
+# and "DICM" prefix of PS3.10 files. Rejected files are only counted in
+# ConversionStats ("rejected" and "rejected_<reason>"), they never reach
+# dcmread.
+
+PREAMBLE_LENGTH = 128
+MAGIC = b"DICM"
+
+# value representations, to recognize explicit VR files without preamble
+_VRS = frozenset(vr.encode("ascii") for vr in (
+    "AE", "AS", "AT", "CS", "DA", "DS", "DT", "FD", "FL", "IS", "LO", "LT", "OB", "OD",
+    "OF", "OL", "OV", "OW", "PN", "SH", "SL", "SQ", "SS", "ST", "SV", "TM", "UC", "UI",
+    "UL", "UN", "UR", "US", "UT", "UV"))
+
+
+def _normalize_extensions(extensions):
+    if extensions is None:
+        return None
+    return frozenset(e.lower() if not e or e.startswith(".") else "." + e.lower()
+                     for e in extensions)
+
+
+def _starts_like_dataset(data: bytes) -> bool:
+    # a little endian data set without preamble and file meta information
+    # starts with a group 0x0002 or 0x0008 element
+    if len(data) < 8 or data[0:2] not in (b"\x02\x00", b"\x08\x00"):
+        return False
+    if data[4:6] in _VRS:
+        return True
+    # implicit VR: a 4 byte length, identifying elements are short
+    return int.from_bytes(data[4:8], "little") < 0x10000
+
+
+def looks_like_dicom(data: bytes, allow_no_preamble: bool = False) -> bool:
+    # data is the start of a file; allow_no_preamble also accepts bare
+    # data sets, as written by some older modalities
+    if data[PREAMBLE_LENGTH:PREAMBLE_LENGTH + len(MAGIC)] == MAGIC:
+        return True
+    return allow_no_preamble and _starts_like_dataset(data)
+
+
+def sniff(fp, allow_no_preamble: bool = False) -> bool:
+    # True if the file at fp looks like DICOM
+    with open(fp, "rb") as fh:
+        data = fh.read(PREAMBLE_LENGTH + len(MAGIC))
+    return looks_like_dicom(data, allow_no_preamble)
+
+
+class Discovery:
+    # extensions only accepts files with these extensions ("" for files
+    # without one), exclude_extensions rejects them; sizes are in bytes.
+    # sniff=False passes every file that matches the filters
+
+    def __init__(self, extensions=None, exclude_extensions=None, min_size: int = None,
+                 max_size: int = None, sniff: bool = True, allow_no_preamble: bool = False):
+        self.extensions = _normalize_extensions(extensions)
+        self.exclude_extensions = _normalize_extensions(exclude_extensions) or frozenset()
+        self.min_size = min_size
+        self.max_size = max_size
+        self.sniff = sniff
+        self.allow_no_preamble = allow_no_preamble
+
+    def _reject(self, entry) -> str:
+        # the reason entry is rejected, or None
+        ext = os.path.splitext(entry.name)[1].lower()
+        if ext in self.exclude_extensions or (self.extensions is not None and ext not in self.extensions):
+            return "extension"
+        if self.min_size is not None or self.max_size is not None:
+            size = entry.stat().st_size
+            if (self.min_size is not None and size < self.min_size) or (
+                    self.max_size is not None and size > self.max_size):
+                return "size"
+        if self.sniff:
+            try:
+                if not sniff(entry.path, self.allow_no_preamble):
+                    return "magic"
+            except OSError:
+                return "unreadable"
+        return None
+
+    def files(self, root, stats=None):
+        # yields the accepted paths below root, files of a directory
+        # before those of its subdirectories like os.walk
+        dirs = [os.fspath(root)]
+        while dirs:
+            subdirs = []
+            try:
+                with os.scandir(dirs.pop()) as it:
+                    entries = list(it)
+            except OSError:
+                continue  # like os.walk, unreadable directories are skipped
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                reason = self._reject(entry)
+                if reason is None:
+                    yield entry.path
+                elif stats is not None:
+                    stats.count("rejected")
+                    stats.count("rejected_" + reason)
+            dirs.extend(reversed(subdirs))
+
+
+DEFAULT = Discovery()
+
+
+def discover(root, stats=None, **kwargs):
+    # discover(root, extensions=[".dcm", ""]) is Discovery(...).files(root)
+    return (Discovery(**kwargs) if kwargs else DEFAULT).files(root, stats)
@@ -0,0 +1,326 @@
+from collections import deque
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from pydicom import dcmread
+from pydicom.datadict import keyword_for_tag
+from pydicom.multival import MultiValue
+from pydicom.tag import Tag
+from pydicom.valuerep import IS
+
+from dicom2fhir import dicom2fhirutils
+
+LEVELS = ("study", "series", "instance")
+
+
+def _value(value):
+    # plain python values, so records pickle and serialize cheaply
+    if isinstance(value, MultiValue):
+        return [str(v) for v in value]
+    if isinstance(value, IS):
+        return int(value)
+    if isinstance(value, str):
+        return str(value)
+    return value
+
+
+def _strings(value):
+    # multi-valued attributes as a list even with a single value
+    if isinstance(value, MultiValue):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+class Field:
+    # one attribute of the header record: the DICOM keyword (or tag), its
+    # level, the converter of the element value and its key in the record
+    # (the keyword by default). extension, for study and series fields,
+    # turns the value into a FHIR extension of the ImagingStudy or series
+
+    __slots__ = ("tag", "level", "convert", "key", "extension")
+
+    def __init__(self, tag, level: str, convert=_value, key: str = None, extension=None):
+        if level not in LEVELS:
+            raise ValueError("Unknown level '%s', expected one of %s" % (level, list(LEVELS)))
+        if extension is not None and level == "instance":
+            raise ValueError("Instance fields cannot have an extension")
+        self.tag = Tag(tag)
+        self.level = level
+        self.convert = convert
+        self.key = key or keyword_for_tag(self.tag)
+        if not self.key:
+            raise ValueError("Field %s needs a key" % self.tag)
+        self.extension = extension
+
+    def __repr__(self):
+        return "Field(%s, %r, key=%r)" % (self.tag, self.level, self.key)
+
+
+def coded_extension(url, system):
+    # extension factory: the values as a CodeableConcept of system
+    def extension(value):
+        values = tuple(value) if isinstance(value, list) else (value,)
+        return {"url": url,
+                "valueCodeableConcept": dicom2fhirutils.codeable_concept_fragment(values, system)}
+    return extension
+
+
+def decimal_extension(url):
+    def extension(value):
+        return {"url": url, "valueDecimal": value}
+    return extension
+
+
+# attributes the ImagingStudy assembly reads from every file
+FIELDS = (
+    Field("StudyInstanceUID", "study"),
+    Field("StudyDescription", "study"),
+    Field("AccessionNumber", "study"),
+    Field("PatientID", "study"),
+    Field("IssuerOfPatientID", "study"),
+    Field("StudyDate", "study"),
+    Field("StudyTime", "study"),
+    Field("TimezoneOffsetFromUTC", "study"),
+    Field("ProcedureCodeSequence", "study", dicom2fhirutils.dcm_coded_concept),
+    Field("ReasonForRequestedProcedureCodeSequence", "study", dicom2fhirutils.dcm_coded_concept),
+    Field("ReasonForTheRequestedProcedure", "study"),
+    Field("SeriesInstanceUID", "series"),
+    Field("SeriesDescription", "series"),
+    Field("SeriesNumber", "series"),
+    Field("Modality", "series"),
+    Field("SeriesDate", "series"),
+    Field("SeriesTime", "series"),
+    Field("BodyPartExamined", "series"),
+    Field("Laterality", "series"),
+    Field("SOPInstanceUID", "instance"),
+    Field("SOPClassUID", "instance"),
+    Field("InstanceNumber", "instance"),
+    Field("ImageType", "instance"),
+    Field("ConceptNameCodeSequence", "instance", dicom2fhirutils.dcm_coded_concept),
+)
+
+# optional MR series attributes, written as series extensions; sites with
+# their own profiles build Fields with their extension urls instead
+MR_EXTENSION_URL = "https://dicom.nema.org/medical/dicom/current/output/chtml/part03/sect_C.8.3.html#"
+MR_FIELDS = (
+    Field("ScanningSequence", "series", _strings, extension=coded_extension(
+        MR_EXTENSION_URL + "ScanningSequence", dicom2fhirutils.SCANNING_SEQUENCE_SYS)),
+    Field("SequenceVariant", "series", _strings, extension=coded_extension(
+        MR_EXTENSION_URL + "SequenceVariant", dicom2fhirutils.SCANNING_VARIANT_SYS)),
+    Field("EchoTime", "series", float, extension=decimal_extension(
+        MR_EXTENSION_URL + "EchoTime")),
+)
+
+
+class Extractor:
+    # a list of Fields compiled once: every record is read by tag from the
+    # elements present in the data set, without keyword lookups and
+    # without a KeyError per missing attribute
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        keys = [f.key for f in self.fields]
+        duplicates = sorted({k for k in keys if keys.count(k) > 1})
+        if duplicates:
+            raise ValueError("Duplicate fields: " + ", ".join(duplicates))
+        self.tags = sorted({f.tag for f in self.fields})
+        self.keywords = {level: [f.key for f in self.fields if f.level == level]
+                         for level in LEVELS}
+        self._items = tuple((f.tag, f.key, f.convert) for f in self.fields)
+        self._extensions = {level: tuple((f.key, f.extension) for f in self.fields
+                                         if f.level == level and f.extension is not None)
+                            for level in LEVELS}
+
+    def __call__(self, ds) -> dict:
+        # ds is a pydicom Dataset, or anything with "in" and [tag] such as
+        # a DICOMDIR FileInstance
+        present = ds.keys() if hasattr(ds, "keys") else ds
+        header = {}
+        for tag, key, convert in self._items:
+            if tag in present:
+                try:
+                    header[key] = convert(ds[tag].value)
+                except Exception:
+                    pass  # malformed element, treated as missing
+        return header
+
+    def extensions(self, hdr: dict, level: str) -> list:
+        return [extension(hdr[key]) for key, extension in self._extensions[level] if key in hdr]
+
+
+def set_fields(fields):
+    # installs the attributes read from every file, e.g.
+    # set_fields(FIELDS + MR_FIELDS); worker processes started with the
+    # "spawn" method have to call it as well
+    global EXTRACTOR, STUDY_KEYWORDS, SERIES_KEYWORDS, INSTANCE_KEYWORDS
+    global HEADER_KEYWORDS, HEADER_TAGS
+    EXTRACTOR = Extractor(fields)
+    STUDY_KEYWORDS = EXTRACTOR.keywords["study"]
+    SERIES_KEYWORDS = EXTRACTOR.keywords["series"]
+    INSTANCE_KEYWORDS = EXTRACTOR.keywords["instance"]
+    HEADER_KEYWORDS = STUDY_KEYWORDS + SERIES_KEYWORDS + INSTANCE_KEYWORDS
+    # selective reads parse only these elements and seek past everything else
+    HEADER_TAGS = EXTRACTOR.tags
+
+
+set_fields(FIELDS)
+
+EXECUTORS = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor,
+}
+
+
+def extract_header(ds) -> dict:
+    # header records are plain dicts (keyword -> python value), so they can
+    # cross process boundaries cheaply and be merged by the assembly step
+    return EXTRACTOR(ds)
+
+
+def extensions(hdr: dict, level: str) -> list:
+    # the FHIR extensions of the study or series fields in a header record
+    return EXTRACTOR.extensions(hdr, level)
+
+
+def read_header(fp, selective: bool = True) -> dict:
+    # selective=False parses the whole header up to the pixel data; fp is
+    # a path, a file object or a sources.Member
+    if hasattr(fp, "read_header"):
+        return fp.read_header(selective)
+    specific_tags = HEADER_TAGS if selective else None
+    with dcmread(fp, stop_before_pixels=True, force=True,
+                 specific_tags=specific_tags) as ds:
+        return extract_header(ds)
+
+
+def read_header_prefix(data, selective: bool = True) -> dict:
+    # header record parsed from the first bytes of a file, None unless the
+    # pixel data starts within data; pydicom silently returns what it got
+    # from a header that is cut off
+    fh = BytesIO(data)
+    specific_tags = HEADER_TAGS if selective else None
+    try:
+        ds = dcmread(fh, stop_before_pixels=True, force=True,
+                     specific_tags=specific_tags)
+        hdr = extract_header(ds)
+    except Exception:
+        return None
+    if fh.tell() >= len(data):
+        return None
+    return hdr
+
+
+def _read_header_or_error(fp, selective=True):
+    try:
+        return read_header(fp, selective)
+    except Exception as e:
+        return e
+
+
+def _read_chunk(chunk, selective=True):
+    return [(fp, _read_header_or_error(fp, selective)) for fp in chunk]
+
+
+def _chunks(files, size):
+    chunk = []
+    for fp in files:
+        chunk.append(fp)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _read_headers_cached(files, cache, workers, executor, chunksize, selective):
+    # cache hits come out as soon as the files before them are done; misses
+    # are read in chunks by one pool for the whole call, with at most
+    # 2 * workers chunks in flight as in read_headers
+    if workers is None or workers <= 1:
+        for fp in files:
+            hdr = cache.get(fp)
+            if hdr is None:
+                hdr = _read_header_or_error(fp, selective)
+                cache.put(fp, hdr)
+            yield fp, hdr
+        cache.flush()
+        return
+
+    if executor not in EXECUTORS:
+        raise ValueError(
+            "Unknown executor '%s', expected one of %s" % (executor, sorted(EXECUTORS)))
+
+    # at most this many files wait for the read of an earlier one
+    window = max(1, chunksize * 2 * workers)
+    with EXECUTORS[executor](max_workers=workers) as pool:
+        order = deque()     # [fp, header] in the order of files, None until read
+        inflight = deque()  # (entries, future) per submitted chunk of misses
+        chunk = []
+
+        def submit():
+            inflight.append((list(chunk), pool.submit(
+                _read_chunk, [entry[0] for entry in chunk], selective)))
+            chunk.clear()
+
+        def collect():
+            entries, future = inflight.popleft()
+            for entry, (fp, hdr) in zip(entries, future.result()):
+                cache.put(fp, hdr)
+                entry[1] = hdr
+
+        def done():
+            while order and order[0][1] is not None:
+                fp, hdr = order.popleft()
+                yield fp, hdr
+
+        for fp in files:
+            entry = [fp, cache.get(fp)]
+            order.append(entry)
+            if entry[1] is None:
+                chunk.append(entry)
+                if len(chunk) >= chunksize:
+                    submit()
+                    if len(inflight) >= 2 * workers:
+                        collect()
+            while len(order) > window and order[0][1] is None:
+                # the oldest miss is either in flight or in the open chunk
+                if not inflight:
+                    submit()
+                collect()
+            yield from done()
+        if chunk:
+            submit()
+        while inflight:
+            collect()
+            yield from done()
+    cache.flush()
+
+
+def read_headers(files, workers: int = 1, executor: str = "thread", chunksize: int = 16,
+                 selective: bool = True, cache=None):
+    # yields (fp, header record or the exception raised while reading it)
+    # in the order of files; files may be a lazy iterable, at most
+    # 2 * workers chunks are in flight at a time. With a HeaderCache only
+    # new or changed files are opened.
+    if cache is not None:
+        yield from _read_headers_cached(
+            files, cache, workers, executor, chunksize, selective)
+        return
+
+    if workers is None or workers <= 1:
+        for fp in files:
+            yield fp, _read_header_or_error(fp, selective)
+        return
+
+    if executor not in EXECUTORS:
+        raise ValueError(
+            "Unknown executor '%s', expected one of %s" % (executor, sorted(EXECUTORS)))
+
+    with EXECUTORS[executor](max_workers=workers) as pool:
+        pending = deque()
+        for chunk in _chunks(files, chunksize):
+            pending.append(pool.submit(_read_chunk, chunk, selective))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+
+from dicom2fhir import compact
+from dicom2fhir import dicom2fhir
+from dicom2fhir import header
+from dicom2fhir.index import ImagingStudyIndex, _get
+from dicom2fhir.stats import ConversionStats
+
+# Late instances of an already converted study. A StudyUpdater indexes the
+# study once; every update then adds only the new files through the
+# backend's add_series (duplicates are found in the index) and returns the
+# change as a JSON Patch (RFC 6902) against the study as it was before.
+
+
+def study_instance_uid(study) -> str:
+    # from the urn:dicom:uid identifier written by the converters
+    for idf in _get(study, "identifier") or []:
+        if _get(idf, "system") == "urn:dicom:uid":
+            return _get(idf, "value")[len("urn:oid:"):]
+    raise ValueError("ImagingStudy has no urn:dicom:uid identifier")
+
+
+def _backend(study) -> str:
+    if not isinstance(study, dict):
+        return "model"
+    return "compact" if compact.is_compact(study) else "dict"
+
+
+def _plain(obj):
+    # FHIR JSON of a model or a (copied) dict, InstanceStores materialized
+    if not isinstance(obj, dict):
+        return json.loads(obj.json())
+    obj = {k: list(v) if isinstance(v, compact.InstanceStore) else v for k, v in obj.items()}
+    return json.loads(json.dumps(obj))
+
+
+def _instances(series):
+    return _get(series, "instance") or []
+
+
+class StudyUpdater:
+    # study is an ImagingStudy model, a dict from the dict or compact
+    # backend, or its JSON text (updated as a dict). Indexing the study is
+    # O(study), each update after that O(new files)
+
+    def __init__(self, study, stats: ConversionStats = None):
+        if isinstance(study, (str, bytes)):
+            study = json.loads(study)
+        self.study = study
+        self.backend = _backend(study)
+        self.studyInstanceUID = study_instance_uid(study)
+        self.stats = stats if stats is not None else ConversionStats()
+        self.index = ImagingStudyIndex(study, self.stats)
+        # series are indexed in study order
+        self._positions = {uid: n for n, uid in enumerate(self.index.series)}
+
+    def update(self, files, workers: int = 1, executor: str = "thread", cache=None,
+               discovery=None) -> list:
+        # adds the instances of files (paths, sources.Member or a directory)
+        # that are not in the study yet and returns the JSON Patch
+        _, add_series = dicom2fhir._get_backend(self.backend)
+        if isinstance(files, (str, os.PathLike)):
+            files = dicom2fhir._input_files(files, discovery=discovery, stats=self.stats)
+        counts = (_get(self.study, "numberOfSeries"), _get(self.study, "numberOfInstances"))
+        grown = {}  # instances of existing series before the update
+        created = []
+        known = len(self._positions)
+        acc = (self.study, self.index)
+        headers = header.read_headers(files, workers=workers, executor=executor, cache=cache)
+        for fp, ds in self.stats.timed(headers, "read"):
+            uid = dicom2fhir._study_uid(fp, ds, self.stats)
+            if uid is None:
+                continue
+            if uid != self.studyInstanceUID:
+                logging.error(f"{fp} belongs to study {uid}, not {self.studyInstanceUID}")
+                self.stats.count("errors")
+                self.stats.file_done(fp, False)
+                continue
+            seriesUID = ds.get("SeriesInstanceUID")
+            if self._positions.get(seriesUID, known) < known and seriesUID not in grown:
+                grown[seriesUID] = len(_instances(self.index.series[seriesUID]))
+            dicom2fhir._assemble(None, add_series, acc, ds, fp, None, self.stats)
+            if seriesUID in self.index.series and seriesUID not in self._positions:
+                self._positions[seriesUID] = len(self._positions)
+                created.append(seriesUID)
+        return self._patch(counts, grown, created)
+
+    def _patch(self, counts, grown, created) -> list:
+        ops = []
+        for seriesUID, start in grown.items():
+            series = self.index.series[seriesUID]
+            instances = _instances(series)
+            if len(instances) == start:
+                continue
+            path = "/series/%d" % self._positions[seriesUID]
+            for i in range(start, len(instances)):
+                ops.append({"op": "add", "path": path + "/instance/-", "value": _plain(instances[i])})
+            ops.append({"op": "replace", "path": path + "/numberOfInstances",
+                        "value": _get(series, "numberOfInstances")})
+        for seriesUID in created:
+            ops.append({"op": "add", "path": "/series/-", "value": _plain(self.index.series[seriesUID])})
+        for name, before in zip(("numberOfSeries", "numberOfInstances"), counts):
+            after = _get(self.study, name)
+            if after != before:
+                ops.append({"op": "replace", "path": "/" + name, "value": after})
+        return ops
+
+
+def update_study(study, files, **kwargs):
+    # (updated study, JSON Patch); see StudyUpdater for repeated updates
+    updater = StudyUpdater(study)
+    patch = updater.update(files, **kwargs)
+    return updater.study, patch
@@ -0,0 +1,33 @@
+from dicom2fhir.stats import ConversionStats
+
+
+class ImagingStudyIndex:
+    # UID-keyed lookups kept next to the ImagingStudy being assembled (model
+    # or dict), so series selection and duplicate detection are O(1) per
+    # file, and the stats the assembly steps report to
+
+    def __init__(self, study=None, stats: ConversionStats = None):
+        self.series = {}
+        self.instances = {}
+        self.stats = stats if stats is not None else ConversionStats()
+        if study is not None:
+            for s in _get(study, "series") or []:
+                self.add_series(_get(s, "uid"), s)
+                for i in _get(s, "instance") or []:
+                    self.add_instance(_get(s, "uid"), _get(i, "uid"))
+
+    def add_series(self, seriesUID, series):
+        self.series[seriesUID] = series
+        self.instances.setdefault(seriesUID, set())
+
+    def has_instance(self, seriesUID, instanceUID) -> bool:
+        return instanceUID in self.instances.get(seriesUID, ())
+
+    def add_instance(self, seriesUID, instanceUID):
+        self.instances.setdefault(seriesUID, set()).add(instanceUID)
+
+
+def _get(obj, name):
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name)
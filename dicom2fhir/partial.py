@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import os
+
+from dicom2fhir import dicom2fhir
+from dicom2fhir import discovery
+from dicom2fhir import header
+from dicom2fhir.stats import ConversionStats
+
+# Map-reduce conversion. Every shard of a file list is read into one
+# PartialStudy per StudyInstanceUID; partials are plain JSON, can be merged
+# in any order and grouping, and are materialized into an ImagingStudy
+# once all shards are merged. The result does not depend on the sharding:
+# conflicting values resolve to the smallest one (by canonical JSON) and
+# series and instances are ordered by number and UID.
+
+PARTIAL_VERSION = 1
+
+
+def _canonical(value) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def _merge_fields(target: dict, source: dict, conflicts: dict, prefix: str):
+    for keyword, value in source.items():
+        if keyword not in target:
+            target[keyword] = value
+            continue
+        old = target[keyword]
+        if old == value:
+            continue
+        key = prefix + keyword
+        seen = set(conflicts.get(key, ())) | {_canonical(old), _canonical(value)}
+        conflicts[key] = sorted(seen)
+        target[keyword] = min((old, value), key=_canonical)
+
+
+def _merge_conflicts(target: dict, source: dict):
+    for key, values in source.items():
+        target[key] = sorted(set(target.get(key, ())) | set(values))
+
+
+class PartialStudy:
+    # study fields, series fields by SeriesInstanceUID and instance fields
+    # by SeriesInstanceUID and SOPInstanceUID; records counts every header
+    # added, so duplicates = records - instances
+
+    def __init__(self, studyInstanceUID: str):
+        self.studyInstanceUID = studyInstanceUID
+        self.study = {}
+        self.series = {}
+        self.instances = {}
+        self.conflicts = {}
+        self.records = 0
+
+    def add(self, ds: dict):
+        # ds is a header record of this study
+        if ds["StudyInstanceUID"] != self.studyInstanceUID:
+            raise ValueError(
+                f"{ds['StudyInstanceUID']} does not belong to study {self.studyInstanceUID}")
+        seriesUID = ds["SeriesInstanceUID"]
+        instanceUID = ds["SOPInstanceUID"]
+        _merge_fields(self.study, {k: ds[k] for k in header.STUDY_KEYWORDS if k in ds},
+                      self.conflicts, "")
+        _merge_fields(self.series.setdefault(seriesUID, {}),
+                      {k: ds[k] for k in header.SERIES_KEYWORDS if k in ds},
+                      self.conflicts, seriesUID + "/")
+        _merge_fields(self.instances.setdefault(seriesUID, {}).setdefault(instanceUID, {}),
+                      {k: ds[k] for k in header.INSTANCE_KEYWORDS if k in ds},
+                      self.conflicts, seriesUID + "/" + instanceUID + "/")
+        self.records += 1
+
+    def merge(self, other: "PartialStudy") -> "PartialStudy":
+        # in place, associative and commutative
+        if other.studyInstanceUID != self.studyInstanceUID:
+            raise ValueError(
+                f"Cannot merge study {other.studyInstanceUID} into {self.studyInstanceUID}")
+        _merge_conflicts(self.conflicts, other.conflicts)
+        _merge_fields(self.study, other.study, self.conflicts, "")
+        for seriesUID, fields in other.series.items():
+            _merge_fields(self.series.setdefault(seriesUID, {}), fields,
+                          self.conflicts, seriesUID + "/")
+        for seriesUID, instances in other.instances.items():
+            target = self.instances.setdefault(seriesUID, {})
+            for instanceUID, fields in instances.items():
+                _merge_fields(target.setdefault(instanceUID, {}), fields,
+                              self.conflicts, seriesUID + "/" + instanceUID + "/")
+        self.records += other.records
+        return self
+
+    @property
+    def duplicates(self) -> int:
+        return self.records - sum(len(i) for i in self.instances.values())
+
+    def headers(self):
+        # one header record per distinct instance, in output order
+        def series_key(uid):
+            number = self.series[uid].get("SeriesNumber")
+            return (number is None, number or 0, uid)
+
+        for seriesUID in sorted(self.series, key=series_key):
+            instances = self.instances.get(seriesUID, {})
+
+            def instance_key(uid):
+                number = instances[uid].get("InstanceNumber")
+                return (number is None, number or 0, uid)
+
+            for instanceUID in sorted(instances, key=instance_key):
+                yield {**self.study, **self.series[seriesUID], **instances[instanceUID]}
+
+    def to_study(self, backend: str = "model", validate: bool = False, stats=None,
+                 id_strategy: str = "uuid4"):
+        create_study, add_series = dicom2fhir._get_backend(backend)
+        for key, values in sorted(self.conflicts.items()):
+            logging.warning(f"{self.studyInstanceUID}: conflicting {key} {values}, using {values[0]}")
+        if stats is None:
+            stats = ConversionStats()
+        acc = None
+        for ds in self.headers():
+            acc = dicom2fhir._assemble(create_study, add_series, acc, ds, None, None, stats,
+                                       id_strategy)
+        if acc is None:
+            return None
+        return dicom2fhir._finish(acc[0], backend, validate)
+
+    def to_dict(self) -> dict:
+        return {
+            "version": PARTIAL_VERSION,
+            "studyInstanceUID": self.studyInstanceUID,
+            "study": self.study,
+            "series": self.series,
+            "instances": self.instances,
+            "conflicts": self.conflicts,
+            "records": self.records,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PartialStudy":
+        if data.get("version") != PARTIAL_VERSION:
+            raise ValueError(f"Unsupported partial study version {data.get('version')}")
+        partial = cls(data["studyInstanceUID"])
+        partial.study = data["study"]
+        partial.series = data["series"]
+        partial.instances = data["instances"]
+        partial.conflicts = data["conflicts"]
+        partial.records = data["records"]
+        return partial
+
+
+def read_partials(files, workers: int = 1, executor: str = "thread", cache=None) -> dict:
+    # the map step: StudyInstanceUID -> PartialStudy for the files of a shard
+    partials = {}
+    for fp, ds in header.read_headers(files, workers=workers, executor=executor, cache=cache):
+        try:
+            if isinstance(ds, Exception):
+                raise ds
+            uid = ds["StudyInstanceUID"]
+            if uid not in partials:
+                partials[uid] = PartialStudy(uid)
+            partials[uid].add(ds)
+        except Exception as e:
+            logging.error(f"{fp}: {e}")
+    return partials
+
+
+def merge_partials(shards) -> dict:
+    # the reduce step over the results of read_partials or load_partials
+    merged = {}
+    for partials in shards:
+        for uid, partial in partials.items():
+            if uid in merged:
+                merged[uid].merge(partial)
+            else:
+                # a copy, the partials of shards are left unchanged
+                merged[uid] = PartialStudy(uid).merge(partial)
+    return merged
+
+
+def dump_partials(partials: dict, path):
+    # one partial study per line
+    with open(path, "w") as fh:
+        for uid in sorted(partials):
+            fh.write(json.dumps(partials[uid].to_dict(), separators=(",", ":")))
+            fh.write("\n")
+
+
+def load_partials(path) -> dict:
+    partials = {}
+    with open(path) as fh:
+        for line in fh:
+            if line.strip():
+                partial = PartialStudy.from_dict(json.loads(line))
+                partials[partial.studyInstanceUID] = partial
+    return partials
+
+
+def _shard_of(fp, n_shards):
+    digest = hashlib.sha1(os.fsencode(fp)).digest()
+    return int.from_bytes(digest[:8], "big") % n_shards
+
+
+def partition(files, n_shards: int, strategy: str = "hash") -> list:
+    # splits files into n_shards lists: "hash" by path (stable across runs
+    # and list orders), "contiguous" in runs of consecutive files, or
+    # "round_robin"
+    if n_shards < 1:
+        raise ValueError("n_shards must be at least 1")
+    files = list(files)
+    shards = [[] for _ in range(n_shards)]
+    if strategy == "hash":
+        for fp in files:
+            shards[_shard_of(fp, n_shards)].append(fp)
+    elif strategy == "contiguous":
+        size, extra = divmod(len(files), n_shards)
+        start = 0
+        for n in range(n_shards):
+            end = start + size + (n < extra)
+            shards[n] = files[start:end]
+            start = end
+    elif strategy == "round_robin":
+        for n, fp in enumerate(files):
+            shards[n % n_shards].append(fp)
+    else:
+        raise ValueError(f"Unknown strategy '{strategy}', expected hash, contiguous or round_robin")
+    return shards
+
+
+def partition_manifest(manifest, n_shards: int, out_dir, strategy: str = "hash",
+                       dcmDir=None) -> list:
+    # writes shard-NNNN.txt manifests to out_dir and returns their paths;
+    # manifest is a directory, a manifest file or an iterable of paths
+    if isinstance(manifest, (str, os.PathLike)) and os.path.isdir(manifest):
+        files = discovery.discover(manifest)
+    else:
+        files = dicom2fhir._read_manifest(manifest, dcmDir)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for n, shard in enumerate(partition(files, n_shards, strategy)):
+        path = os.path.join(out_dir, "shard-%04d.txt" % n)
+        with open(path, "w") as fh:
+            for fp in shard:
+                fh.write(fp + "\n")
+        paths.append(path)
+    return paths
@@ -0,0 +1,93 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from dicom2fhir import discovery
+from dicom2fhir import header
+from dicom2fhir import sources
+
+# Read-ahead for high latency storage (NFS, object store mounts). A pool
+# of threads reads the first header_bytes of upcoming files while the
+# current one is parsed; the parser gets the bytes as a FileMember and
+# only goes back to the file when the header does not end within them.
+# Reads are issued in input order and at most memory_budget bytes are
+# read ahead or waiting for the parser.
+
+DEFAULT_THREADS = 8
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+
+
+class FileMember(sources.Member):
+    # the first bytes of a file on disk; os.fspath(member) is its path, so
+    # header caches key it like the path itself
+
+    __slots__ = ()
+
+    def __fspath__(self):
+        return self.name
+
+    def read_header(self, selective: bool = True) -> dict:
+        if self.complete:
+            return header.read_header(BytesIO(self.data), selective)
+        hdr = header.read_header_prefix(self.data, selective)
+        if hdr is not None:
+            return hdr
+        # a header longer than the prefix, read on from the file; pixel
+        # data is still skipped
+        return header.read_header(self.name, selective)
+
+
+def _read_prefix(fp, header_bytes, sniff, allow_no_preamble):
+    # FileMember, None if sniffing rejects the file, fp itself if it
+    # cannot be read so the parser reports the error
+    try:
+        with open(fp, "rb") as fh:
+            data = fh.read(header_bytes)
+            size = os.fstat(fh.fileno()).st_size
+    except OSError:
+        return fp
+    if sniff and not discovery.looks_like_dicom(data, allow_no_preamble):
+        return None
+    return FileMember(os.fspath(fp), data, size <= header_bytes)
+
+
+def prefetch(files, threads: int = DEFAULT_THREADS, header_bytes: int = sources.HEADER_BYTES,
+             memory_budget: int = DEFAULT_MEMORY_BUDGET, sniff: bool = False,
+             allow_no_preamble: bool = False, stats=None):
+    # yields a FileMember per path of files, in order; other items (such
+    # as the sources.Member of an archive) are passed on as they are.
+    # sniff=True rejects files without the DICOM magic like discovery
+    # does, counting them in stats
+    if threads < 1:
+        raise ValueError("threads must be at least 1")
+    # every pending read holds at most header_bytes
+    depth = max(1, memory_budget // header_bytes)
+    pool = ThreadPoolExecutor(max_workers=threads)
+    pending = deque()
+
+    def ready(limit):
+        # the oldest results, until at most limit reads are pending
+        while len(pending) > limit:
+            item = pending.popleft()
+            member = item[0] if isinstance(item, tuple) else item.result()
+            if member is not None:
+                yield member
+            elif stats is not None:
+                stats.count("rejected")
+                stats.count("rejected_magic")
+
+    try:
+        for fp in files:
+            if isinstance(fp, (str, os.PathLike)):
+                pending.append(pool.submit(_read_prefix, fp, header_bytes, sniff, allow_no_preamble))
+            else:
+                pending.append((fp,))
+            yield from ready(depth - 1)
+        yield from ready(0)
+    finally:
+        # cancel_futures needs Python 3.9
+        for item in pending:
+            if not isinstance(item, tuple):
+                item.cancel()
+        pool.shutdown(wait=True)
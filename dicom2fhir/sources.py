@@ -0,0 +1,126 @@
+import functools
+import mmap
+import os
+import tarfile
+import zipfile
+from io import BytesIO
+
+from dicom2fhir import header
+
+# Input adapters: DICOM files inside ZIP and tar archives, in memory
+# buffers or memory-mapped files, read without extracting them to disk.
+# Each file becomes a Member holding only its first HEADER_BYTES; the rest
+# is loaded only for headers that do not end within them.
+
+HEADER_BYTES = 256 * 1024
+
+
+class Member:
+    # one DICOM file of a source; str(member) is its name. reload returns
+    # the whole file and must be picklable for executor="process"
+
+    __slots__ = ("name", "data", "complete", "reload")
+
+    def __init__(self, name, data, complete: bool, reload=None):
+        self.name = name
+        self.data = data
+        self.complete = complete
+        self.reload = reload
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return "Member(%r)" % self.name
+
+    def read_header(self, selective: bool = True) -> dict:
+        if not self.complete:
+            hdr = header.read_header_prefix(self.data, selective)
+            if hdr is not None:
+                return hdr
+            self.data, self.complete = self.reload(), True
+        return header.read_header(BytesIO(self.data), selective)
+
+
+def _read_zip_member(path, name):
+    with zipfile.ZipFile(path) as zf:
+        return zf.read(name)
+
+
+def _read_tar_member(path, name):
+    with tarfile.open(path) as tf:
+        return tf.extractfile(name).read()
+
+
+def _read_file(path):
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+def zip_members(path, header_bytes: int = HEADER_BYTES):
+    # members are decompressed only as far as header_bytes
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            with zf.open(info) as fh:
+                data = fh.read(header_bytes)
+            yield Member(os.path.join(path, info.filename), data,
+                         info.file_size <= header_bytes,
+                         functools.partial(_read_zip_member, path, info.filename))
+
+
+def tar_members(path, header_bytes: int = HEADER_BYTES):
+    # plain or compressed tar files; compressed streams are still
+    # decompressed member after member, but nothing is written to disk
+    with tarfile.open(path) as tf:
+        for info in tf:
+            if not info.isfile():
+                continue
+            with tf.extractfile(info) as fh:
+                data = fh.read(header_bytes)
+            yield Member(os.path.join(path, info.name), data,
+                         info.size <= header_bytes,
+                         functools.partial(_read_tar_member, path, info.name))
+
+
+def buffer_members(buffers, header_bytes: int = HEADER_BYTES):
+    # buffers are bytes-like objects (bytes, bytearray, memoryview, mmap)
+    # or (name, buffer) pairs; only bytes are passed on without a copy
+    for n, item in enumerate(buffers):
+        name, buf = item if isinstance(item, tuple) else ("buffer%d" % n, item)
+        if isinstance(buf, bytes):
+            yield Member(name, buf, True)
+            continue
+        view = memoryview(buf).cast("B")
+        if len(view) <= header_bytes:
+            yield Member(name, bytes(view), True)
+        else:
+            yield Member(name, bytes(view[:header_bytes]), False,
+                         functools.partial(bytes, view))
+
+
+def mmap_members(files, header_bytes: int = HEADER_BYTES):
+    # only the pages holding the header are read from disk
+    for fp in files:
+        with open(fp, "rb") as fh:
+            size = os.fstat(fh.fileno()).st_size
+            if size == 0:
+                yield Member(fp, b"", True)
+                continue
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                data = mm[:header_bytes]
+        yield Member(fp, data, size <= header_bytes,
+                     functools.partial(_read_file, fp))
+
+
+def is_archive(path) -> bool:
+    return os.path.isfile(path) and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path))
+
+
+def archive_members(path, header_bytes: int = HEADER_BYTES):
+    if zipfile.is_zipfile(path):
+        return zip_members(path, header_bytes)
+    if tarfile.is_tarfile(path):
+        return tar_members(path, header_bytes)
+    raise ValueError(f"{path} is neither a ZIP nor a tar archive")
@@ -0,0 +1,99 @@
+from collections import defaultdict
+from time import perf_counter
+
+
+class Hook:
+    # base class for conversion callbacks, override what is needed
+
+    def on_start(self, total):
+        pass
+
+    def on_file(self, fp, ok: bool):
+        pass
+
+    def on_study(self, study, studyInstanceUID):
+        pass
+
+    def on_finish(self, stats):
+        pass
+
+
+class TqdmProgress(Hook):
+    # the progress bar process_dicom_2_fhir used to always show
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.bar = None
+
+    def on_start(self, total):
+        from tqdm import tqdm
+        self.bar = tqdm(total=total, **self.kwargs)
+
+    def on_file(self, fp, ok):
+        self.bar.update(1)
+
+    def on_finish(self, stats):
+        self.bar.close()
+
+
+class ConversionStats:
+    # Cumulative per-stage timings (seconds) and counters of a conversion.
+    # Stages: walk, read, assemble, and nested inside assemble, snomed and
+    # datetime. Counters: files, non_dicom, errors, duplicate_instances,
+    # series, instances, studies, and rejected (with rejected_extension,
+    # _size, _magic and _unreadable) for files discovery never passed on.
+
+    def __init__(self, hooks=None):
+        self.timings = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.hooks = list(hooks or [])
+        # time spent inside timed pulls, see timed
+        self._nested = 0.0
+
+    def add_time(self, stage, seconds):
+        self.timings[stage] += seconds
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def timed(self, iterable, stage):
+        # yields from iterable, adding the time spent producing each item.
+        # Time spent in timed iterables nested inside it (such as the walk
+        # feeding the header reads) counts for their stage only; timed
+        # iterables are pulled from one thread
+        it = iter(iterable)
+        while True:
+            nested = self._nested
+            start = perf_counter()
+            try:
+                item = next(it)
+                done = False
+            except StopIteration:
+                done = True
+            elapsed = perf_counter() - start
+            self.timings[stage] += elapsed - (self._nested - nested)
+            self._nested = nested + elapsed
+            if done:
+                return
+            yield item
+
+    def start(self, total=None):
+        for hook in self.hooks:
+            hook.on_start(total)
+
+    def file_done(self, fp, ok):
+        self.counters["files"] += 1
+        for hook in self.hooks:
+            hook.on_file(fp, ok)
+
+    def study_done(self, study, studyInstanceUID):
+        self.counters["studies"] += 1
+        for hook in self.hooks:
+            hook.on_study(study, studyInstanceUID)
+
+    def finish(self):
+        for hook in self.hooks:
+            hook.on_finish(self)
+
+    def as_dict(self) -> dict:
+        return {"timings": dict(self.timings), "counters": dict(self.counters)}
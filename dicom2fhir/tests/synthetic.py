@@ -0,0 +1,148 @@
+import os
+import random
+
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+CR_IMAGE_STORAGE = "1.2.840.10008.5.1.4.1.1.1"
+PRIVATE_CREATOR = "DICOM2FHIR SYNTHETIC"
+
+SOP_CLASSES = {
+    "CR": CR_IMAGE_STORAGE,
+    "CT": "1.2.840.10008.5.1.4.1.1.2",
+    "MR": "1.2.840.10008.5.1.4.1.1.4",
+    "US": "1.2.840.10008.5.1.4.1.1.6.1",
+    "MG": "1.2.840.10008.5.1.4.1.1.1.2",
+    "SR": "1.2.840.10008.5.1.4.1.1.88.11",
+}
+BODY_PARTS = {"CT": "ABDOMEN", "MR": "HEAD", "US": "LIVER", "MG": "BREAST"}
+
+# what non-DICOM clutter in real exports looks like
+JUNK_FILES = [
+    ("README.txt", b"exported by PACS\n"),
+    (".DS_Store", b"\0\0\0\1Bud1" + b"\0" * 2048),
+    ("thumbnail.jpg", b"\xff\xd8\xff\xe0" + b"\x11" * 8192),
+    ("report.pdf", b"%PDF-1.4\n" + b"\x22" * 16384),
+]
+
+
+def make_dataset(study_uid, series_uid, sop_uid, modality="CR",
+                 series_number=1, instance_number=1, body_part="CHEST"):
+    ds = Dataset()
+    ds.SOPClassUID = SOP_CLASSES.get(modality, CR_IMAGE_STORAGE)
+    ds.SOPInstanceUID = sop_uid
+    ds.StudyInstanceUID = study_uid
+    ds.SeriesInstanceUID = series_uid
+    ds.Modality = modality
+    ds.SeriesNumber = series_number
+    ds.InstanceNumber = instance_number
+    ds.AccessionNumber = "ACC0001"
+    ds.PatientID = "PAT000001"
+    ds.StudyDescription = "Synthetic study"
+    ds.SeriesDescription = "Synthetic series %d" % series_number
+    ds.StudyDate = "20200126"
+    ds.StudyTime = "101112"
+    ds.SeriesDate = "20200126"
+    ds.SeriesTime = "101213"
+    ds.BodyPartExamined = body_part
+    ds.ImageType = ["ORIGINAL", "PRIMARY"]
+    if modality == "SR":
+        del ds.ImageType
+        item = Dataset()
+        item.CodeValue = "18748-4"
+        item.CodingSchemeDesignator = "LN"
+        item.CodeMeaning = "Diagnostic imaging report"
+        ds.ConceptNameCodeSequence = [item]
+    return ds
+
+
+def add_private_bloat(ds, nbytes):
+    # vendor-style private block of nbytes spread over up to 255 elements,
+    # plus a private sequence, ahead of the attributes the converter reads
+    if nbytes <= 0:
+        return ds
+    block = ds.private_block(0x0009, PRIVATE_CREATOR, create=True)
+    chunk = max(1024, nbytes // 255)
+    chunk += chunk % 2
+    for offset in range(min(255, max(1, nbytes // chunk))):
+        block.add_new(offset, "OB", b"\x5a" * chunk)
+    item = Dataset()
+    item.add_new(0x00091001, "LO", PRIVATE_CREATOR)
+    item.add_new(0x00091010, "LT", "overlay notes " * 64)
+    block.add_new(0xFF, "SQ", [item] * 16)
+    return ds
+
+
+def write_dataset(ds, path):
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = ds.SOPClassUID
+    meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta = meta
+    ds.preamble = b"\0" * 128
+    if int(pydicom.__version__.split(".")[0]) >= 3:
+        ds.save_as(path, enforce_file_format=True)
+    else:
+        ds.is_little_endian = True
+        ds.is_implicit_VR = False
+        ds.save_as(path, write_like_original=False)
+    return path
+
+
+def write_junk(root, n, seed=None):
+    rng = random.Random(seed)
+    paths = []
+    for j in range(n):
+        name, content = rng.choice(JUNK_FILES)
+        path = os.path.join(root, "%03d_%s" % (j, name))
+        with open(path, "wb") as fh:
+            fh.write(content)
+        paths.append(path)
+    return paths
+
+
+def write_study(root, n_series=2, n_instances=3, study_uid=None, modality="CR",
+                private_bytes=0, modalities=None, junk_fraction=0.0, seed=None):
+    # writes n_series x n_instances files below root, one folder per series.
+    # modalities are cycled over the series (default: modality for all);
+    # junk_fraction of the files written are non-DICOM clutter.
+    study_uid = study_uid or generate_uid()
+    modalities = modalities or [modality]
+    paths = []
+    for s in range(n_series):
+        series_uid = generate_uid()
+        series_modality = modalities[s % len(modalities)]
+        series_dir = os.path.join(root, "series%03d" % s)
+        os.makedirs(series_dir, exist_ok=True)
+        for i in range(n_instances):
+            ds = make_dataset(study_uid, series_uid, generate_uid(), series_modality,
+                              series_number=s + 1, instance_number=i + 1,
+                              body_part=BODY_PARTS.get(series_modality, "CHEST"))
+            add_private_bloat(ds, private_bytes)
+            paths.append(write_dataset(
+                ds, os.path.join(series_dir, "IM%05d.dcm" % i)))
+    if junk_fraction > 0:
+        n_junk = int(round(len(paths) * junk_fraction / (1 - junk_fraction)))
+        write_junk(root, n_junk, seed)
+    return paths
+
+
+def write_dicomdir(out_dir, paths):
+    # copies the files at paths into a File-set with a DICOMDIR in out_dir,
+    # adding the attributes its directory records require
+    from pydicom import dcmread
+    from pydicom.fileset import FileSet
+
+    fs = FileSet()
+    for path in paths:
+        ds = dcmread(path)
+        ds.StudyID = "1"
+        if ds.Modality == "SR":
+            ds.CompletionFlag = "COMPLETE"
+            ds.VerificationFlag = "UNVERIFIED"
+            ds.ContentDate = ds.SeriesDate
+            ds.ContentTime = ds.SeriesTime
+        fs.add(ds)
+    fs.write(out_dir)
+    return os.path.join(out_dir, "DICOMDIR")
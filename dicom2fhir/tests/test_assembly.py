@@ -0,0 +1,80 @@
+import unittest
+from unittest import mock
+
+from .. import dicom2fhir
+from .. import dictbuilder
+
+
+def _header(sop_uid, series_uid="1.2.3.1", instance_number=1):
+    return {
+        "StudyInstanceUID": "1.2.3",
+        "AccessionNumber": "ACC0001",
+        "PatientID": "PAT000001",
+        "SeriesInstanceUID": series_uid,
+        "SeriesNumber": 1,
+        "Modality": "CT",
+        "SOPInstanceUID": sop_uid,
+        "SOPClassUID": "1.2.840.10008.5.1.4.1.1.2",
+        "InstanceNumber": instance_number,
+        "ImageType": ["ORIGINAL", "PRIMARY", "AXIAL"],
+    }
+
+
+class _NoScan(list):
+    # a list that fails the test when searched, appending is fine
+    def _scan(self, *args):
+        raise AssertionError("linear scan of the study")
+
+    __iter__ = __contains__ = index = count = remove = _scan
+
+
+def _headers(n_instances):
+    return [_header("1.2.3.1.%d" % i, instance_number=i + 1) for i in range(n_instances)]
+
+
+class testAssembly(unittest.TestCase):
+    def test_duplicate_instance_is_skipped(self):
+        study, index = dicom2fhir._create_imaging_study(_header("1.2.3.1.1"), None, None)
+        dicom2fhir._add_imaging_study_series(study, _header("1.2.3.1.1"), None, index)
+        dicom2fhir._add_imaging_study_series(study, _header("1.2.3.2.1", "1.2.3.2"), None, index)
+        self.assertEqual(study.numberOfSeries, 2)
+        self.assertEqual(study.numberOfInstances, 2)
+        self.assertEqual(len(study.series[0].instance), 1)
+
+    def test_index_from_existing_study(self):
+        study, _ = dicom2fhir._create_imaging_study(_header("1.2.3.1.1"), None, None)
+        index = dicom2fhir.ImagingStudyIndex(study)
+        self.assertIs(index.series["1.2.3.1"], study.series[0])
+        self.assertTrue(index.has_instance("1.2.3.1", "1.2.3.1.1"))
+        self.assertFalse(index.has_instance("1.2.3.1", "1.2.3.1.2"))
+
+    def _assert_lookups(self, index, add, headers):
+        # one set lookup per file, never a scan of the series or instances
+        with mock.patch.object(index, "has_instance", wraps=index.has_instance) as lookups:
+            for hdr in headers:
+                add(hdr)
+        self.assertEqual(lookups.call_count, len(headers))
+
+    def test_model_instances_added_without_scans(self):
+        headers = _headers(1000)
+        study, index = dicom2fhir._create_imaging_study(headers[0], None, None)
+        series = study.series[0]
+        # bypass validate_assignment, which would copy the lists
+        object.__setattr__(study, "series", _NoScan(study.series))
+        object.__setattr__(series, "instance", _NoScan(series.instance))
+        self._assert_lookups(
+            index, lambda hdr: dicom2fhir._add_imaging_study_series(study, hdr, None, index),
+            headers[1:])
+        self.assertEqual(study.numberOfInstances, 1000)
+        self.assertEqual(len(series.instance), 1000)
+
+    def test_dict_instances_added_without_scans(self):
+        headers = _headers(1000)
+        study, index = dictbuilder.create_imaging_study(headers[0], None, None, store=_NoScan)
+        study["series"] = _NoScan(study["series"])
+        self._assert_lookups(
+            index, lambda hdr: dictbuilder.add_imaging_study_series(study, hdr, None, index,
+                                                                    _NoScan),
+            headers[1:])
+        self.assertEqual(study["numberOfInstances"], 1000)
+        self.assertEqual(len(study["series"][0]["instance"]), 1000)
@@ -0,0 +1,52 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+from .. import dicom2fhirutils
+from .. import build_bodysite_mapping
+
+HAS_PANDAS = all(importlib.util.find_spec(m) is not None for m in ("pandas", "lxml"))
+
+ANNEX_L = """<html><body>
+<table><tr><th>a</th></tr><tr><td>1</td></tr></table>
+<table>
+<tr><th>Coding Scheme Designator</th><th>Code Value</th><th>Code Meaning</th><th>Body Part Examined</th></tr>
+<tr><td>SCT</td><td>043799004</td><td>Chest</td><td>CHEST</td></tr>
+<tr><td>SCT</td><td>69536005</td><td>Head</td><td>HEAD</td></tr>
+<tr><td>SCT</td><td>1234</td><td>Not examinable</td><td></td></tr>
+<tr><td>SCT</td><td></td><td>Fetal arm</td><td>FETALARM</td></tr>
+</table>
+</body></html>
+"""
+
+
+class testBodysiteMapping(unittest.TestCase):
+    def test_bundled_mapping(self):
+        mapping = dicom2fhirutils.get_bodysite_mapping()
+        self.assertIsInstance(mapping, dict)
+        self.assertEqual(mapping["CHEST"], "43799004")
+        self.assertEqual(mapping["HEAD"], "69536005")
+        self.assertNotIn("FETALARM", mapping, "rows without a code are skipped")
+        self.assertIs(dicom2fhirutils.get_bodysite_mapping(), mapping)
+
+    def test_bodysite_coding(self):
+        c = dicom2fhirutils.gen_bodysite_coding("CHEST")
+        self.assertEqual(c.system, "http://snomed.info/sct")
+        self.assertEqual(c.code, "43799004")
+        with self.assertRaises(KeyError):
+            dicom2fhirutils.gen_bodysite_coding("NOTABODYPART")
+
+    @unittest.skipUnless(HAS_PANDAS, "pandas and lxml are needed to regenerate the mapping")
+    def test_regenerate_from_local_html(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            html = os.path.join(tmp, "chapter_L.html")
+            out = os.path.join(tmp, "bodysite_snomed.csv")
+            with open(html, "w") as fh:
+                fh.write(ANNEX_L)
+            build_bodysite_mapping.main([html, "--edition", "2099a", "--output", out])
+
+            with open(out) as fh:
+                self.assertIn("# edition: 2099a", fh.read())
+            mapping = dicom2fhirutils._load_snomed_bodysite_mapping(out)
+        self.assertEqual(mapping, {"CHEST": "043799004", "HEAD": "69536005"})
@@ -0,0 +1,129 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from pydicom.errors import InvalidDicomError
+
+from .. import cache
+from .. import dicom2fhir
+from .. import header
+from . import synthetic
+
+
+class testHeaderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dcmDir = os.path.join(self.tmp.name, "study")
+        self.cacheDir = os.path.join(self.tmp.name, "cache")
+        self.files = synthetic.write_study(self.dcmDir, n_series=2, n_instances=3)
+        with open(os.path.join(self.dcmDir, "README.txt"), "w") as fh:
+            fh.write("not a dicom file")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _convert(self, **kwargs):
+        with cache.HeaderCache(self.cacheDir, **kwargs) as c, \
+                mock.patch.object(header, "read_header", wraps=header.read_header) as reader:
+            study, _ = dicom2fhir.process_dicom_2_fhir(self.dcmDir, cache=c)
+            return study, c.stats(), reader.call_count
+
+    def test_rerun_only_reads_new_files(self):
+        # README.txt is rejected by discovery, it is neither read nor cached
+        first, stats, opened = self._convert()
+        self.assertEqual(stats["hits"], 0)
+        self.assertEqual(stats["misses"], 6)
+        self.assertEqual(opened, 6)
+
+        second, stats, opened = self._convert()
+        self.assertEqual(stats["hits"], 6)
+        self.assertEqual(opened, 0)
+        a, b = json.loads(first.json()), json.loads(second.json())
+        a.pop("id"), b.pop("id")
+        self.assertEqual(a, b)
+
+        ds = synthetic.make_dataset(
+            first.identifier[1].value[len("urn:oid:"):], first.series[0].uid,
+            "1.2.3.4.5.6", instance_number=99)
+        synthetic.write_dataset(ds, os.path.join(self.dcmDir, "late.dcm"))
+        third, stats, opened = self._convert()
+        self.assertEqual((stats["hits"], stats["misses"], opened), (6, 1, 1))
+        self.assertEqual(third.numberOfInstances, 7)
+
+    def test_one_pool_for_all_misses(self):
+        files = self.files * 4 + [os.path.join(self.dcmDir, "README.txt")]
+        expected = list(header.read_headers(files))
+        pools = []
+        pool_type = header.EXECUTORS["thread"]
+
+        def counting(**kwargs):
+            pools.append(kwargs)
+            return pool_type(**kwargs)
+
+        with mock.patch.dict(header.EXECUTORS, {"thread": counting}):
+            for warm in (False, True):
+                # half of the files are cached on the second pass
+                with cache.HeaderCache(self.cacheDir) as c:
+                    if warm:
+                        for fp in self.files[::2]:
+                            c.put(fp, header.read_header(fp))
+                    results = list(header.read_headers(files, workers=2, chunksize=1, cache=c))
+                self.assertEqual([fp for fp, _ in results], files)
+                for (_, a), (_, b) in zip(results, expected):
+                    if isinstance(b, Exception):
+                        self.assertIsInstance(a, Exception)
+                    else:
+                        self.assertEqual(a, b)
+                os.remove(os.path.join(self.cacheDir, cache.CACHE_FILE))
+        self.assertEqual(len(pools), 2)
+
+    def test_changed_file_is_reread(self):
+        self._convert()
+        st = os.stat(self.files[0])
+        os.utime(self.files[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        _, stats, opened = self._convert()
+        self.assertEqual((stats["hits"], stats["misses"], opened), (5, 1, 1))
+
+    def test_only_parse_errors_are_cached(self):
+        with cache.HeaderCache(self.cacheDir) as c:
+            c.put(self.files[0], InvalidDicomError("not DICOM"))
+            c.put(self.files[1], PermissionError("denied"))
+            c.put(self.files[2], TimeoutError("stale NFS handle"))
+            self.assertIsInstance(c.get(self.files[0]), Exception)
+            self.assertIsNone(c.get(self.files[1]))
+            self.assertIsNone(c.get(self.files[2]))
+        os.remove(os.path.join(self.cacheDir, cache.CACHE_FILE))
+
+        # a file that could not be opened is read again on the next run
+        def failing(fp, selective=True):
+            if fp == self.files[0]:
+                raise PermissionError(fp)
+            return reader(fp, selective)
+
+        reader = header.read_header
+        with mock.patch.object(header, "read_header", failing):
+            with cache.HeaderCache(self.cacheDir) as c:
+                list(header.read_headers(self.files, cache=c))
+        _, stats, opened = self._convert()
+        self.assertEqual(opened, 1)
+        self.assertEqual(stats["hits"], 5)
+
+    def test_lru_eviction(self):
+        with cache.HeaderCache(self.cacheDir, max_entries=3) as c:
+            for fp in self.files[:5]:
+                c.put(fp, {"SOPInstanceUID": fp})
+            c.get(self.files[0])  # most recently used now
+            c.flush()
+            self.assertEqual(len(c), 3)
+            self.assertEqual(c.evictions, 2)
+            self.assertIsNotNone(c.get(self.files[0]))
+            self.assertIsNone(c.get(self.files[1]))
+            self.assertIsNotNone(c.get(self.files[4]))
+
+    def test_version_change_clears_cache(self):
+        self._convert()
+        with mock.patch.object(cache, "CACHE_VERSION", "other"):
+            with cache.HeaderCache(self.cacheDir) as c:
+                self.assertEqual(len(c), 0)
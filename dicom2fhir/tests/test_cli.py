@@ -0,0 +1,106 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from .. import cli
+from . import synthetic
+
+
+def _main(argv):
+    with contextlib.redirect_stderr(io.StringIO()) as err:
+        status = cli.main(argv)
+    return status, err.getvalue()
+
+
+class testCli(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "in")
+        for name in ("a", "b", "c"):
+            synthetic.write_study(os.path.join(self.root, name), n_series=2, n_instances=2)
+        self.out = os.path.join(self.tmp.name, "out")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_output_directory(self):
+        status, err = _main([self.root, "--output", self.out, "--workers", "1"])
+        self.assertEqual(status, 0)
+        written = sorted(f for f in os.listdir(self.out) if f.endswith(".json"))
+        self.assertEqual(len(written), 3)
+        for name in written:
+            with open(os.path.join(self.out, name)) as fh:
+                study = json.load(fh)
+            self.assertEqual(study["resourceType"], "ImagingStudy")
+            self.assertEqual(study["numberOfInstances"], 4)
+        self.assertIn("3 studies, 12 files, 0 failures", err)
+
+    def test_resume_skips_completed(self):
+        ndjson = os.path.join(self.tmp.name, "studies.ndjson")
+        first = os.path.join(self.tmp.name, "first.txt")
+        with open(first, "w") as fh:
+            fh.write(os.path.join(self.root, "a") + "\n")
+        _main(["--manifest", first, "--ndjson", ndjson, "--workers", "1"])
+        # a study written after the last checkpoint entry, as by a run
+        # killed between the two writes
+        with open(ndjson, "a") as fh:
+            fh.write('{"resourceType": "ImagingStudy", "torn": true}\n')
+
+        status, err = _main([self.root, "--ndjson", ndjson, "--workers", "2"])
+        self.assertEqual(status, 0)
+        self.assertIn("2 studies", err)
+        self.assertIn("1 skipped", err)
+        with open(ndjson) as fh:
+            studies = [json.loads(line) for line in fh]
+        self.assertEqual(len(studies), 3)
+        with open(ndjson + ".checkpoint") as fh:
+            uids = [uid for line in fh for uid in json.loads(line)["studies"]]
+        self.assertEqual(len(set(uids)), 3)
+        self.assertTrue(all("torn" not in s for s in studies))
+
+        status, err = _main([self.root, "--ndjson", ndjson])
+        self.assertIn("0 studies", err)
+        self.assertIn("3 skipped", err)
+
+    def test_checkpoint_torn_line(self):
+        path = os.path.join(self.tmp.name, "checkpoint")
+        with open(path, "w") as fh:
+            fh.write(json.dumps({"dir": "a", "status": "ok"}) + "\n" + '{"dir": "b", "sta')
+        checkpoint = cli.Checkpoint(path)
+        self.assertEqual(set(checkpoint.done), {"a"})
+        checkpoint.record({"dir": "c", "status": "ok"})
+        checkpoint.record({"dir": "d", "status": "ok"})
+        checkpoint.close()
+
+        checkpoint = cli.Checkpoint(path)
+        self.assertEqual(set(checkpoint.done), {"a", "c", "d"})
+        checkpoint.record({"dir": "e", "status": "ok"})
+        checkpoint.close()
+        self.assertEqual(set(cli.Checkpoint(path).done), {"a", "c", "d", "e"})
+        with open(path) as fh:
+            self.assertEqual([json.loads(line)["dir"] for line in fh], ["a", "c", "d", "e"])
+
+    def test_failures(self):
+        manifest = os.path.join(self.tmp.name, "dirs.txt")
+        with open(manifest, "w") as fh:
+            fh.write(os.path.join(self.root, "a") + "\n")
+            fh.write(os.path.join(self.root, "missing") + "\n")
+        checkpoint = os.path.join(self.tmp.name, "checkpoint")
+        argv = ["--manifest", manifest, "--output", self.out, "--checkpoint", checkpoint,
+                "--workers", "1"]
+        status, err = _main(argv)
+        self.assertEqual(status, 1)
+        self.assertIn("1 failures", err)
+        with open(checkpoint) as fh:
+            entries = [json.loads(line) for line in fh]
+        self.assertEqual([e["status"] for e in entries], ["ok", "failed"])
+
+        # failed directories are only retried on request
+        status, err = _main(argv)
+        self.assertIn("2 skipped", err)
+        status, err = _main(argv + ["--retry-failed"])
+        self.assertIn("1 skipped", err)
+        self.assertIn("1 failures", err)
@@ -0,0 +1,57 @@
+import unittest
+
+from .. import compact
+from .. import dicom2fhir
+from .. import dicom2fhirutils
+from .. import dictbuilder
+from .test_assembly import _header
+
+
+class testSharedCodings(unittest.TestCase):
+    def test_gen_coding_is_shared_and_frozen(self):
+        c = dicom2fhirutils.gen_coding("CT", dicom2fhirutils.ACQUISITION_MODALITY_SYS)
+        self.assertIs(c, dicom2fhirutils.gen_coding("CT", dicom2fhirutils.ACQUISITION_MODALITY_SYS))
+        self.assertIsNot(c, dicom2fhirutils.gen_coding("MR", dicom2fhirutils.ACQUISITION_MODALITY_SYS))
+        self.assertEqual(c.json(), '{"system":"%s","code":"CT"}' % dicom2fhirutils.ACQUISITION_MODALITY_SYS)
+        with self.assertRaises(TypeError):
+            c.code = "MR"
+        with self.assertRaises(Exception):
+            dicom2fhirutils.gen_coding(["CT", "MR"], dicom2fhirutils.ACQUISITION_MODALITY_SYS)
+
+    def test_codeable_concept(self):
+        cc = dicom2fhirutils.gen_codeable_concept(["MR"], dicom2fhirutils.TERMINOLOGY_CODING_SYS)
+        self.assertIs(cc, dicom2fhirutils.gen_codeable_concept(("MR",), dicom2fhirutils.TERMINOLOGY_CODING_SYS))
+        self.assertIs(cc.coding[0], dicom2fhirutils.gen_coding("MR", dicom2fhirutils.TERMINOLOGY_CODING_SYS))
+
+    def test_shared_across_studies(self):
+        first, _ = dicom2fhir._create_imaging_study(_header("1.2.3.1.1"), None, None)
+        second, _ = dicom2fhir._create_imaging_study(_header("1.2.4.1.1", "1.2.4.1"), None, None)
+        self.assertIs(first.series[0].modality, second.series[0].modality)
+        self.assertIs(first.series[0].instance[0].sopClass, second.series[0].instance[0].sopClass)
+
+    def test_fragments_not_shared(self):
+        # dict studies can be changed without touching any other
+        for create_study in (dictbuilder.create_imaging_study, compact.create_imaging_study):
+            first, _ = create_study(_header("1.2.3.1.1"), None, None)
+            second, _ = create_study(_header("1.2.4.1.1", "1.2.4.1"), None, None)
+            first = compact.to_dict(first)
+            second = compact.to_dict(second)
+            first["series"][0]["modality"]["display"] = "changed"
+            first["series"][0]["instance"][0]["sopClass"]["display"] = "changed"
+            first["identifier"][0]["type"]["coding"][0]["display"] = "changed"
+            self.assertNotIn("display", second["series"][0]["modality"])
+            self.assertNotIn("display", second["series"][0]["instance"][0]["sopClass"])
+            self.assertNotIn("display", second["identifier"][0]["type"]["coding"][0])
+            third, _ = create_study(_header("1.2.5.1.1", "1.2.5.1"), None, None)
+            self.assertNotIn("display", compact.to_dict(third)["series"][0]["modality"])
+
+    def test_cache_info_and_clear(self):
+        dicom2fhirutils.gen_coding("CT", dicom2fhirutils.ACQUISITION_MODALITY_SYS)
+        self.assertGreater(dicom2fhirutils.coding_cache_info()["_shared_coding"].currsize, 0)
+        dicom2fhirutils.clear_coding_cache()
+        for info in dicom2fhirutils.coding_cache_info().values():
+            self.assertEqual(info.currsize, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
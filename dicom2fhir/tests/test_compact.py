@@ -0,0 +1,88 @@
+import gc
+import json
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+from .. import compact
+from .. import dicom2fhir
+from .. import writers
+from . import synthetic
+from .test_assembly import _header
+
+
+def _assemble(backend, n_instances):
+    create_study, add_series = dicom2fhir._get_backend(backend)
+    study, index = create_study(_header("1.2.3.1.0"), None, None)
+    for i in range(1, n_instances):
+        add_series(study, _header("1.2.3.1.%d" % i, instance_number=i + 1), None, index)
+    return study
+
+
+def _allocated(backend, n_instances):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        study = _assemble(backend, n_instances)
+        return tracemalloc.get_traced_memory()[0], study
+    finally:
+        tracemalloc.stop()
+
+
+class testCompact(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dcmDir = self.tmp.name
+        synthetic.write_study(self.dcmDir, n_series=3, n_instances=4,
+                              modalities=["CT", "SR", "MR"], seed=2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parity_with_dict_backend(self):
+        study, uid = dicom2fhir.process_dicom_2_fhir(self.dcmDir, backend="dict")
+        packed, cuid = dicom2fhir.process_dicom_2_fhir(
+            self.dcmDir, backend="compact", validate=True)
+        self.assertEqual(uid, cuid)
+        self.assertTrue(compact.is_compact(packed))
+        self.assertFalse(compact.is_compact(study))
+        packed["id"] = study["id"]
+        self.assertEqual(compact.to_dict(packed), study)
+        self.assertEqual(writers.study_json(packed), writers.study_json(study))
+
+    def test_store_without_number_or_title(self):
+        store = compact.InstanceStore()
+        sopClass = {"system": "urn:ietf:rfc:3986", "code": "urn:oid:1.2"}
+        store.append({"uid": "1.2.3", "sopClass": dict(sopClass)})
+        store.append({"uid": "1.2.4", "sopClass": dict(sopClass), "number": 0, "title": "A"})
+        self.assertEqual(list(store), [
+            {"uid": "1.2.3", "sopClass": sopClass},
+            {"uid": "1.2.4", "sopClass": sopClass, "number": 0, "title": "A"},
+        ])
+        # the coding is stored once per series, instances get copies
+        self.assertEqual(len(store._codings), 1)
+        self.assertIsNot(store[0]["sopClass"], store[1]["sopClass"])
+        with self.assertRaises(ValueError):
+            store.append({"uid": "1.2.5", "sopClass": sopClass, "extra": 1})
+
+    def test_memory_and_streaming(self):
+        n = 5000
+        dict_bytes, _ = _allocated("dict", n)
+        compact_bytes, study = _allocated("compact", n)
+        self.assertEqual(study["numberOfInstances"], n)
+        self.assertLess(compact_bytes, dict_bytes / 3)
+
+        chunks = list(writers.study_chunks(study))
+        text = "".join(chunks)
+        self.assertEqual(len(json.loads(text)["series"][0]["instance"]), n)
+        self.assertLess(max(len(c) for c in chunks), len(text) / 5)
+
+        path = os.path.join(self.tmp.name, "big.ndjson")
+        self.assertEqual(writers.write_ndjson([study], path), 1)
+        with open(path) as fh:
+            self.assertEqual(fh.read(), text + "\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from datetime import date, datetime, time, timedelta, timezone
+
+from .. import datetimes
+from .. import dicom2fhir
+from .. import dicom2fhirutils
+from .. import dictbuilder
+from .test_assembly import _header
+
+
+class testDatetimes(unittest.TestCase):
+    def test_da(self):
+        self.assertEqual(datetimes.parse_da("20200131"), date(2020, 1, 31))
+        self.assertEqual(datetimes.parse_da("2020.01.31"), date(2020, 1, 31))
+        for bad in ("2020013", "20201301", "2020-01-31", "2020O131", ""):
+            with self.assertRaises(ValueError):
+                datetimes.parse_da(bad)
+
+    def test_tm(self):
+        self.assertEqual(datetimes.parse_tm("10"), time(10))
+        self.assertEqual(datetimes.parse_tm("1011"), time(10, 11))
+        self.assertEqual(datetimes.parse_tm("101112"), time(10, 11, 12))
+        self.assertEqual(datetimes.parse_tm("101112.5"), time(10, 11, 12, 500000))
+        self.assertEqual(datetimes.parse_tm("101112.123456 "), time(10, 11, 12, 123456))
+        self.assertEqual(datetimes.parse_tm("10:11:12.25"), time(10, 11, 12, 250000))
+        self.assertEqual(datetimes.parse_tm("235960"), time(23, 59, 59))
+        for bad in ("1", "101", "1011.5", "101112.1234567", "251112", "10111x"):
+            with self.assertRaises(ValueError):
+                datetimes.parse_tm(bad)
+
+    def test_tz_and_dt(self):
+        self.assertEqual(datetimes.parse_tz("-0530"), timezone(-timedelta(hours=5, minutes=30)))
+        with self.assertRaises(ValueError):
+            datetimes.parse_tz("0100")
+        self.assertEqual(datetimes.parse_dt("2020"), datetime(2020, 1, 1))
+        self.assertEqual(datetimes.parse_dt("2020013110"), datetime(2020, 1, 31, 10))
+        self.assertEqual(datetimes.parse_dt("20200131101112.5+0200"),
+                         datetime(2020, 1, 31, 10, 11, 12, 500000, timezone(timedelta(hours=2))))
+        with self.assertRaises(ValueError):
+            datetimes.parse_dt("202001311.5")
+
+    def test_started(self):
+        self.assertEqual(dicom2fhirutils.gen_started_datetime("20200131", "").isoformat(), "2020-01-31")
+        self.assertEqual(dicom2fhirutils.gen_started_datetime("20200131", "101112.5").isoformat(),
+                         "2020-01-31T10:11:12.500000+01:00")
+        self.assertEqual(dicom2fhirutils.gen_started_datetime("20200131", "101112", "-0500").isoformat(),
+                         "2020-01-31T10:11:12-05:00")
+        # an invalid offset falls back to the default zone
+        self.assertEqual(dicom2fhirutils.gen_started_datetime("20200131", "101112", "CET").isoformat(),
+                         "2020-01-31T10:11:12+01:00")
+        self.assertIsNone(dicom2fhirutils.gen_started_datetime(None, "101112"))
+
+    def test_memoized(self):
+        datetimes.clear_cache()
+        for _ in range(3):
+            datetimes.combine("20200131", "101112")
+        info = datetimes.cache_info()["combine"]
+        self.assertEqual((info.hits, info.misses), (2, 1))
+
+    def test_calc_dob(self):
+        self.assertEqual(str(dicom2fhirutils.calc_dob("19800229")), "1980-02-29")
+        self.assertIsNone(dicom2fhirutils.calc_dob("19810229"))
+        self.assertIsNone(dicom2fhirutils.calc_dob(""))
+
+    def test_started_in_both_backends(self):
+        ds = _header("1.2.3.1.1")
+        ds.update({"StudyDate": "20200131", "StudyTime": "101112.25",
+                   "SeriesDate": "20200131", "SeriesTime": "1015",
+                   "TimezoneOffsetFromUTC": "+0200"})
+        model, _ = dicom2fhir._create_imaging_study(ds, None, None)
+        study, _ = dictbuilder.create_imaging_study(ds, None, None)
+        self.assertEqual(study["started"], "2020-01-31T10:11:12.250000+02:00")
+        self.assertEqual(study["series"][0]["started"], "2020-01-31T10:15:00+02:00")
+        self.assertEqual(model.started.isoformat(), study["started"])
+        self.assertEqual(model.series[0].started.isoformat(), study["series"][0]["started"])
+
+
+if __name__ == '__main__':
+    unittest.main()
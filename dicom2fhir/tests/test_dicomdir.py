@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .. import dicom2fhir
+from .. import dicomdir
+from .. import header
+from .. import writers
+from ..stats import ConversionStats
+from . import synthetic
+
+
+def _normalized(study):
+    study = json.loads(writers.study_json(study))
+    study["id"] = "x"
+    study["series"].sort(key=lambda s: s["uid"])
+    for s in study["series"]:
+        s["instance"].sort(key=lambda i: i["uid"])
+    return study
+
+
+class testDicomdir(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        files = synthetic.write_study(os.path.join(self.tmp.name, "src"), n_series=3,
+                                      n_instances=4, modalities=["CT", "MR", "SR"])
+        self.media = os.path.join(self.tmp.name, "media")
+        synthetic.write_dicomdir(self.media, files)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_one_open_per_series(self):
+        stats = ConversionStats()
+        with mock.patch.object(header, "read_header", wraps=header.read_header) as read:
+            study, uid = dicom2fhir.process_dicom_2_fhir(
+                self.media, backend="dict", use_dicomdir=True, stats=stats)
+        self.assertEqual(read.call_count, 3)
+        self.assertEqual(stats.counters["opened"], 3)
+        self.assertEqual(stats.counters["instances"], 12)
+        self.assertEqual(study["numberOfSeries"], 3)
+        for s in study["series"]:
+            # series-level attributes that only the files have
+            self.assertIn("bodySite", s)
+            self.assertTrue(s["description"].startswith("Synthetic series"))
+
+    def test_matches_reading_every_file(self):
+        full, _ = dicom2fhir.process_dicom_2_fhir(self.media, backend="dict")
+        indexed, _ = dicom2fhir.process_dicom_2_fhir(
+            os.path.join(self.media, "DICOMDIR"), backend="dict", use_dicomdir=True)
+        full, indexed = _normalized(full), _normalized(indexed)
+        # image records carry no ImageType, so no image instance has a title;
+        # SR records carry their ConceptNameCodeSequence
+        for series in indexed["series"]:
+            titled = ["title" in instance for instance in series["instance"]]
+            self.assertEqual(set(titled), {series["modality"]["code"] == "SR"})
+        for series in full["series"]:
+            if series["modality"]["code"] != "SR":
+                for instance in series["instance"]:
+                    instance.pop("title")
+        self.assertEqual(indexed, full)
+
+    def test_unreadable_series_file(self):
+        fileset = dicomdir.load(self.media)
+        first = next(iter(fileset)).path
+        os.remove(first)
+        records = list(dicomdir.read_headers(fileset))
+        self.assertEqual(len(records), 12)
+        self.assertEqual(records[0][0], first)
+        self.assertNotIn("BodyPartExamined", records[0][1])
+        self.assertIn("SOPInstanceUID", records[1][1])
+
+    def test_iter_studies(self):
+        studies = list(dicom2fhir.iter_studies(self.media, use_dicomdir=True))
+        self.assertEqual(len(studies), 1)
+        self.assertEqual(studies[0][0].numberOfInstances, 12)
+
+    def test_missing_dicomdir(self):
+        with self.assertRaises(FileNotFoundError):
+            dicom2fhir.process_dicom_2_fhir(self.tmp.name, use_dicomdir=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
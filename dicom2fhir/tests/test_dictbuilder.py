@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+import unittest
+
+from pydicom.dataset import Dataset
+from pydicom.uid import generate_uid
+
+from .. import dicom2fhir
+from .. import dictbuilder
+from .. import writers
+from . import synthetic
+
+
+def _code_item(code, meaning):
+    item = Dataset()
+    item.CodeValue = code
+    item.CodingSchemeDesignator = "LN"
+    item.CodeMeaning = meaning
+    return item
+
+
+class testDictBuilder(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dcmDir = self.tmp.name
+        study_uid = generate_uid()
+        for s, (modality, laterality) in enumerate([("CR", "L"), ("MR", None), ("SR", None)]):
+            series_uid = generate_uid()
+            for i in range(3):
+                ds = synthetic.make_dataset(
+                    study_uid, series_uid, generate_uid(), modality,
+                    series_number=s + 1, instance_number=i + 1)
+                ds.ProcedureCodeSequence = [_code_item("24627-2", "Chest CT")]
+                ds.ReasonForTheRequestedProcedure = "Follow-up"
+                if laterality:
+                    ds.Laterality = laterality
+                if modality == "SR":
+                    ds.ConceptNameCodeSequence = [_code_item("18748-4", "Diagnostic report")]
+                synthetic.write_dataset(ds, os.path.join(self.dcmDir, "%d_%d.dcm" % (s, i)))
+        # duplicate SOP instance
+        synthetic.write_dataset(ds, os.path.join(self.dcmDir, "dup.dcm"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parity_with_model_backend(self):
+        model, uid = dicom2fhir.process_dicom_2_fhir(self.dcmDir)
+        study, duid = dicom2fhir.process_dicom_2_fhir(
+            self.dcmDir, backend="dict", validate=True)
+        self.assertEqual(uid, duid)
+        self.assertEqual(study["numberOfInstances"], 9)
+        sr = next(s for s in study["series"] if s["modality"]["code"] == "SR")
+        self.assertEqual(sr["instance"][0]["title"], "Diagnostic report")
+
+        study["id"] = model.id
+        self.assertEqual(json.loads(model.json()), study)
+        self.assertEqual(json.dumps(study, separators=(",", ":")), model.json())
+
+    def test_empty_reason_sequence(self):
+        reasonDir = os.path.join(self.dcmDir, "reason")
+        os.makedirs(reasonDir)
+        ds = synthetic.make_dataset(generate_uid(), generate_uid(), generate_uid(), "CT")
+        ds.ReasonForRequestedProcedureCodeSequence = []
+        synthetic.write_dataset(ds, os.path.join(reasonDir, "IM0.dcm"))
+        model, _ = dicom2fhir.process_dicom_2_fhir(reasonDir)
+        expected = json.loads(model.json())
+        self.assertNotIn("reasonCode", expected)
+        for backend in ("dict", "compact"):
+            study, _ = dicom2fhir.process_dicom_2_fhir(reasonDir, backend=backend)
+            study = json.loads(writers.study_json(study))
+            study["id"] = model.id
+            self.assertEqual(study, expected, backend)
+
+    def test_validate(self):
+        study, _ = dicom2fhir.process_dicom_2_fhir(self.dcmDir, backend="dict")
+        self.assertEqual(dictbuilder.validate(study).numberOfSeries, 3)
+        study["numberOfSeries"] = "three"
+        with self.assertRaises(Exception):
+            dictbuilder.validate(study)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            dicom2fhir.process_dicom_2_fhir(self.dcmDir, backend="xml")
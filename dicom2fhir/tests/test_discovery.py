@@ -0,0 +1,76 @@
+import os
+import tempfile
+import types
+import unittest
+
+from .. import dicom2fhir
+from .. import discovery
+from ..stats import ConversionStats
+from . import synthetic
+
+
+class testDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.files = synthetic.write_study(os.path.join(self.root, "study"), n_series=2, n_instances=2)
+        self.junk = synthetic.write_junk(os.path.dirname(self.files[-1]), 8, seed=2)
+        # a data set without preamble and "DICM", as written by some
+        # older modalities
+        with open(self.files[0], "rb") as fh:
+            data = fh.read()[discovery.PREAMBLE_LENGTH + len(discovery.MAGIC):]
+        self.bare = os.path.join(self.root, "bare")
+        with open(self.bare, "wb") as fh:
+            fh.write(data)
+        open(os.path.join(self.root, "empty"), "wb").close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sniffing(self):
+        stats = ConversionStats()
+        found = discovery.discover(self.root, stats)
+        self.assertIsInstance(found, types.GeneratorType)
+        self.assertEqual(sorted(found), sorted(self.files))
+        self.assertEqual(stats.counters["rejected"], len(self.junk) + 2)
+        self.assertEqual(stats.counters["rejected_magic"], len(self.junk) + 2)
+
+        found = discovery.discover(self.root, allow_no_preamble=True)
+        self.assertEqual(sorted(found), sorted(self.files + [self.bare]))
+
+    def test_filters(self):
+        os.rename(self.files[0], self.files[0][:-len(".dcm")] + ".randomext")
+        stats = ConversionStats()
+        found = list(discovery.discover(self.root, stats, extensions=["dcm"]))
+        self.assertEqual(sorted(found), sorted(self.files[1:]))
+        # checked before sniffing, without opening the file
+        self.assertEqual(stats.counters["rejected_extension"], len(self.junk) + 3)
+
+        stats = ConversionStats()
+        found = list(discovery.discover(self.root, stats, exclude_extensions=[".txt", ".jpg", ".pdf"],
+                                        min_size=1, sniff=False))
+        self.assertIn(self.bare, found)
+        self.assertNotIn(os.path.join(self.root, "empty"), found)
+        self.assertEqual(stats.counters["rejected_size"], 1)
+
+        size = os.path.getsize(self.files[1])
+        found = list(discovery.discover(self.root, max_size=size - 1, sniff=False))
+        self.assertNotIn(self.files[1], found)
+
+    def test_conversion_skips_rejected_files(self):
+        stats = ConversionStats()
+        study, _ = dicom2fhir.process_dicom_2_fhir(os.path.join(self.root, "study"),
+                                                   backend="dict", stats=stats)
+        self.assertEqual(study["numberOfInstances"], 4)
+        self.assertEqual(stats.counters["files"], 4)
+        self.assertEqual(stats.counters["non_dicom"], 0)
+        self.assertEqual(stats.counters["rejected"], len(self.junk))
+
+        # the fallback passes bare data sets on to dcmread
+        stats = ConversionStats()
+        os.rename(self.bare, os.path.join(self.root, "study", "bare"))
+        (_, uid), = dicom2fhir.iter_studies(
+            os.path.join(self.root, "study"), backend="dict", stats=stats,
+            discovery=discovery.Discovery(allow_no_preamble=True))
+        self.assertEqual(stats.counters["files"], 5)
+        self.assertEqual(stats.counters["duplicate_instances"], 1)
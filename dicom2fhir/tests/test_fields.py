@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+import unittest
+
+from fhir.resources.R4B import imagingstudy
+from pydicom import Dataset
+from pydicom.uid import generate_uid
+
+from .. import cache
+from .. import dicom2fhir
+from .. import header
+from .. import writers
+from . import synthetic
+
+
+def _json(study):
+    data = json.loads(writers.study_json(study))
+    data.pop("id")
+    return data
+
+
+class testFields(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dcmDir = os.path.join(self.tmp.name, "mr")
+        os.makedirs(self.dcmDir)
+        study, series = generate_uid(), generate_uid()
+        for n in range(3):
+            ds = synthetic.make_dataset(study, series, generate_uid(), modality="MR",
+                                        instance_number=n + 1)
+            ds.ScanningSequence = ["SE", "IR"]
+            ds.SequenceVariant = "SK"
+            ds.EchoTime = "12.5"
+            synthetic.write_dataset(ds, os.path.join(self.dcmDir, "IM%d.dcm" % n))
+        self.addCleanup(header.set_fields, header.FIELDS)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_missing_elements(self):
+        ds = Dataset()
+        ds.StudyInstanceUID = "1.2.3"
+        ds.SeriesNumber = "7"
+        ds.ImageType = "ORIGINAL"
+        ds.ProcedureCodeSequence = []
+        self.assertEqual(header.extract_header(ds), {
+            "StudyInstanceUID": "1.2.3", "ProcedureCodeSequence": [],
+            "SeriesNumber": 7, "ImageType": "ORIGINAL"})
+
+    def test_invalid_fields(self):
+        with self.assertRaises(ValueError):
+            header.Field("SeriesNumber", "patient")
+        with self.assertRaises(ValueError):
+            header.Field("ImageType", "instance", extension=header.decimal_extension("x"))
+        with self.assertRaises(ValueError):
+            header.Field(0x00091001, "series")  # private tags need a key
+        with self.assertRaises(ValueError):
+            header.Extractor(header.FIELDS + header.FIELDS[:1])
+
+    def test_default_fields_ignore_mr_attributes(self):
+        study, _ = dicom2fhir.process_dicom_2_fhir(self.dcmDir, backend="dict")
+        self.assertNotIn("extension", study["series"][0])
+        self.assertNotIn("EchoTime", header.HEADER_KEYWORDS)
+
+    def test_mr_extensions(self):
+        header.set_fields(header.FIELDS + header.MR_FIELDS)
+        self.assertIn(0x00180081, header.HEADER_TAGS)
+        self.assertEqual(header.SERIES_KEYWORDS[-3:], ["ScanningSequence", "SequenceVariant", "EchoTime"])
+        hdr = header.read_header(os.path.join(self.dcmDir, "IM0.dcm"))
+        self.assertEqual(hdr["ScanningSequence"], ["SE", "IR"])
+        self.assertEqual(hdr["SequenceVariant"], ["SK"])
+        self.assertEqual(hdr["EchoTime"], 12.5)
+
+        expected = _json(dicom2fhir.process_dicom_2_fhir(self.dcmDir)[0])
+        series, = expected["series"]
+        self.assertEqual(list(series)[0], "extension")
+        urls = [e["url"].rsplit("#", 1)[1] for e in series["extension"]]
+        self.assertEqual(urls, ["ScanningSequence", "SequenceVariant", "EchoTime"])
+        self.assertEqual(
+            [c["code"] for c in series["extension"][0]["valueCodeableConcept"]["coding"]], ["SE", "IR"])
+        self.assertEqual(series["extension"][2]["valueDecimal"], 12.5)
+        for backend in ("dict", "compact"):
+            study, _ = dicom2fhir.process_dicom_2_fhir(self.dcmDir, backend=backend, validate=True)
+            self.assertEqual(_json(study), expected, backend)
+        imagingstudy.ImagingStudy.parse_obj(expected)
+
+    def test_cache_follows_fields(self):
+        with cache.HeaderCache(self.tmp.name) as c:
+            dicom2fhir.process_dicom_2_fhir(self.dcmDir, cache=c)
+            self.assertEqual(len(c), 3)
+        header.set_fields(header.FIELDS + header.MR_FIELDS)
+        with cache.HeaderCache(self.tmp.name) as c:
+            self.assertEqual(len(c), 0)
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+
+from .. import dicom2fhir
+from .. import header
+from . import synthetic
+
+
+def _study_json(study):
+    data = json.loads(study.json())
+    data.pop("id")
+    return data
+
+
+class testHeader(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dcmDir = self.tmp.name
+        synthetic.write_study(self.dcmDir, n_series=3, n_instances=4)
+        with open(os.path.join(self.dcmDir, "README.txt"), "w") as fh:
+            fh.write("not a dicom file")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_read_header(self):
+        fp = os.path.join(self.dcmDir, "series000", "IM00000.dcm")
+        hdr = header.read_header(fp)
+        self.assertEqual(hdr["Modality"], "CR")
+        self.assertEqual(hdr["InstanceNumber"], 1)
+        self.assertEqual(hdr["ImageType"], ["ORIGINAL", "PRIMARY"])
+        self.assertNotIn("Laterality", hdr)
+
+    def test_selective_read_matches_full_read(self):
+        fp = synthetic.write_dataset(
+            synthetic.add_private_bloat(synthetic.make_dataset(
+                "1.2.3", "1.2.3.1", "1.2.3.1.1"), 256 * 1024),
+            os.path.join(self.dcmDir, "bloated.dcm"))
+        self.assertEqual(header.read_header(fp),
+                         header.read_header(fp, selective=False))
+
+    def test_read_headers_keeps_order(self):
+        files = sorted(
+            os.path.join(r, f) for r, _, fs in os.walk(self.dcmDir) for f in fs)
+        # a file that cannot be opened, in the middle of a chunk
+        missing = os.path.join(self.dcmDir, "series001", "missing.dcm")
+        files.insert(5, missing)
+        serial = list(header.read_headers(files))
+        threaded = list(header.read_headers(
+            iter(files), workers=3, executor="thread", chunksize=2))
+        self.assertEqual([fp for fp, _ in serial], files)
+        self.assertEqual([fp for fp, _ in threaded], files)
+        for (fp, a), (_, b) in zip(serial, threaded):
+            if fp == missing:
+                self.assertIsInstance(a, FileNotFoundError)
+                self.assertIsInstance(b, FileNotFoundError)
+            else:
+                self.assertIsInstance(a, dict)
+                self.assertEqual(a, b)
+
+    def test_unknown_executor(self):
+        with self.assertRaises(ValueError):
+            list(header.read_headers(["a", "b"], workers=2, executor="fiber"))
+
+    def test_parallel_output_identical(self):
+        serial, uid = dicom2fhir.process_dicom_2_fhir(self.dcmDir)
+        self.assertEqual(serial.numberOfSeries, 3)
+        self.assertEqual(serial.numberOfInstances, 12)
+        for executor in ("thread", "process"):
+            study, puid = dicom2fhir.process_dicom_2_fhir(
+                self.dcmDir, workers=3, executor=executor)
+            self.assertEqual(puid, uid)
+            self.assertEqual(_study_json(study), _study_json(serial), executor)
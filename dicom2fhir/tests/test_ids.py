@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+from urllib.parse import unquote
+
+from fhir.resources.R4B import bundle
+
+from .. import dicom2fhir
+from .. import dicom2fhirutils
+from .. import writers
+from . import synthetic
+
+
+class testIds(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "export")
+        for n in range(2):
+            synthetic.write_study(os.path.join(self.root, "study%d" % n), n_series=1, n_instances=2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_gen_study_id(self):
+        uid = "1.2.840.113619.2.55.3"
+        self.assertNotEqual(dicom2fhirutils.gen_study_id(uid), dicom2fhirutils.gen_study_id(uid))
+        self.assertEqual(dicom2fhirutils.gen_study_id(uid, "uuid5"),
+                         dicom2fhirutils.gen_study_id(uid, "uuid5"))
+        self.assertEqual(len(dicom2fhirutils.gen_study_id(uid, "sha256")), 64)
+        self.assertNotEqual(dicom2fhirutils.gen_study_id(uid, "sha256"),
+                            dicom2fhirutils.gen_study_id(uid + ".1", "sha256"))
+        with self.assertRaises(ValueError):
+            dicom2fhirutils.gen_study_id(uid, "uuid1")
+
+    def test_deterministic_across_conversions(self):
+        for strategy in ("uuid5", "sha256"):
+            ids = {}
+            for backend in ("model", "dict", "compact"):
+                for _ in range(2):
+                    for study, uid in dicom2fhir.iter_studies(self.root, backend=backend,
+                                                              id_strategy=strategy):
+                        data = json.loads(writers.study_json(study))
+                        ids.setdefault(uid, set()).add(data["id"])
+            self.assertEqual(len(ids), 2)
+            for uid, study_ids in ids.items():
+                self.assertEqual(study_ids, {dicom2fhirutils.gen_study_id(uid, strategy)})
+
+    def _entries(self, request, strategy):
+        out = os.path.join(self.tmp.name, request + strategy)
+        paths = writers.write_bundles(dicom2fhir.iter_studies(self.root, backend="dict",
+                                                              id_strategy=strategy),
+                                      out, request=request)
+        with open(paths[0]) as fh:
+            text = fh.read()
+        bundle.Bundle.parse_raw(text)
+        return json.loads(text)["entry"]
+
+    def test_request_modes(self):
+        for entry in self._entries("create", "uuid4"):
+            self.assertEqual(entry["request"], {"method": "POST", "url": "ImagingStudy"})
+            self.assertEqual(entry["fullUrl"], "urn:uuid:" + entry["resource"]["id"])
+        for entry in self._entries("update", "sha256"):
+            self.assertEqual(entry["request"],
+                             {"method": "PUT", "url": "ImagingStudy/" + entry["resource"]["id"]})
+            # sha256 ids are not UUIDs
+            self.assertNotIn("fullUrl", entry)
+        for entry in self._entries("conditional", "uuid5"):
+            self.assertEqual(entry["request"]["method"], "POST")
+            value, = [i["value"] for i in entry["resource"]["identifier"]
+                      if i.get("system") == "urn:dicom:uid"]
+            self.assertEqual(unquote(entry["request"]["ifNoneExist"]),
+                             "identifier=urn:dicom:uid|" + value)
+        with self.assertRaises(ValueError):
+            writers.BundleWriter(os.path.join(self.tmp.name, "x"), request="upsert")
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from . import synthetic
+
+# seconds for "import dicom2fhir.dicom2fhir" in a new interpreter, the
+# best of three runs; most of it is pydicom
+IMPORT_BUDGET = 1.0
+
+MODULES = ["dicom2fhir.dicom2fhir", "dicom2fhir.cli", "dicom2fhir.partial",
+           "dicom2fhir.watch", "dicom2fhir.writers", "dicom2fhir.build_bodysite_mapping"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _python(code):
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                         capture_output=True, text=True)
+    return out.stdout.strip()
+
+
+def _blocked(names, code):
+    # code run with names unimportable
+    return "import sys\n" + "".join(f"sys.modules[{n!r}] = None\n" for n in names) + code
+
+
+class testImports(unittest.TestCase):
+    def test_import_budget(self):
+        code = ("from time import perf_counter\n"
+                "start = perf_counter()\n"
+                "import dicom2fhir.dicom2fhir\n"
+                "print(perf_counter() - start)")
+        best = min(float(_python(code)) for _ in range(3))
+        self.assertLess(best, IMPORT_BUDGET)
+
+    def test_no_heavy_dependencies(self):
+        # pandas and lxml only regenerate the mapping, tqdm is only loaded
+        # for progress=True and fhir.resources only by the model backend
+        code = "".join(f"import {m}\n" for m in MODULES) + "print('ok')"
+        self.assertEqual(_python(_blocked(["pandas", "lxml", "tqdm", "fhir"], code)), "ok")
+
+    def test_dict_backend_without_fhir_resources(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            synthetic.write_study(tmp, n_series=2, n_instances=2)
+            code = ("from dicom2fhir import dicom2fhir\n"
+                    f"study, uid = dicom2fhir.process_dicom_2_fhir({tmp!r}, backend='dict')\n"
+                    "print(study['numberOfInstances'])")
+            self.assertEqual(_python(_blocked(["fhir", "tqdm"], code)), "4")
@@ -0,0 +1,120 @@
+import copy
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pydicom import dcmread
+from pydicom.uid import generate_uid
+
+from .. import dicom2fhir
+from .. import header
+from .. import incremental
+from .. import writers
+from . import synthetic
+
+
+def _apply(doc, patch):
+    # the add and replace operations of RFC 6902 the updater emits
+    doc = copy.deepcopy(doc)
+    for op in patch:
+        *parents, last = op["path"].split("/")[1:]
+        target = doc
+        for key in parents:
+            target = target[int(key)] if isinstance(target, list) else target[key]
+        if op["op"] == "add" and last == "-":
+            target.append(op["value"])
+        else:
+            target[last] = op["value"]
+    return doc
+
+
+def _json(study):
+    data = json.loads(writers.study_json(study))
+    data.pop("id")
+    return data
+
+
+class testIncremental(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dcmDir = os.path.join(self.tmp.name, "study")
+        self.files = synthetic.write_study(self.dcmDir, n_series=2, n_instances=3)
+        self.late = os.path.join(self.tmp.name, "late")
+        os.makedirs(self.late)
+        first = dcmread(self.files[0])
+        # a late instance of the first series, a new series and a duplicate
+        ds = synthetic.make_dataset(first.StudyInstanceUID, first.SeriesInstanceUID,
+                                    generate_uid(), instance_number=10)
+        synthetic.write_dataset(ds, os.path.join(self.late, "a.dcm"))
+        series = generate_uid()
+        for n in (1, 2):
+            ds = synthetic.make_dataset(first.StudyInstanceUID, series, generate_uid(),
+                                        series_number=9, instance_number=n)
+            synthetic.write_dataset(ds, os.path.join(self.late, "b%d.dcm" % n))
+        shutil.copy(self.files[-1], os.path.join(self.late, "dup.dcm"))
+        self.seriesUID = first.SeriesInstanceUID
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _move_late(self):
+        for name in os.listdir(self.late):
+            shutil.copy(os.path.join(self.late, name), os.path.join(self.dcmDir, "late-" + name))
+
+    def test_update_matches_rebuild(self):
+        for backend in ("model", "dict", "compact"):
+            study, _ = dicom2fhir.process_dicom_2_fhir(self.dcmDir, backend=backend)
+            before = json.loads(writers.study_json(study))
+            updater = incremental.StudyUpdater(study)
+            patch = updater.update(self.late)
+            self.assertEqual(updater.stats.counters["duplicate_instances"], 1)
+            after = json.loads(writers.study_json(updater.study))
+            self.assertEqual(_apply(before, patch), after)
+            self.assertEqual(after["numberOfSeries"], 3)
+            self.assertEqual(after["numberOfInstances"], 9)
+            ops = [(op["op"], op["path"]) for op in patch]
+            n = [s["uid"] for s in before["series"]].index(self.seriesUID)
+            self.assertEqual(ops, [("add", "/series/%d/instance/-" % n),
+                                   ("replace", "/series/%d/numberOfInstances" % n),
+                                   ("add", "/series/-"),
+                                   ("replace", "/numberOfSeries"),
+                                   ("replace", "/numberOfInstances")])
+
+        # the same as converting everything again
+        self._move_late()
+        rebuilt, _ = dicom2fhir.process_dicom_2_fhir(self.dcmDir, backend="dict")
+
+        def instances(study):
+            return {s["uid"]: sorted(i["uid"] for i in s["instance"]) for s in study["series"]}
+
+        self.assertEqual(instances(after), instances(_json(rebuilt)))
+        self.assertEqual(after["numberOfInstances"], _json(rebuilt)["numberOfInstances"])
+
+    def test_json_input_and_nothing_new(self):
+        study, _ = dicom2fhir.process_dicom_2_fhir(self.dcmDir)
+        updated, patch = incremental.update_study(study.json(), [self.files[0]])
+        self.assertEqual(patch, [])
+        self.assertIsInstance(updated, dict)
+        self.assertEqual(updated["numberOfInstances"], 6)
+
+    def test_work_scales_with_new_files(self):
+        study, _ = dicom2fhir.process_dicom_2_fhir(self.dcmDir, backend="dict")
+        updater = incremental.StudyUpdater(study)
+        with mock.patch.object(header, "read_header", wraps=header.read_header) as reader:
+            updater.update([os.path.join(self.late, "a.dcm")])
+            updater.update([os.path.join(self.late, "b1.dcm")])
+            patch = updater.update([os.path.join(self.late, "b2.dcm")])
+        self.assertEqual(reader.call_count, 3)
+        # b2 joins the series added by the update before
+        self.assertEqual([op["path"] for op in patch],
+                         ["/series/2/instance/-", "/series/2/numberOfInstances", "/numberOfInstances"])
+
+    def test_other_study_is_rejected(self):
+        study, _ = dicom2fhir.process_dicom_2_fhir(self.dcmDir, backend="dict")
+        other = synthetic.write_study(os.path.join(self.tmp.name, "other"), n_series=1, n_instances=1)
+        updater = incremental.StudyUpdater(study)
+        self.assertEqual(updater.update(other), [])
+        self.assertEqual(updater.stats.counters["errors"], 1)
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+
+from pydicom import dcmread
+from pydicom.uid import generate_uid
+
+from .. import dicom2fhir
+from . import synthetic
+
+
+class testIterStudies(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.uids = [generate_uid() for _ in range(3)]
+        self.files = {}
+        for n, uid in enumerate(self.uids):
+            self.files[uid] = synthetic.write_study(
+                os.path.join(self.root, "study%d" % n), n_series=n + 1,
+                n_instances=2, study_uid=uid)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_groups_tree_by_study(self):
+        studies = {uid: study for study, uid in dicom2fhir.iter_studies(self.root)}
+        self.assertEqual(set(studies), set(self.uids))
+        for n, uid in enumerate(self.uids):
+            self.assertEqual(studies[uid].numberOfSeries, n + 1)
+            self.assertEqual(studies[uid].numberOfInstances, 2 * (n + 1))
+
+    def test_study_that_cannot_be_created(self):
+        # the first file of one study and every file of another lack the
+        # AccessionNumber create_study needs
+        partly, broken = generate_uid(), generate_uid()
+        bad = {}
+        for name, uid, n_bad in (("partly", partly, 1), ("broken", broken, 2)):
+            bad[uid] = synthetic.write_study(os.path.join(self.root, name), n_series=1,
+                                             n_instances=2, study_uid=uid)
+            for fp in bad[uid][:n_bad]:
+                ds = dcmread(fp)
+                del ds.AccessionNumber
+                ds.save_as(fp)
+        manifest = [fp for uid in self.uids + [partly, broken] for fp in sorted(
+            self.files.get(uid) or bad[uid])]
+        for kwargs in ({"dcmDir": self.root}, {"manifest": manifest}):
+            for backend in ("model", "dict"):
+                studies = {uid: study for study, uid in dicom2fhir.iter_studies(
+                    backend=backend, **kwargs)}
+                self.assertEqual(set(studies), set(self.uids) | {partly})
+                count = studies[partly]["numberOfInstances"] if backend == "dict" \
+                    else studies[partly].numberOfInstances
+                self.assertEqual(count, 1)
+
+    def test_sorted_manifest_flushes_each_study(self):
+        manifest = os.path.join(self.root, "manifest.txt")
+        with open(manifest, "w") as fh:
+            for uid in self.uids:
+                for fp in self.files[uid]:
+                    fh.write(os.path.relpath(fp, self.root) + "\n")
+
+        seen = []
+        for study, uid in dicom2fhir.iter_studies(self.root, manifest=manifest):
+            seen.append(uid)
+        self.assertEqual(seen, self.uids)
+
+        # a study comes out as soon as the first file of the next one is read
+        manifest = [fp for uid in self.uids for fp in self.files[uid]]
+        consumed = []
+        for n, (study, uid) in enumerate(
+                dicom2fhir.iter_studies(manifest=_tap(manifest, consumed))):
+            self.assertEqual(uid, self.uids[n])
+            if n + 1 < len(self.uids):
+                self.assertEqual(consumed[-1], self.files[self.uids[n + 1]][0])
+            else:
+                self.assertEqual(consumed, manifest)
+
+    def test_unsorted_manifest_is_rejected(self):
+        a, b = self.uids[0], self.uids[1]
+        manifest = [self.files[a][0], self.files[b][0], self.files[a][1]]
+        with self.assertRaises(Exception):
+            list(dicom2fhir.iter_studies(manifest=manifest))
+
+    def test_process_dicom_2_fhir_rejects_multiple_studies(self):
+        with self.assertRaises(Exception):
+            dicom2fhir.process_dicom_2_fhir(self.root)
+
+
+def _tap(iterable, consumed):
+    for item in iterable:
+        consumed.append(item)
+        yield item
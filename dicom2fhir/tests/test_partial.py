@@ -0,0 +1,113 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from pydicom import dcmread
+from pydicom.uid import generate_uid
+
+from .. import partial
+from .. import writers
+from . import synthetic
+
+
+def _output(partials, backend="dict"):
+    results = {}
+    for uid, p in partials.items():
+        study = p.to_study(backend)
+        if backend == "dict":
+            study["id"] = "x"
+        else:
+            study.id = "x"
+        results[uid] = writers.study_json(study)
+    return results
+
+
+class testPartial(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = self.tmp.name
+        self.files = synthetic.write_study(os.path.join(root, "a"), n_series=3, n_instances=4,
+                                           modalities=["CT", "SR", "MR"])
+        self.files += synthetic.write_study(os.path.join(root, "b"), n_series=1, n_instances=3)
+        # a duplicate instance and a conflicting study description
+        dup = os.path.join(root, "dup.dcm")
+        shutil.copy(self.files[0], dup)
+        conflict = os.path.join(root, "conflict.dcm")
+        ds = dcmread(self.files[1])
+        ds.StudyDescription = "Another description"
+        ds.SOPInstanceUID = generate_uid()
+        ds.save_as(conflict)
+        with open(os.path.join(root, "junk.txt"), "w") as fh:
+            fh.write("not dicom")
+        self.files += [dup, conflict, os.path.join(root, "junk.txt")]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sharding_invariance(self):
+        expected = _output(partial.read_partials(self.files))
+        self.assertEqual(len(expected), 2)
+        rng = random.Random(0)
+        for n_shards in (1, 2, 3, 7):
+            for strategy in ("hash", "contiguous", "round_robin"):
+                files = list(self.files)
+                rng.shuffle(files)
+                shards = [partial.read_partials(s) for s in partial.partition(files, n_shards, strategy)]
+                rng.shuffle(shards)
+                self.assertEqual(_output(partial.merge_partials(shards)), expected,
+                                 (n_shards, strategy))
+
+    def test_associative_merge(self):
+        a, b, c = [partial.read_partials(s) for s in partial.partition(self.files, 3, "round_robin")]
+        before = json.dumps([{u: p.to_dict() for u, p in x.items()} for x in (a, b, c)], sort_keys=True)
+        left = partial.merge_partials([partial.merge_partials([a, b]), c])
+        right = partial.merge_partials([a, partial.merge_partials([b, c])])
+        self.assertEqual({u: p.to_dict() for u, p in left.items()},
+                         {u: p.to_dict() for u, p in right.items()})
+        self.assertEqual(sum(p.records for p in left.values()), 17)
+        # merging leaves its inputs unchanged
+        self.assertEqual(
+            json.dumps([{u: p.to_dict() for u, p in x.items()} for x in (a, b, c)], sort_keys=True),
+            before)
+
+    def test_duplicates_and_conflicts(self):
+        partials = partial.read_partials(self.files)
+        study_uid = dcmread(self.files[0]).StudyInstanceUID
+        p = partials[study_uid]
+        self.assertEqual(p.duplicates, 1)
+        self.assertEqual(p.study["StudyDescription"], "Another description")
+        self.assertEqual(p.conflicts["StudyDescription"],
+                         ['"Another description"', '"Synthetic study"'])
+        study = p.to_study("model")
+        self.assertEqual(study.numberOfInstances, 13)
+        self.assertEqual([s.number for s in study.series], [1, 2, 3])
+
+    def test_dump_and_load(self):
+        out = os.path.join(self.tmp.name, "shards")
+        manifests = partial.partition_manifest(self.files, 2, out)
+        dumps = []
+        for n, manifest in enumerate(manifests):
+            with open(manifest) as fh:
+                shard = [line.strip() for line in fh]
+            path = os.path.join(out, "partial-%d.ndjson" % n)
+            partial.dump_partials(partial.read_partials(shard), path)
+            dumps.append(path)
+        merged = partial.merge_partials(partial.load_partials(p) for p in dumps)
+        self.assertEqual(_output(merged, "model"), _output(partial.read_partials(self.files), "model"))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            partial.partition(self.files, 0)
+        with self.assertRaises(ValueError):
+            partial.partition(self.files, 2, "random")
+        with self.assertRaises(ValueError):
+            partial.PartialStudy("1.2").merge(partial.PartialStudy("1.3"))
+        with self.assertRaises(ValueError):
+            partial.PartialStudy.from_dict({"version": 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
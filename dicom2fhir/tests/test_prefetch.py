@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from .. import cache
+from .. import dicom2fhir
+from .. import header
+from .. import prefetch
+from .. import writers
+from ..stats import ConversionStats
+from . import synthetic
+
+
+def _json(study):
+    data = json.loads(writers.study_json(study))
+    data.pop("id")
+    return data
+
+
+class testPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.files = synthetic.write_study(self.root, n_series=3, n_instances=4,
+                                           private_bytes=8 * 1024, junk_fraction=0.2, seed=3)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_order_and_headers(self):
+        missing = os.path.join(self.root, "missing.dcm")
+        members = list(prefetch.prefetch(self.files + [missing], threads=4))
+        self.assertEqual([str(m) for m in members], self.files + [missing])
+        # unreadable files are passed on for the parser to report
+        self.assertEqual(members[-1], missing)
+        for fp, member in zip(self.files, members):
+            self.assertEqual(os.fspath(member), fp)
+            self.assertTrue(member.complete)
+            self.assertEqual(member.read_header(), header.read_header(fp))
+
+    def test_long_headers_fall_back_to_the_file(self):
+        members = list(prefetch.prefetch(self.files, header_bytes=1024))
+        self.assertFalse(members[0].complete)
+        self.assertEqual(len(members[0].data), 1024)
+        with mock.patch.object(header, "read_header", wraps=header.read_header) as reader:
+            self.assertEqual(members[0].read_header(), header.read_header(self.files[0]))
+            reader.assert_any_call(self.files[0], True)
+
+    def test_close_early(self):
+        members = prefetch.prefetch(self.files * 20, threads=2)
+        self.assertEqual(str(next(members)), self.files[0])
+        members.close()
+
+    def test_memory_budget(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+        read_prefix = prefetch._read_prefix
+
+        def counting(*args):
+            with lock:
+                active[0] += 1
+            member = read_prefix(*args)
+            with lock:
+                peak[0] = max(peak[0], active[0])
+            return member
+
+        def consume(member):
+            with lock:
+                active[0] -= 1
+
+        # a budget of two headers: never more than two read ahead
+        with mock.patch.object(prefetch, "_read_prefix", counting):
+            for member in prefetch.prefetch(self.files, threads=8, header_bytes=64 * 1024,
+                                            memory_budget=128 * 1024):
+                consume(member)
+        self.assertLessEqual(peak[0], 2)
+
+    def test_conversion(self):
+        expected, _ = dicom2fhir.process_dicom_2_fhir(self.root, backend="dict")
+        for progress in (False, True):
+            stats = ConversionStats()
+            study, _ = dicom2fhir.process_dicom_2_fhir(self.root, backend="dict", prefetch=4,
+                                                       stats=stats, progress=progress)
+            self.assertEqual(_json(study), _json(expected))
+            junk = stats.counters["rejected_magic"]
+            self.assertGreater(junk, 0)
+            self.assertEqual(stats.counters["non_dicom"], 0)
+        (study, _), = dicom2fhir.iter_studies(self.root, backend="dict", prefetch=4)
+        self.assertEqual(_json(study), _json(expected))
+
+    def test_cache_keys_by_path(self):
+        with cache.HeaderCache(os.path.join(self.root, "cache")) as c:
+            dicom2fhir.process_dicom_2_fhir(self.root, backend="dict", prefetch=2, cache=c)
+            dicom2fhir.process_dicom_2_fhir(self.root, backend="dict", prefetch=2, cache=c)
+            self.assertEqual(c.stats()["hits"], len(self.files))
@@ -0,0 +1,91 @@
+import json
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from pydicom import dcmread
+
+from .. import dicom2fhir
+from .. import sources
+from .. import writers
+from . import synthetic
+
+
+class testSources(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dcmDir = os.path.join(self.tmp.name, "study")
+        self.files = synthetic.write_study(self.dcmDir, n_series=2, n_instances=3, seed=3)
+        # pixel data after the header, and one header longer than HEADER_BYTES
+        for n, fp in enumerate(self.files[:2]):
+            ds = dcmread(fp)
+            if n:
+                synthetic.add_private_bloat(ds, 300 * 1024)
+            ds.add_new(0x7FE00010, "OB", bytes(400 * 1024))
+            ds.save_as(fp)
+        self.expected = self._json(self.dcmDir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _json(self, source):
+        # independent of the order in which the source lists its files
+        study, _ = dicom2fhir.process_dicom_2_fhir(source, backend="dict")
+        study["id"] = "x"
+        study = json.loads(writers.study_json(study))
+        study["series"].sort(key=lambda s: s["uid"])
+        for s in study["series"]:
+            s["instance"].sort(key=lambda i: i["uid"])
+        return study
+
+    def _archive_names(self):
+        return [os.path.relpath(fp, self.dcmDir) for fp in self.files]
+
+    def test_zip(self):
+        path = os.path.join(self.tmp.name, "study.zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for fp, name in zip(self.files, self._archive_names()):
+                zf.write(fp, name)
+            zf.writestr("README.txt", "not dicom")
+        self.assertEqual(self._json(path), self.expected)
+
+    def test_tar_gz(self):
+        path = os.path.join(self.tmp.name, "study.tar.gz")
+        with tarfile.open(path, "w:gz") as tf:
+            tf.add(self.dcmDir, "study")
+        self.assertEqual(self._json(path), self.expected)
+        # the other iter_studies entry point takes archives as well
+        self.assertEqual(len(list(dicom2fhir.iter_studies(path))), 1)
+
+    def test_buffers(self):
+        blobs = []
+        for n, fp in enumerate(self.files):
+            with open(fp, "rb") as fh:
+                data = fh.read()
+            blobs.append((fp, memoryview(data) if n % 2 else data))
+        self.assertEqual(self._json(sources.buffer_members(blobs)), self.expected)
+
+    def test_mmap(self):
+        self.assertEqual(self._json(sources.mmap_members(self.files)), self.expected)
+
+    def test_header_limited_reads(self):
+        members = list(sources.mmap_members(self.files))
+        self.assertEqual([m.complete for m in members[:3]], [False, False, True])
+        self.assertEqual(len(members[0].data), sources.HEADER_BYTES)
+        for member in members:
+            self.assertEqual(member.read_header()["SOPInstanceUID"],
+                             dcmread(str(member), stop_before_pixels=True).SOPInstanceUID)
+        # only the header that does not fit into HEADER_BYTES was read whole
+        self.assertFalse(members[0].complete)
+        self.assertTrue(members[1].complete)
+
+    def test_not_an_archive(self):
+        with self.assertRaises(ValueError):
+            list(sources.archive_members(self.files[0]))
+        self.assertFalse(sources.is_archive(self.dcmDir))
+
+
+if __name__ == '__main__':
+    unittest.main()
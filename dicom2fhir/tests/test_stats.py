@@ -0,0 +1,114 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from .. import dicom2fhir
+from ..stats import ConversionStats, Hook
+from . import synthetic
+
+
+class _Recorder(Hook):
+    def __init__(self):
+        self.events = []
+
+    def on_start(self, total):
+        self.events.append(("start", total))
+
+    def on_file(self, fp, ok):
+        self.events.append(("file", ok))
+
+    def on_study(self, study, studyInstanceUID):
+        self.events.append(("study", studyInstanceUID))
+
+    def on_finish(self, stats):
+        self.events.append(("finish", stats.counters["files"]))
+
+
+class testStats(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        files = synthetic.write_study(self.root, n_series=2, n_instances=3,
+                                      study_uid="1.2.3", junk_fraction=0.25, seed=1)
+        # a copy of an instance is a duplicate SOPInstanceUID
+        with open(files[0], "rb") as src, open(os.path.join(self.root, "copy.dcm"), "wb") as dst:
+            dst.write(src.read())
+        self.junk = sum(1 for r, _, f in os.walk(self.root) for n in f) - len(files) - 1
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_counters_and_timings(self):
+        for backend in ("model", "dict"):
+            stats = ConversionStats()
+            dicom2fhir.process_dicom_2_fhir(self.root, backend=backend, stats=stats)
+            c = stats.counters
+            self.assertEqual(c["series"], 2)
+            self.assertEqual(c["instances"], 6)
+            self.assertEqual(c["duplicate_instances"], 1)
+            # junk files are rejected by discovery before they are read
+            self.assertEqual(c["rejected"], self.junk)
+            self.assertEqual(c["non_dicom"], 0)
+            self.assertEqual(c["files"], 6 + 1)
+            self.assertEqual(c["studies"], 1)
+            for stage in ("walk", "read", "assemble", "datetime", "snomed"):
+                self.assertIn(stage, stats.timings)
+
+    def test_hooks(self):
+        recorder = _Recorder()
+        stats = ConversionStats(hooks=[recorder])
+        list(dicom2fhir.iter_studies(self.root, stats=stats))
+        self.assertEqual(recorder.events[0], ("start", None))
+        self.assertEqual(recorder.events[-2], ("study", "1.2.3"))
+        self.assertEqual(recorder.events[-1], ("finish", 6 + 1))
+        oks = [e[1] for e in recorder.events if e[0] == "file"]
+        self.assertEqual(oks.count(False), 0)
+
+    def test_nested_timed(self):
+        # the walk is pulled while headers are read, its time is not read time
+        def walk():
+            for n in range(3):
+                time.sleep(0.05)
+                yield n
+
+        def read(files):
+            for fp in files:
+                time.sleep(0.01)
+                yield fp
+
+        stats = ConversionStats()
+        self.assertEqual(list(stats.timed(read(stats.timed(walk(), "walk")), "read")), [0, 1, 2])
+        self.assertGreaterEqual(stats.timings["walk"], 0.15)
+        self.assertGreaterEqual(stats.timings["read"], 0.03)
+        self.assertLess(stats.timings["read"], 0.1)
+
+    def test_progress_is_opt_in(self):
+        with mock.patch("tqdm.tqdm") as bar:
+            stats = ConversionStats()
+            dicom2fhir.process_dicom_2_fhir(self.root, stats=stats)
+            bar.assert_not_called()
+            dicom2fhir.process_dicom_2_fhir(self.root, stats=stats, progress=True)
+            bar.assert_called_once()
+            self.assertEqual(stats.hooks, [])
+
+    def test_progress_closed_on_error_and_early_stop(self):
+        other = synthetic.write_study(os.path.join(self.root, "other"), n_series=1, n_instances=1)
+        self.assertTrue(other)
+        with mock.patch("tqdm.tqdm") as bar:
+            stats = ConversionStats()
+            with self.assertRaises(Exception):
+                dicom2fhir.process_dicom_2_fhir(self.root, stats=stats, progress=True)
+            self.assertEqual(stats.hooks, [])
+            self.assertEqual(bar.return_value.close.call_count, 1)
+
+            studies = dicom2fhir.iter_studies(self.root, stats=stats, progress=True)
+            next(studies)
+            studies.close()
+            self.assertEqual(stats.hooks, [])
+            self.assertEqual(bar.return_value.close.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import gzip
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .. import upload
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        bundle = json.loads(body)
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+            status = server.statuses.pop(0) if server.statuses else 200
+            if status == 200:
+                server.bundles.append(bundle)
+        response = json.dumps({"resourceType": "Bundle", "type": bundle["type"] + "-response",
+                               "entry": [{"response": {"status": "201 Created"}}
+                                         for _ in bundle["entry"]]}).encode()
+        time.sleep(server.delay)
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Type", "application/fhir+json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+def _studies(n):
+    return [{"resourceType": "ImagingStudy", "id": "study-%d" % i, "status": "available",
+             "subject": {"reference": "Patient/1"}} for i in range(n)]
+
+
+class testUpload(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.lock = threading.Lock()
+        self.server.connections = set()
+        self.server.statuses = []
+        self.server.bundles = []
+        self.server.requests = 0
+        self.server.delay = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = "http://127.0.0.1:%d/fhir" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _received(self):
+        return sorted(e["resource"]["id"] for b in self.server.bundles for e in b["entry"])
+
+    def test_batches_over_keep_alive(self):
+        with upload.Uploader(self.url, bundle_size=10, concurrency=1) as uploader:
+            stats = uploader.upload((study, None) for study in _studies(25))
+        self.assertEqual(stats.bundles, 3)
+        self.assertEqual(stats.studies, 25)
+        self.assertEqual(stats.failed_studies, 0)
+        self.assertEqual(sorted(len(b["entry"]) for b in self.server.bundles), [5, 10, 10])
+        self.assertEqual(self._received(), sorted(s["id"] for s in _studies(25)))
+        self.assertEqual(self.server.bundles[0]["type"], "transaction")
+        # one connection for all three requests
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(uploader.pool.created, 1)
+
+    def test_concurrent(self):
+        stats = upload.upload(_studies(40), self.url, bundle_size=3, concurrency=4, compress=False)
+        self.assertEqual(stats.bundles, 14)
+        self.assertEqual(len(self._received()), 40)
+        self.assertLessEqual(len(self.server.connections), 4)
+        summary = stats.as_dict()
+        self.assertEqual(set(summary["latency"]), {"p50", "p90", "p99"})
+        self.assertLessEqual(summary["latency"]["p50"], summary["latency"]["p99"])
+        self.assertGreater(summary["studies_per_sec"], 0)
+
+    def test_retries(self):
+        self.server.statuses = [503, 429]
+        stats = upload.upload(_studies(5), self.url, bundle_size=5, backoff=0.01, request="update")
+        self.assertEqual(stats.retries, 2)
+        self.assertEqual(len(stats.latencies), 3)
+        self.assertEqual(stats.failed_bundles, 0)
+        self.assertEqual(len(self._received()), 5)
+
+    def test_create_is_not_resent(self):
+        # the server may have stored the studies before failing
+        self.server.statuses = [429, 503]
+        stats = upload.upload(_studies(2), self.url, bundle_size=2, backoff=0.01)
+        self.assertEqual(stats.retries, 1)
+        self.assertEqual(stats.failed_bundles, 1)
+        self.server.delay = 1
+        with upload.Uploader(self.url, bundle_size=2, backoff=0.01, timeout=0.2) as uploader:
+            stats = uploader.upload(_studies(2))
+        self.assertEqual(stats.retries, 0)
+        self.assertEqual(stats.failed_bundles, 1)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_failures(self):
+        self.server.statuses = [400, 503, 503]
+        stats = upload.upload(_studies(4), self.url, bundle_size=2, concurrency=1,
+                              max_retries=1, backoff=0.01, request="update")
+        # 400 is not retried, the second Bundle gives up after one retry
+        self.assertEqual(stats.failed_bundles, 2)
+        self.assertEqual(stats.failed_studies, 4)
+        self.assertEqual(stats.retries, 1)
+        self.assertEqual(self._received(), [])
+
+    def test_percentile(self):
+        values = [0.1 * i for i in range(1, 11)]
+        self.assertEqual(upload._percentile(values, 50), values[4])
+        self.assertEqual(upload._percentile(values, 99), values[9])
+        self.assertEqual(upload._percentile([], 50), 0.0)
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from pydicom.uid import generate_uid
+
+from .. import watch
+from . import synthetic
+
+
+async def _collect(watcher, expected, timeout=10):
+    results = []
+
+    async def consume():
+        async for study, uid in watcher.studies():
+            results.append((study, uid))
+            if len(results) == expected:
+                watcher.stop()
+
+    await asyncio.wait_for(consume(), timeout)
+    return results
+
+
+class testDropFolderWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.incoming = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write_series(self, name, study_uid, n):
+        return synthetic.write_study(
+            os.path.join(self.incoming, name), n_series=1, n_instances=n,
+            study_uid=study_uid)
+
+    def _run(self, use_inotify):
+        first, second = generate_uid(), generate_uid()
+        self._write_series("existing", first, 2)
+        watcher = watch.DropFolderWatcher(
+            self.incoming, quiet_period=0.5, poll_interval=0.05,
+            use_inotify=use_inotify)
+
+        async def scenario():
+            collector = asyncio.ensure_future(_collect(watcher, 2))
+            await asyncio.sleep(0.2)
+            # instances keep arriving for the first study, the second study
+            # lands in a new directory
+            self._write_series("late", first, 1)
+            self._write_series("other", second, 3)
+            return await collector
+
+        results = asyncio.run(scenario())
+        studies = {uid: study for study, uid in results}
+        self.assertEqual(set(studies), {first, second})
+        self.assertEqual(studies[first].numberOfInstances, 3)
+        self.assertEqual(studies[first].numberOfSeries, 2)
+        self.assertEqual(studies[second].numberOfInstances, 3)
+
+    def test_polling(self):
+        self._run(use_inotify=False)
+
+    @unittest.skipUnless(watch.inotify_available(), "inotify is not available")
+    def test_inotify(self):
+        self._run(use_inotify=True)
+
+    def test_slow_read_is_not_reaped_early(self):
+        uid = generate_uid()
+        files = self._write_series("existing", uid, 3)
+        read = watch.header._read_header_or_error
+
+        def slow(fp, *args):
+            if fp == files[-1]:
+                time.sleep(0.8)
+            return read(fp, *args)
+
+        watcher = watch.DropFolderWatcher(
+            self.incoming, quiet_period=0.2, poll_interval=0.05, backend="dict",
+            use_inotify=False)
+
+        async def scenario():
+            async def stop_later():
+                await asyncio.sleep(1.5)
+                watcher.stop()
+            asyncio.ensure_future(stop_later())
+            return [r async for r in watcher.studies()]
+
+        with mock.patch.object(watch.header, "_read_header_or_error", slow):
+            results = asyncio.run(scenario())
+        self.assertEqual([u for _, u in results], [uid])
+        self.assertEqual(results[0][0]["numberOfInstances"], 3)
+
+    def test_stop_flushes_pending_studies(self):
+        uid = generate_uid()
+        self._write_series("existing", uid, 2)
+        watcher = watch.DropFolderWatcher(
+            self.incoming, quiet_period=60, poll_interval=0.05, backend="dict")
+
+        async def scenario():
+            async def stop_later():
+                await asyncio.sleep(0.3)
+                watcher.stop()
+            asyncio.ensure_future(stop_later())
+            return [r async for r in watcher.studies()]
+
+        results = asyncio.run(scenario())
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][1], uid)
+        self.assertEqual(results[0][0]["numberOfInstances"], 2)
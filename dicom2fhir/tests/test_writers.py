@@ -0,0 +1,71 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from fhir.resources.R4B import bundle, imagingstudy
+
+from .. import dicom2fhir
+from .. import writers
+from . import synthetic
+
+
+class testWriters(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "export")
+        for n in range(3):
+            synthetic.write_study(os.path.join(self.root, "study%d" % n),
+                                  n_series=1, n_instances=n + 1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ndjson(self):
+        for backend, name in (("model", "studies.ndjson"), ("dict", "studies.ndjson.gz")):
+            path = os.path.join(self.tmp.name, name)
+            count = writers.write_ndjson(
+                dicom2fhir.iter_studies(self.root, backend=backend), path)
+            self.assertEqual(count, 3)
+            opener = gzip.open if name.endswith(".gz") else open
+            with opener(path, "rt") as fh:
+                lines = fh.read().splitlines()
+            studies = [imagingstudy.ImagingStudy.parse_raw(line) for line in lines]
+            self.assertEqual(sorted(s.numberOfInstances for s in studies), [1, 2, 3])
+
+    def test_single_study_result(self):
+        path = os.path.join(self.tmp.name, "one.ndjson")
+        result = dicom2fhir.process_dicom_2_fhir(os.path.join(self.root, "study1"))
+        self.assertEqual(writers.write_ndjson([result], path), 1)
+
+    def test_bundles(self):
+        out = os.path.join(self.tmp.name, "bundles")
+        paths = writers.write_bundles(
+            dicom2fhir.iter_studies(self.root, backend="dict"), out,
+            bundle_size=2, compress=True)
+        self.assertEqual([os.path.basename(p) for p in paths],
+                         ["bundle-000001.json.gz", "bundle-000002.json.gz"])
+        entries = []
+        for p in paths:
+            with gzip.open(p, "rt") as fh:
+                b = bundle.Bundle.parse_raw(fh.read())
+            self.assertEqual(b.type, "transaction")
+            entries.extend(b.entry)
+        self.assertEqual(len(entries), 3)
+        for e in entries:
+            self.assertEqual(e.request.method, "POST")
+            self.assertEqual(e.request.url, "ImagingStudy")
+            self.assertEqual(e.fullUrl, "urn:uuid:" + e.resource.id)
+
+    def test_empty_bundle_writer(self):
+        out = os.path.join(self.tmp.name, "none")
+        self.assertEqual(writers.write_bundles([], out), [])
+        with self.assertRaises(ValueError):
+            writers.BundleWriter(out, bundle_size=0)
+
+    def test_bundle_is_valid_json(self):
+        out = os.path.join(self.tmp.name, "plain")
+        paths = writers.write_bundles(dicom2fhir.iter_studies(self.root), out)
+        with open(paths[0]) as fh:
+            self.assertEqual(len(json.load(fh)["entry"]), 3)
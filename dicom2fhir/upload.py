@@ -0,0 +1,282 @@
+import gzip
+import http.client
+import json
+import logging
+import math
+import queue
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from dicom2fhir import writers
+
+# Upload of converted studies to a FHIR server: studies are sent as
+# transaction (or batch) Bundles of bundle_size entries, gzip compressed,
+# by at most concurrency threads sharing a pool of keep-alive connections.
+# 429 and 5xx responses and broken connections are retried with
+# exponential backoff. A 5xx or a broken connection may come after the
+# server stored the studies, so in create mode, where resending creates
+# them again, only 429 is retried.
+
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+CREATE_RETRY_STATUS = frozenset((429,))
+
+
+class ConnectionPool:
+    # keep-alive HTTP(S) connections to one host; a connection is taken
+    # by one request at a time and put back once its response is read
+
+    def __init__(self, url, size: int = 4, timeout: float = 60):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme '{parts.scheme}'")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path.rstrip("/") or "/"
+        self.timeout = timeout
+        self.created = 0
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        self.created += 1
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def put(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _percentile(values: list, p: float) -> float:
+    # nearest rank of the sorted values
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class UploadStats:
+    # totals of an upload; latencies are per HTTP request in seconds,
+    # retried requests included
+
+    def __init__(self):
+        self.bundles = 0
+        self.studies = 0
+        self.failed_studies = 0
+        self.failed_bundles = 0
+        self.retries = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.latencies = []
+
+    def percentiles(self, ps=(50, 90, 99)) -> dict:
+        values = sorted(self.latencies)
+        return {"p%d" % p: _percentile(values, p) for p in ps}
+
+    def as_dict(self) -> dict:
+        return {
+            "bundles": self.bundles,
+            "studies": self.studies,
+            "failed_studies": self.failed_studies,
+            "failed_bundles": self.failed_bundles,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "seconds": self.seconds,
+            "studies_per_sec": self.studies / self.seconds if self.seconds else 0.0,
+            "latency": self.percentiles(),
+        }
+
+
+class UploadError(Exception):
+    def __init__(self, status, reason, body=b""):
+        super().__init__(f"{status} {reason}: {body[:200].decode('utf-8', 'replace')}")
+        self.status = status
+
+
+def _entry_failures(body: bytes) -> int:
+    # entries of a batch-response Bundle without a 2xx status
+    try:
+        response = json.loads(body)
+    except ValueError:
+        return 0
+    return sum(1 for entry in response.get("entry", ())
+               if not entry.get("response", {}).get("status", "").startswith("2"))
+
+
+class Uploader:
+    # uploader = Uploader("https://fhir.example.org/fhir")
+    # stats = uploader.upload(dicom2fhir.iter_studies(...))
+
+    def __init__(self, url, bundle_size: int = 100, bundle_type: str = "transaction",
+                 concurrency: int = 4, compress: bool = True, max_retries: int = 5,
+                 backoff: float = 0.5, max_backoff: float = 30, timeout: float = 60,
+                 headers: dict = None, request: str = "create"):
+        # request is the Bundle.entry.request mode, see writers.REQUEST_MODES
+        if bundle_size < 1:
+            raise ValueError("bundle_size must be at least 1")
+        if request not in writers.REQUEST_MODES:
+            raise ValueError("Unknown request mode '%s'" % request)
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.pool = ConnectionPool(url, concurrency, timeout)
+        self.bundle_size = bundle_size
+        self.bundle_type = bundle_type
+        self.request = request
+        self.concurrency = concurrency
+        self.compress = compress
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.headers = {"Content-Type": "application/fhir+json", "Accept": "application/fhir+json"}
+        if compress:
+            self.headers["Content-Encoding"] = "gzip"
+        self.headers.update(headers or {})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def entry_request(self, study) -> dict:
+        return writers.entry_request(study, self.request)
+
+    def bundle(self, studies) -> bytes:
+        # the request body for a list of studies
+        chunks = [writers.bundle_start(self.bundle_type)]
+        for n, study in enumerate(studies):
+            if n:
+                chunks.append(",")
+            chunks.extend(writers.entry_chunks(study, self.entry_request(study)))
+        chunks.append("]}")
+        body = "".join(chunks).encode("utf-8")
+        return gzip.compress(body, compresslevel=6) if self.compress else body
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass  # an HTTP date, use the backoff
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _request(self, body):
+        # (status, reason, headers, response body, seconds) of one POST
+        conn = self.pool.get()
+        start = time.perf_counter()
+        try:
+            conn.request("POST", self.pool.path, body=body, headers=self.headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+        seconds = time.perf_counter() - start
+        if response.will_close:
+            conn.close()
+        else:
+            self.pool.put(conn)
+        return response.status, response.reason, response.headers, data, seconds
+
+    def send(self, body: bytes) -> dict:
+        # posts one Bundle, retrying 429, 5xx and connection errors (429
+        # only in create mode); returns the response body or the last
+        # error, the latencies and retries
+        create = self.request == "create"
+        latencies = []
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                status, reason, headers, data, seconds = self._request(body)
+                latencies.append(seconds)
+                if 200 <= status < 300:
+                    return {"body": data, "error": None, "latencies": latencies, "retries": attempt}
+                error = UploadError(status, reason, data)
+                retry_after = headers.get("Retry-After")
+                retry = status in (CREATE_RETRY_STATUS if create else RETRY_STATUS)
+            except (OSError, http.client.HTTPException) as e:
+                error, retry = e, not create
+            if not retry or attempt >= self.max_retries:
+                return {"body": None, "error": error, "latencies": latencies, "retries": attempt}
+            logging.warning(f"Upload failed ({error}), retrying")
+            time.sleep(self._delay(attempt, retry_after))
+            attempt += 1
+
+    def _send_batch(self, studies):
+        body = self.bundle(studies)
+        result = self.send(body)
+        result["studies"] = len(studies)
+        result["bytes"] = len(body)
+        result["failed"] = 0
+        if result["error"] is None and self.bundle_type == "batch":
+            result["failed"] = _entry_failures(result["body"])
+        return result
+
+    def _batches(self, results):
+        batch = []
+        for study in writers._studies(results):
+            batch.append(study)
+            if len(batch) >= self.bundle_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def upload(self, results, stats: UploadStats = None) -> UploadStats:
+        # results are studies or (study, StudyInstanceUID) tuples; at most
+        # 2 * concurrency Bundles are built ahead of the senders
+        if stats is None:
+            stats = UploadStats()
+        start = time.perf_counter()
+
+        def collect(done):
+            for future in done:
+                result = future.result()
+                stats.bundles += 1
+                stats.studies += result["studies"]
+                stats.bytes += result["bytes"]
+                stats.retries += result["retries"]
+                stats.latencies.extend(result["latencies"])
+                if result["error"] is not None:
+                    logging.error(f"Upload of {result['studies']} studies failed: {result['error']}")
+                    stats.failed_bundles += 1
+                    stats.failed_studies += result["studies"]
+                else:
+                    stats.failed_studies += result["failed"]
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = set()
+            for batch in self._batches(results):
+                pending.add(executor.submit(self._send_batch, batch))
+                if len(pending) >= 2 * self.concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            collect(wait(pending).done)
+        stats.seconds += time.perf_counter() - start
+        return stats
+
+    def close(self):
+        self.pool.close()
+
+
+def upload(results, url, **kwargs) -> UploadStats:
+    with Uploader(url, **kwargs) as uploader:
+        return uploader.upload(results)
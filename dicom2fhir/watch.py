@@ -0,0 +1,239 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+
+from dicom2fhir import dicom2fhir
+from dicom2fhir import header
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    # minimal recursive inotify watch through libc, Linux only
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+
+    def add_watch(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path),
+                             IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.dirs[wd] = path
+
+    def read_events(self):
+        # yields (path, is_dir, mask) for every pending event
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _cookie, length = _EVENT.unpack_from(buf, offset)
+            offset += _EVENT.size
+            name = buf[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                yield None, False, mask
+            elif wd in self.dirs:
+                yield os.path.join(self.dirs[wd], os.fsdecode(name)), bool(mask & IN_ISDIR), mask
+
+    def close(self):
+        os.close(self.fd)
+
+
+def inotify_available() -> bool:
+    try:
+        _Inotify().close()
+        return True
+    except Exception:
+        return False
+
+
+class DropFolderWatcher:
+    # Watches directory (recursively) for new DICOM files, parses them as
+    # they arrive into per-study accumulators and emits an ImagingStudy
+    # once no instance has arrived for quiet_period seconds. A study that
+    # receives files after it was emitted starts a new accumulator.
+
+    def __init__(self, directory, quiet_period: float = 30.0, backend: str = "model",
+                 poll_interval: float = 1.0, use_inotify: bool = None,
+                 process_existing: bool = True, id_strategy: str = "uuid4"):
+        self.directory = directory
+        self.quiet_period = quiet_period
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.use_inotify = inotify_available() if use_inotify is None else use_inotify
+        self.process_existing = process_existing
+        self.id_strategy = id_strategy
+        self.create_study, self.add_series = dicom2fhir._get_backend(backend)
+        self._studies = {}
+        self._polled = {}
+        self._tasks = set()
+        self._queue = None
+        self._stop = None
+
+    def stop(self):
+        # pending studies are emitted before studies() returns
+        if self._stop is not None:
+            self._stop.set()
+
+    async def studies(self):
+        # async generator of (ImagingStudy, StudyInstanceUID)
+        self._queue = asyncio.Queue()
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        watcher = loop.create_task(
+            self._watch_inotify() if self.use_inotify else self._watch_polling())
+        reaper = loop.create_task(self._reap())
+        stopping = loop.create_task(self._stop.wait())
+        try:
+            while True:
+                getter = loop.create_task(self._queue.get())
+                done, _ = await asyncio.wait(
+                    {getter, stopping}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield getter.result()
+                    continue
+                getter.cancel()
+                break
+        finally:
+            for task in (watcher, reaper, stopping):
+                task.cancel()
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+        while not self._queue.empty():
+            yield self._queue.get_nowait()
+        for studyInstanceUID in list(self._studies):
+            yield self._pop(studyInstanceUID)
+
+    def _pop(self, studyInstanceUID):
+        study, _, _ = self._studies.pop(studyInstanceUID)
+        return dicom2fhir._finish(study, self.backend, False), studyInstanceUID
+
+    def _submit(self, fp):
+        task = asyncio.get_running_loop().create_task(self._ingest(fp))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _ingest(self, fp):
+        loop = asyncio.get_running_loop()
+        ds = await loop.run_in_executor(None, header._read_header_or_error, fp)
+        try:
+            if isinstance(ds, Exception):
+                raise ds
+            studyInstanceUID = ds["StudyInstanceUID"]
+            if studyInstanceUID not in self._studies:
+                study, index = self.create_study(ds, fp, self.directory,
+                                                 id_strategy=self.id_strategy)
+                self._studies[studyInstanceUID] = [study, index, loop.time()]
+            else:
+                acc = self._studies[studyInstanceUID]
+                self.add_series(acc[0], ds, fp, acc[1])
+                acc[2] = loop.time()
+        except Exception as e:
+            logging.error(e)
+
+    async def _reap(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(min(self.quiet_period / 4, 1.0))
+            # a file still being read may belong to a quiet study, its
+            # activity is only known once it is added
+            pending = set(self._tasks)
+            if pending:
+                await asyncio.wait(pending)
+            now = loop.time()
+            for studyInstanceUID, (_, _, last) in list(self._studies.items()):
+                if now - last >= self.quiet_period:
+                    self._queue.put_nowait(self._pop(studyInstanceUID))
+
+    def _scan(self, directory):
+        for r, _, f in os.walk(directory):
+            for file in f:
+                yield os.path.join(r, file)
+
+    async def _watch_inotify(self):
+        loop = asyncio.get_running_loop()
+        inotify = _Inotify()
+        try:
+            for r, _, _ in os.walk(self.directory):
+                inotify.add_watch(r)
+            if self.process_existing:
+                for fp in self._scan(self.directory):
+                    self._submit(fp)
+            ready = asyncio.Event()
+            loop.add_reader(inotify.fd, ready.set)
+            try:
+                while True:
+                    await ready.wait()
+                    ready.clear()
+                    for path, is_dir, mask in inotify.read_events():
+                        if path is None:
+                            logging.error("inotify queue overflow, rescanning")
+                            for fp in self._scan(self.directory):
+                                self._submit(fp)
+                        elif is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                            # files may land before the watch is in place
+                            for r, _, _ in os.walk(path):
+                                inotify.add_watch(r)
+                            for fp in self._scan(path):
+                                self._submit(fp)
+                        elif not is_dir and mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                            self._submit(path)
+            finally:
+                loop.remove_reader(inotify.fd)
+        finally:
+            inotify.close()
+
+    async def _watch_polling(self):
+        # a file is parsed once its size and mtime are unchanged between
+        # two scans, so files still being written are not picked up
+        first = True
+        while True:
+            polled = {}
+            for fp in self._scan(self.directory):
+                try:
+                    st = os.stat(fp)
+                except OSError:
+                    continue
+                key = (st.st_size, st.st_mtime_ns)
+                previous = self._polled.get(fp)
+                if first:
+                    if self.process_existing:
+                        self._submit(fp)
+                    polled[fp] = (key, True)
+                elif previous is None or previous[0] != key:
+                    polled[fp] = (key, False)
+                elif not previous[1]:
+                    self._submit(fp)
+                    polled[fp] = (key, True)
+                else:
+                    polled[fp] = previous
+            self._polled = polled
+            first = False
+            await asyncio.sleep(self.poll_interval)
+
+
+async def watch(directory, quiet_period: float = 30.0, **kwargs):
+    # convenience wrapper, runs until cancelled
+    watcher = DropFolderWatcher(directory, quiet_period, **kwargs)
+    async for result in watcher.studies():
+        yield result
@@ -0,0 +1,206 @@
+import gzip
+import io
+import json
+import os
+import uuid
+from urllib.parse import quote
+
+from dicom2fhir import compact
+from dicom2fhir.index import _get
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+
+def study_json(study) -> str:
+    # works for all backends, pydantic models and plain dicts
+    return "".join(study_chunks(study))
+
+
+def study_chunks(study):
+    # the JSON of study in pieces; compact studies are streamed a batch of
+    # instances at a time instead of being materialized whole
+    if compact.is_compact(study):
+        yield from compact.iter_json(study)
+    elif isinstance(study, dict):
+        yield json.dumps(study, separators=(",", ":"))
+    else:
+        yield study.json()
+
+
+# Bundle.entry.request modes: "create" POSTs every study (the server
+# creates a new resource each time), "update" PUTs ImagingStudy/{id} and
+# "conditional" POSTs with ifNoneExist on the urn:dicom:uid identifier.
+# Both of the latter make sending a study again a no-op on the server;
+# "update" needs ids derived from the StudyInstanceUID (id_strategy
+# "uuid5" or "sha256") to be idempotent across conversions
+REQUEST_MODES = ("create", "update", "conditional")
+
+
+def _study_identifier(study) -> str:
+    for idf in _get(study, "identifier") or []:
+        if _get(idf, "system") == "urn:dicom:uid":
+            return "urn:dicom:uid|" + _get(idf, "value")
+    raise ValueError("ImagingStudy has no urn:dicom:uid identifier")
+
+
+def entry_request(study, request: str = "create") -> dict:
+    # the Bundle.entry.request of a study in a transaction or batch Bundle
+    if request == "create":
+        return {"method": "POST", "url": "ImagingStudy"}
+    if request == "update":
+        return {"method": "PUT", "url": "ImagingStudy/" + _get(study, "id")}
+    if request == "conditional":
+        return {"method": "POST", "url": "ImagingStudy",
+                "ifNoneExist": "identifier=" + quote(_study_identifier(study), safe="")}
+    raise ValueError("Unknown request mode '%s', expected one of %s" % (request, sorted(REQUEST_MODES)))
+
+
+def _full_url(study_id) -> str:
+    # urn:uuid: for UUID ids, the sha256 ids are not UUIDs
+    try:
+        return "urn:uuid:" + str(uuid.UUID(study_id))
+    except ValueError:
+        return None
+
+
+def entry_chunks(study, request: dict):
+    # one Bundle entry as JSON pieces, see study_chunks
+    full_url = _full_url(_get(study, "id"))
+    if full_url is None:
+        yield '{"resource":'
+    else:
+        yield '{"fullUrl":%s,"resource":' % json.dumps(full_url)
+    yield from study_chunks(study)
+    yield ',"request":%s}' % json.dumps(request, separators=(",", ":"))
+
+
+def bundle_start(bundle_type: str) -> str:
+    return '{"resourceType":"Bundle","type":%s,"entry":[' % json.dumps(bundle_type)
+
+
+def _studies(results):
+    # accepts studies or the (study, StudyInstanceUID) tuples returned by
+    # process_dicom_2_fhir and iter_studies
+    for result in results:
+        if isinstance(result, tuple):
+            result = result[0]
+        if result is not None:
+            yield result
+
+
+def _open(path, compress, buffer_size):
+    if compress:
+        return io.BufferedWriter(gzip.open(path, "wb"), buffer_size)
+    return open(path, "wb", buffering=buffer_size)
+
+
+class NDJSONWriter:
+    # FHIR bulk data NDJSON, one ImagingStudy per line; gzip compressed
+    # when compress=True or the path ends with .gz
+
+    def __init__(self, path, compress: bool = None, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        if compress is None:
+            compress = path.endswith(".gz")
+        self.path = path
+        self.count = 0
+        self._fh = _open(path, compress, buffer_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, study):
+        for chunk in study_chunks(study):
+            self._fh.write(chunk.encode("utf-8"))
+        self._fh.write(b"\n")
+        self.count += 1
+
+    def write_all(self, results):
+        for study in _studies(results):
+            self.write(study)
+
+    def close(self):
+        self._fh.close()
+
+
+class BundleWriter:
+    # ImagingStudy resources as Bundles of at most bundle_size entries, one
+    # file per Bundle in out_dir. Entries are streamed to the open Bundle
+    # file, so only the current study is held in memory.
+
+    def __init__(self, out_dir, bundle_size: int = 100, bundle_type: str = "transaction",
+                 compress: bool = False, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 request: str = "create"):
+        if bundle_size < 1:
+            raise ValueError("bundle_size must be at least 1")
+        if request not in REQUEST_MODES:
+            raise ValueError("Unknown request mode '%s'" % request)
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.bundle_size = bundle_size
+        self.bundle_type = bundle_type
+        self.compress = compress
+        self.buffer_size = buffer_size
+        self.request = request
+        self.count = 0
+        self.paths = []
+        self._fh = None
+        self._entries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _start_bundle(self):
+        name = "bundle-%06d.json" % (len(self.paths) + 1)
+        if self.compress:
+            name += ".gz"
+        path = os.path.join(self.out_dir, name)
+        self._fh = _open(path, self.compress, self.buffer_size)
+        self._fh.write(bundle_start(self.bundle_type).encode("utf-8"))
+        self.paths.append(path)
+        self._entries = 0
+
+    def _end_bundle(self):
+        self._fh.write(b"]}")
+        self._fh.close()
+        self._fh = None
+
+    def entry_request(self, study) -> dict:
+        return entry_request(study, self.request)
+
+    def write(self, study):
+        if self._fh is None:
+            self._start_bundle()
+        if self._entries:
+            self._fh.write(b",")
+        for chunk in entry_chunks(study, self.entry_request(study)):
+            self._fh.write(chunk.encode("utf-8"))
+        self._entries += 1
+        self.count += 1
+        if self._entries >= self.bundle_size:
+            self._end_bundle()
+
+    def write_all(self, results):
+        for study in _studies(results):
+            self.write(study)
+
+    def close(self):
+        if self._fh is not None:
+            self._end_bundle()
+
+
+def write_ndjson(results, path, **kwargs) -> int:
+    with NDJSONWriter(path, **kwargs) as writer:
+        writer.write_all(results)
+    return writer.count
+
+
+def write_bundles(results, out_dir, **kwargs) -> list:
+    with BundleWriter(out_dir, **kwargs) as writer:
+        writer.write_all(results)
+    return writer.paths
@@ -24,13 +24,21 @@ requirements = load_requirements()
 setup(
     description="Convert dicoms to fhir ImagingStudy model",
     install_requires=requirements,
+    extras_require={
+        # only needed to regenerate the bundled body site mapping
+        "mapping": ["pandas", "lxml"],
+    },
     license="BSD license",
     include_package_data=True,
+    entry_points={
+        "console_scripts": ["dicom2fhir=dicom2fhir.cli:main"],
+    },
     keywords="fhir, resources, python, hl7, health IT, healthcare",
     name="dicom2fhir",
     #namespace_packages=["dicom2fhir"],
     #package_dir={"": ""},
-    packages=find_packages('.', exclude=["*tests*"]),
+    packages=find_packages('.', exclude=["*tests*", "benchmarks*"]),
+    package_data={"dicom2fhir": ["resources/*.csv"]},
     #test_suite="tests",
     tests_require=test_requirements + requirements,
     url="https://github.ibm.com/ebaron/dicom-fhir-converter",